@@ -2,7 +2,8 @@ from django.contrib import admin
 from .models import (
     Tweet, UserProfile, Comment, Follow, FollowRequest, Hashtag, TweetHashtag,
     TrendingHashtag, Conversation, DirectMessage, Notification, SearchQuery,
-    PopularSearch, Mention, Block, Mute
+    PopularSearch, Mention, Block, Mute, TimelineEntry,
+    ConversationReadState, HashtagActivityBucket, NotificationJob, ChunkedUpload, ImageDerivativeJob
 )
 
 @admin.register(Tweet)
@@ -36,7 +37,6 @@ class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'location', 'birth_date', 'is_private', 'get_followers_count')
     list_filter = ('birth_date', 'is_private')
     search_fields = ('user__username', 'user__email', 'bio', 'location')
-    filter_horizontal = ('followers',)
     
     def get_followers_count(self, obj):
         return obj.get_followers_count()
@@ -52,6 +52,14 @@ class FollowAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at',)
 
 
+@admin.register(TimelineEntry)
+class TimelineEntryAdmin(admin.ModelAdmin):
+    list_display = ('user', 'tweet', 'author', 'created_at')
+    list_filter = ('created_at',)
+    search_fields = ('user__username', 'author__username')
+    raw_id_fields = ('user', 'tweet', 'author')
+
+
 @admin.register(FollowRequest)
 class FollowRequestAdmin(admin.ModelAdmin):
     list_display = ('from_user', 'to_user', 'status', 'created_at')
@@ -100,6 +108,14 @@ class TrendingHashtagAdmin(admin.ModelAdmin):
     ordering = ('-trend_score', '-tweets_last_24h')
 
 
+@admin.register(HashtagActivityBucket)
+class HashtagActivityBucketAdmin(admin.ModelAdmin):
+    list_display = ('hashtag', 'bucket_start', 'count')
+    list_filter = ('bucket_start',)
+    search_fields = ('hashtag__name',)
+    ordering = ('-bucket_start',)
+
+
 # Direct Message System Admin
 @admin.register(Conversation)
 class ConversationAdmin(admin.ModelAdmin):
@@ -120,7 +136,20 @@ class DirectMessageAdmin(admin.ModelAdmin):
     list_filter = ('message_type', 'sent_at', 'is_edited')
     search_fields = ('sender__username', 'content')
     readonly_fields = ('sent_at', 'edited_at')
-    filter_horizontal = ('read_by',)
+
+
+@admin.register(ConversationReadState)
+class ConversationReadStateAdmin(admin.ModelAdmin):
+    list_display = ('user', 'conversation', 'last_read_message_id', 'last_read_at')
+    search_fields = ('user__username',)
+    raw_id_fields = ('conversation', 'user')
+
+
+@admin.register(ChunkedUpload)
+class ChunkedUploadAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'user', 'field', 'offset', 'size', 'created_at')
+    list_filter = ('field',)
+    raw_id_fields = ('user', 'conversation')
 
 
 # Notification System Admin
@@ -134,16 +163,33 @@ class NotificationAdmin(admin.ModelAdmin):
     actions = ['mark_as_read', 'mark_as_unread']
     
     def mark_as_read(self, request, queryset):
+        from .utils import invalidate_unread_counts
         queryset.update(is_read=True)
+        invalidate_unread_counts(*set(queryset.values_list('recipient_id', flat=True)))
         self.message_user(request, f"Marked {queryset.count()} notifications as read.")
     mark_as_read.short_description = "Mark selected notifications as read"
     
     def mark_as_unread(self, request, queryset):
+        from .utils import invalidate_unread_counts
         queryset.update(is_read=False)
+        invalidate_unread_counts(*set(queryset.values_list('recipient_id', flat=True)))
         self.message_user(request, f"Marked {queryset.count()} notifications as unread.")
     mark_as_unread.short_description = "Mark selected notifications as unread"
 
 
+@admin.register(NotificationJob)
+class NotificationJobAdmin(admin.ModelAdmin):
+    list_display = ('recipient', 'sender', 'notification_type', 'created_at')
+    list_filter = ('notification_type',)
+    raw_id_fields = ('recipient', 'sender', 'tweet', 'comment', 'direct_message')
+
+
+@admin.register(ImageDerivativeJob)
+class ImageDerivativeJobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'kind', 'created_at')
+    list_filter = ('kind',)
+
+
 # Search System Admin
 @admin.register(SearchQuery)
 class SearchQueryAdmin(admin.ModelAdmin):
@@ -0,0 +1,87 @@
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Part of every key; bump it when the shape of a cached value changes so
+# entries written by older code are never read back
+CACHE_KEY_VERSION = getattr(settings, 'CACHE_KEY_VERSION', 1)
+
+_MISSING = object()
+
+# Hit/miss counts for this process, keyed by (namespace, 'hits' | 'misses')
+_stats = Counter()
+
+
+class CacheNamespace:
+    """
+    A family of cached values sharing a key prefix and timeout. Values are
+    dropped by the signal handlers that change them, the timeout is a backstop.
+    """
+
+    def __init__(self, name, timeout):
+        self.name = name
+        self.timeout = timeout
+        NAMESPACES[name] = self
+
+    def key(self, *parts):
+        return ':'.join([self.name, f'v{CACHE_KEY_VERSION}', *map(str, parts)])
+
+    def get_or_compute(self, compute, *parts):
+        """Return the cached value for parts, calling compute() on a miss"""
+        key = self.key(*parts)
+        value = cache.get(key, _MISSING)
+        if value is _MISSING:
+            _stats[self.name, 'misses'] += 1
+            value = compute()
+            cache.set(key, value, self.timeout)
+        else:
+            _stats[self.name, 'hits'] += 1
+        return value
+
+    async def aget(self, *parts):
+        """
+        The cached value for parts, or None, for async callers that compute
+        (and may skip caching) on a miss themselves
+        """
+        value = await cache.aget(self.key(*parts), _MISSING)
+        if value is _MISSING:
+            _stats[self.name, 'misses'] += 1
+            return None
+        _stats[self.name, 'hits'] += 1
+        return value
+
+    def invalidate(self, *parts):
+        cache.delete(self.key(*parts))
+
+    def invalidate_many(self, ids):
+        """Drop one single-part entry per id, e.g. per user"""
+        cache.delete_many([self.key(pk) for pk in ids if pk])
+
+
+NAMESPACES = {}
+
+profile_stats = CacheNamespace('profile_stats', 300)
+tweet_fragments = CacheNamespace('tweet_fragment', 60 * 60)
+trending = CacheNamespace('trending', 10 * 60)
+popular_searches = CacheNamespace('popular_searches', 10 * 60)
+unread_counts = CacheNamespace('unread_counts', 60)
+
+
+def get_cache_stats():
+    """
+    Hit/miss totals per namespace since this process started (or was reset)
+    """
+    stats = {}
+    for name in NAMESPACES:
+        hits, misses = _stats[name, 'hits'], _stats[name, 'misses']
+        stats[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+        }
+    return stats
+
+
+def reset_cache_stats():
+    _stats.clear()
@@ -0,0 +1,47 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+
+def adjust_counter(model, pks, field, delta):
+    """
+    Atomically add delta to a stored counter column on the given rows
+    """
+    if not pks or not delta:
+        return 0
+    return model.objects.filter(pk__in=pks).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+
+
+def _count_subquery(queryset, fk_name):
+    """Correlated COUNT(*) of queryset rows pointing at the outer row"""
+    counts = queryset.filter(**{fk_name: OuterRef('pk')}).order_by().values(fk_name).annotate(
+        total=Count('*')
+    ).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def recount_tweet_counters(queryset=None):
+    """
+    Recompute likes/replies/comments counters for tweets in one UPDATE
+    """
+    from .models import Tweet, Comment
+
+    queryset = Tweet.objects.all() if queryset is None else queryset
+    return queryset.update(
+        likes_count=_count_subquery(Tweet.likes.through.objects.all(), 'tweet'),
+        replies_count=_count_subquery(Tweet.objects.all(), 'parent_tweet'),
+        comments_count=_count_subquery(Comment.objects.all(), 'tweet'),
+    )
+
+
+def recount_comment_counters(queryset=None):
+    """
+    Recompute likes counters for comments in one UPDATE
+    """
+    from .models import Comment
+
+    queryset = Comment.objects.all() if queryset is None else queryset
+    return queryset.update(
+        likes_count=_count_subquery(Comment.likes.through.objects.all(), 'comment'),
+    )
@@ -0,0 +1,141 @@
+import functools
+import re
+from collections import Counter, defaultdict
+from urllib.parse import quote
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.urls import reverse
+from django.utils.html import escape
+from django.utils.safestring import SafeData, mark_safe
+
+from .counters import adjust_counter
+from .search import get_search_backend
+
+# #hashtags and @mentions, found in one pass
+ENTITY_RE = re.compile(r'[#@]\w+')
+
+# URL name and link class per entity sigil
+ENTITY_LINKS = {
+    '#': ('hashtag_detail', 'text-primary'),
+    '@': ('user_profile', 'text-info'),
+}
+
+
+def tokenize(text):
+    """[start, end] offsets of each hashtag and mention in text, sigil included"""
+    return [[match.start(), match.end()] for match in ENTITY_RE.finditer(text)]
+
+
+@functools.cache
+def _link_parts():
+    """
+    HTML around an entity's URL-quoted name, per sigil. The URLs are reversed
+    once per process instead of once per entity rendered.
+    """
+    parts = {}
+    for sigil, (url_name, css_class) in ENTITY_LINKS.items():
+        prefix, suffix = reverse(url_name, args=['__name__']).split('__name__')
+        parts[sigil] = (f'<a href="{prefix}', f'{suffix}" class="{css_class} text-decoration-none">{sigil}')
+    return parts
+
+
+def render_entities(text, entities=None, sigils='#@'):
+    """
+    text as safe HTML with its hashtags and mentions (those whose sigil is in
+    sigils) linked. entities are tokenize(text)'s offsets when already known,
+    such as Tweet.entities. Text already marked safe isn't escaped again.
+    """
+    if entities is None:
+        entities = tokenize(text)
+    escape_text = str if isinstance(text, SafeData) else escape
+    links = _link_parts()
+
+    html = []
+    position = 0
+    for start, end in entities:
+        sigil = text[start]
+        if sigil not in sigils:
+            continue
+        # Names are \w+, so nothing in them needs HTML escaping
+        name = text[start + 1:end]
+        before_url, after_url = links[sigil]
+        html += [escape_text(text[position:start]), before_url, quote(name), after_url, name, '</a>']
+        position = end
+    html.append(escape_text(text[position:]))
+    return mark_safe(''.join(html))
+
+
+def _increment_grouped(model, counts, field):
+    """Apply per-row increments with one UPDATE per distinct increment size"""
+    by_delta = defaultdict(list)
+    for pk, delta in counts.items():
+        by_delta[delta].append(pk)
+    for delta, pks in by_delta.items():
+        adjust_counter(model, pks, field, delta)
+
+
+def link_tweet_entities(tweets):
+    """
+    Create hashtag and mention links for newly saved tweets in bulk.
+
+    Works for a single tweet from Tweet.save as well as for a batch of tweets
+    inserted with bulk_create; query count does not grow with the number of
+    tags or mentions.
+    """
+    from .models import Hashtag, TweetHashtag, Mention
+    from .trending import bucket_for, record_hashtag_counts
+
+    tweet_tags = {}
+    tweet_mentions = {}
+    for tweet in tweets:
+        tweet_tags[tweet] = {name.lower() for name in tweet.extract_hashtags()}
+        tweet_mentions[tweet] = set(tweet.extract_mentions())
+
+    all_tags = set().union(*tweet_tags.values())
+    all_usernames = set().union(*tweet_mentions.values())
+    if not all_tags and not all_usernames:
+        return
+
+    with transaction.atomic():
+        if all_tags:
+            Hashtag.objects.bulk_create(
+                [Hashtag(name=name) for name in all_tags],
+                ignore_conflicts=True
+            )
+            hashtag_ids = dict(Hashtag.objects.filter(name__in=all_tags).values_list('name', 'id'))
+
+            # bulk_create skips post_save, so index the (possibly new) tags directly
+            get_search_backend().index_many(
+                [Hashtag(id=hashtag_id, name=name) for name, hashtag_id in hashtag_ids.items()]
+            )
+
+            links = [
+                TweetHashtag(tweet=tweet, hashtag_id=hashtag_ids[name])
+                for tweet, names in tweet_tags.items()
+                for name in names
+            ]
+            TweetHashtag.objects.bulk_create(links, ignore_conflicts=True)
+
+            _increment_grouped(
+                Hashtag,
+                Counter(link.hashtag_id for link in links),
+                'tweet_count'
+            )
+
+            # Feed the trending counters, bucketed by the hour each tweet was posted
+            record_hashtag_counts(Counter(
+                (link.hashtag_id, bucket_for(link.tweet.created_at)) for link in links
+            ))
+
+        if all_usernames:
+            user_ids = dict(User.objects.filter(username__in=all_usernames).values_list('username', 'id'))
+            Mention.objects.bulk_create(
+                [
+                    Mention(tweet=tweet, mentioned_user_id=user_ids[username])
+                    for tweet, usernames in tweet_mentions.items()
+                    for username in usernames
+                    if username in user_ids
+                ],
+                ignore_conflicts=True
+            )
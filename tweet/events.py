@@ -0,0 +1,173 @@
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Seconds between keep-alive comments on an idle stream, so proxies don't
+# close it and dropped clients are noticed
+HEARTBEAT_INTERVAL = 15
+
+# Seconds before the Redis reader reconnects after losing its subscription
+RECONNECT_DELAY = 5
+
+
+def user_channel(user_id):
+    return f'twick:user:{user_id}'
+
+
+class LocalBroker:
+    """
+    In-process pub/sub for development and tests. Only streams served by this
+    process hear its events; set REDIS_URL to reach every web process and the
+    notification workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # channel -> {(event loop, queue)} of the streams listening on it
+        self._subscribers = {}
+
+    def publish(self, channel, message):
+        self._deliver(channel, message)
+
+    def _deliver(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, message)
+            except RuntimeError:
+                # The stream's loop has closed; its finally block removes it
+                pass
+
+    async def _subscribed(self, channel, subscriber):
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscriber)
+
+    async def _unsubscribed(self, channel, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(channel, set())
+            subscribers.discard(subscriber)
+            if not subscribers:
+                self._subscribers.pop(channel, None)
+
+    async def listen(self, channel, heartbeat=HEARTBEAT_INTERVAL):
+        """
+        Yield messages published on channel, or None after heartbeat idle seconds
+        """
+        queue = asyncio.Queue()
+        subscriber = (asyncio.get_running_loop(), queue)
+        await self._subscribed(channel, subscriber)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            await self._unsubscribed(channel, subscriber)
+
+
+class RedisBroker(LocalBroker):
+    """
+    Redis pub/sub. Each process holds one pattern subscription for all user
+    channels and fans messages out to its own streams, so open streams cost a
+    queue each rather than a Redis connection each.
+    """
+
+    def __init__(self, url):
+        super().__init__()
+        self.url = url
+        self._client = None
+        self._readers = {}
+
+    def publish(self, channel, message):
+        import redis
+
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url)
+        self._client.publish(channel, message)
+
+    async def _subscribed(self, channel, subscriber):
+        await super()._subscribed(channel, subscriber)
+        loop = asyncio.get_running_loop()
+        reader = self._readers.get(loop)
+        if reader is None or reader.done():
+            self._readers[loop] = loop.create_task(self._read())
+
+    async def _read(self):
+        """Fan out messages until cancelled, resubscribing whenever Redis fails"""
+        reconnected = False
+        while True:
+            try:
+                await self._read_subscription(resync=reconnected)
+            except Exception:
+                logger.exception("Lost the Redis event subscription; retrying in %ss", RECONNECT_DELAY)
+            reconnected = True
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _read_subscription(self, resync=False):
+        import redis.asyncio as aioredis
+
+        client = aioredis.from_url(self.url)
+        pubsub = client.pubsub()
+        try:
+            await pubsub.psubscribe(user_channel('*'))
+            if resync:
+                # Events published while disconnected are gone; have every
+                # stream refetch its badge counts
+                with self._lock:
+                    channels = list(self._subscribers)
+                for channel in channels:
+                    self._deliver(channel, json.dumps({'event': 'counts', 'data': None}))
+            async for message in pubsub.listen():
+                if message['type'] == 'pmessage':
+                    self._deliver(message['channel'].decode(), message['data'].decode())
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        redis_url = getattr(settings, 'REDIS_URL', None)
+        _broker = RedisBroker(redis_url) if redis_url else LocalBroker()
+    return _broker
+
+
+def publish(user_ids, event, data=None):
+    """
+    Push an event to the users' open streams once the current transaction
+    commits, so listeners never read rows that aren't visible yet
+    """
+    message = json.dumps({'event': event, 'data': data})
+    channels = [user_channel(pk) for pk in set(user_ids) if pk]
+
+    def send():
+        broker = get_broker()
+        for channel in channels:
+            broker.publish(channel, message)
+
+    if channels:
+        transaction.on_commit(send)
+
+
+async def listen(user_id, heartbeat=HEARTBEAT_INTERVAL):
+    """
+    Yield (event, data) pairs pushed to the user, or None when the stream has
+    been idle for heartbeat seconds
+    """
+    async for message in get_broker().listen(user_channel(user_id), heartbeat):
+        if message is None:
+            yield None
+        else:
+            message = json.loads(message)
+            yield message['event'], message['data']
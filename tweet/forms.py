@@ -307,45 +307,26 @@ class DirectMessageForm(forms.ModelForm):
             raise forms.ValidationError("Message must be 1000 characters or less.")
         return content
     
+    def _clean_attachment(self, field):
+        from .uploads import attachment_error
+        attachment = self.cleaned_data.get(field)
+        if attachment and hasattr(attachment, 'content_type'):
+            error = attachment_error(field, attachment.content_type or '', attachment.size)
+            if error:
+                raise forms.ValidationError(error)
+        return attachment
+    
     def clean_image(self):
-        image = self.cleaned_data.get('image')
-        if image:
-            if hasattr(image, 'content_type'):
-                if image.size > 10 * 1024 * 1024:  # 10MB
-                    raise forms.ValidationError("Image file too large. Please keep it under 10MB.")
-                if not image.content_type.startswith('image/'):
-                    raise forms.ValidationError("Please upload a valid image file.")
-        return image
+        return self._clean_attachment('image')
     
     def clean_video(self):
-        video = self.cleaned_data.get('video')
-        if video:
-            if hasattr(video, 'content_type'):
-                if video.size > 100 * 1024 * 1024:  # 100MB
-                    raise forms.ValidationError("Video file too large. Please keep it under 100MB.")
-                allowed_types = ['video/mp4', 'video/webm', 'video/avi', 'video/mov']
-                if video.content_type not in allowed_types:
-                    raise forms.ValidationError("Please upload a valid video file (MP4, WebM, AVI, MOV).")
-        return video
+        return self._clean_attachment('video')
     
     def clean_audio(self):
-        audio = self.cleaned_data.get('audio')
-        if audio:
-            if hasattr(audio, 'content_type'):
-                if audio.size > 50 * 1024 * 1024:  # 50MB
-                    raise forms.ValidationError("Audio file too large. Please keep it under 50MB.")
-                allowed_types = ['audio/mp3', 'audio/wav', 'audio/ogg', 'audio/m4a']
-                if audio.content_type not in allowed_types:
-                    raise forms.ValidationError("Please upload a valid audio file (MP3, WAV, OGG, M4A).")
-        return audio
+        return self._clean_attachment('audio')
     
     def clean_file(self):
-        file_upload = self.cleaned_data.get('file')
-        if file_upload:
-            if hasattr(file_upload, 'size'):
-                if file_upload.size > 25 * 1024 * 1024:  # 25MB
-                    raise forms.ValidationError("File too large. Please keep it under 25MB.")
-        return file_upload
+        return self._clean_attachment('file')
 
 
 class ConversationForm(forms.ModelForm):
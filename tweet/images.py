@@ -0,0 +1,177 @@
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.urls import reverse
+
+# Derivative widths per kind of upload. Avatars are square crops sized for
+# 1x/2x screens at the 30-140px they are shown at; photos and covers keep
+# their aspect ratio and are never upscaled.
+VARIANTS = {
+    'avatar': {'upload_to': 'avatars/', 'widths': (48, 96, 192, 288), 'square': True},
+    'photo': {'upload_to': 'photos/', 'widths': (320, 640, 1280), 'square': False},
+    'cover': {'upload_to': 'covers/', 'widths': (640, 1280, 1920), 'square': False},
+}
+
+# Browser layout width of photos and covers, for the srcset `sizes` hint
+SIZES = {
+    'photo': '(max-width: 640px) 100vw, 600px',
+    'cover': '100vw',
+}
+
+DERIVATIVES_DIR = 'derivatives/'
+WEBP_QUALITY = 80
+
+# Queued uploads one run_workers pass renders
+BATCH_SIZE = 20
+
+
+def variant_name(name, width):
+    """Storage name of the width-px WebP derivative of the upload stored as name"""
+    return f'{DERIVATIVES_DIR}{os.path.splitext(name)[0]}_{width}.webp'
+
+
+def is_variant_source(kind, name):
+    """Whether name is an upload that may have kind derivatives made from it"""
+    variants = VARIANTS.get(kind)
+    return bool(variants) and name.startswith(variants['upload_to']) and '..' not in name.split('/')
+
+
+def render_variant(kind, name, width):
+    """
+    Write the WebP derivative of an upload if it doesn't exist yet and return
+    its storage name. Raises OSError (incl. PIL.UnidentifiedImageError) for
+    missing or unreadable originals.
+    """
+    from PIL import Image, ImageOps
+
+    target = variant_name(name, width)
+    if default_storage.exists(target):
+        return target
+
+    with default_storage.open(name) as original:
+        image = Image.open(original)
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        if VARIANTS[kind]['square']:
+            image = ImageOps.fit(image, (width, width), Image.LANCZOS)
+        elif image.width > width:
+            image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+
+        output = BytesIO()
+        image.save(output, 'WEBP', quality=WEBP_QUALITY, method=4)
+
+    # A concurrent request may have written it meanwhile; keep theirs
+    if not default_storage.exists(target):
+        default_storage.save(target, ContentFile(output.getvalue()))
+    return target
+
+
+def render_variants(kind, name):
+    """Write every missing derivative of an upload; returns how many were written"""
+    written = 0
+    for width in VARIANTS[kind]['widths']:
+        if not default_storage.exists(variant_name(name, width)):
+            render_variant(kind, name, width)
+            written += 1
+    return written
+
+
+def queue_field_variants(instance, fields, update_fields=None):
+    """
+    Queue derivatives of a saved instance's images for run_workers; fields
+    maps image field names to kinds. Fields a save(update_fields=...) left
+    alone are skipped.
+    """
+    from .models import ImageDerivativeJob
+
+    jobs = []
+    for field, kind in fields.items():
+        if update_fields is not None and field not in update_fields:
+            continue
+        fieldfile = getattr(instance, field)
+        if fieldfile and is_variant_source(kind, fieldfile.name):
+            jobs.append(ImageDerivativeJob(kind=kind, name=fieldfile.name))
+    ImageDerivativeJob.objects.bulk_create(jobs, ignore_conflicts=True)
+
+
+def render_variant_batch(batch_size=BATCH_SIZE):
+    """
+    Write the derivatives of up to batch_size queued uploads. Jobs are claimed
+    and deleted before the resize so no lock is held during it; an upload
+    that fails (unreadable, or the worker dies) is left to the image_variant
+    view. Returns the number of jobs consumed.
+    """
+    from PIL import Image
+
+    from .models import ImageDerivativeJob
+
+    with transaction.atomic():
+        # skip_locked lets several workers drain the queue side by side
+        jobs = list(
+            ImageDerivativeJob.objects.select_for_update(skip_locked=True).order_by('id')[:batch_size]
+        )
+        ImageDerivativeJob.objects.filter(id__in=[job.id for job in jobs]).delete()
+
+    for job in jobs:
+        try:
+            render_variants(job.kind, job.name)
+        except (OSError, Image.DecompressionBombError):
+            # The upload stays, just without derivatives
+            pass
+    return len(jobs)
+
+
+def render_pending_variants(batch_size=BATCH_SIZE):
+    """
+    Render batches until the queue is empty; returns the number of jobs consumed
+    """
+    total = 0
+    while True:
+        consumed = render_variant_batch(batch_size)
+        if not consumed:
+            return total
+        total += consumed
+
+
+def variant_urls(fieldfile, kind):
+    """
+    URL of each derivative width of an upload, by width. The widths are
+    written together, smallest first, so one lookup of the largest tells
+    whether all are on disk. Until they are (still queued, failed, or an
+    older upload) they point at the image_variant view, which writes them or
+    falls back to the original.
+    """
+    widths = VARIANTS[kind]['widths']
+    name = fieldfile.name
+    if not is_variant_source(kind, name):
+        return {width: fieldfile.url for width in widths}
+    if default_storage.exists(variant_name(name, widths[-1])):
+        return {width: default_storage.url(variant_name(name, width)) for width in widths}
+    return {width: reverse('image_variant', args=[kind, width, name]) for width in widths}
+
+
+def image_attrs(fieldfile, kind, size=None):
+    """
+    src/srcset (and sizes) attributes for an <img> of an upload. Avatars
+    take their displayed size in CSS px and get 1x/2x candidates; photos and
+    covers list every width.
+    """
+    widths = VARIANTS[kind]['widths']
+    urls = variant_urls(fieldfile, kind)
+    if kind == 'avatar':
+        size = size or 40
+        one_x = next((w for w in widths if w >= size), widths[-1])
+        two_x = next((w for w in widths if w >= 2 * size), widths[-1])
+        return {'src': urls[one_x], 'srcset': f'{urls[one_x]} 1x, {urls[two_x]} 2x'}
+
+    attrs = {
+        'src': urls[widths[1] if len(widths) > 1 else widths[0]],
+        'srcset': ', '.join(f'{url} {width}w' for width, url in urls.items()),
+        'sizes': SIZES[kind],
+    }
+    if kind == 'photo':
+        attrs['loading'] = 'lazy'
+    return attrs
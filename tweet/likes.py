@@ -0,0 +1,72 @@
+from django.db import IntegrityError, transaction
+from django.db.models import BooleanField, Exists, OuterRef, Value
+
+from .counters import adjust_counter
+
+
+def toggle_like(obj, user):
+    """
+    Like a Tweet or Comment for user, or unlike it if they already do, and
+    return (liked, likes_count).
+
+    Works on the likes through table directly: an indexed DELETE of the
+    (obj, user) row, or an INSERT when there was none, with the unique
+    constraint settling concurrent double-clicks. likes_count moves by the
+    rows actually changed in the same transaction, so it is never recounted.
+    The m2m_changed handlers don't run, so their side effects are repeated here.
+    """
+    from .models import Tweet
+    from .profile_stats import invalidate_profile_stats
+    from .utils import create_notification
+
+    model = type(obj)
+    field = model.likes.field
+    through = model.likes.through
+    row = {f'{field.m2m_field_name()}_id': obj.pk, f'{field.m2m_reverse_field_name()}_id': user.pk}
+
+    with transaction.atomic():
+        deleted, _ = through.objects.filter(**row).delete()
+        if deleted:
+            liked, delta = False, -deleted
+        else:
+            liked, delta = True, 1
+            try:
+                with transaction.atomic():
+                    through.objects.create(**row)
+            except IntegrityError:
+                # A concurrent request liked it first; that one counted it
+                delta = 0
+
+        adjust_counter(model, [obj.pk], 'likes_count', delta)
+        obj.likes_count = model.objects.filter(pk=obj.pk).values_list('likes_count', flat=True).get()
+
+        if liked and delta:
+            noun = model._meta.model_name
+            create_notification(
+                recipient=obj.user_id,
+                sender=user,
+                notification_type='like',
+                message=f"{user.username} liked your {noun}",
+                **{noun: obj}
+            )
+
+    if delta and model is Tweet:
+        invalidate_profile_stats(obj.user_id)
+    return liked, obj.likes_count
+
+
+def with_viewer_liked(queryset, user):
+    """
+    Annotate a Tweet or Comment queryset with viewer_liked, whether user likes
+    each row, as an EXISTS on the likes through table's (obj, user) index.
+    Templates test obj.viewer_liked instead of loading every liker.
+    """
+    if user is None or not user.is_authenticated:
+        return queryset.annotate(viewer_liked=Value(False, output_field=BooleanField()))
+
+    field = queryset.model.likes.field
+    liked = queryset.model.likes.through.objects.filter(**{
+        field.m2m_field_name(): OuterRef('pk'),
+        field.m2m_reverse_field_name(): user,
+    })
+    return queryset.annotate(viewer_liked=Exists(liked))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from tweet.images import render_variants
+from tweet.models import Tweet, UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the WebP derivatives of every uploaded avatar, cover and tweet "
+        "photo that doesn't have them yet (uploaded before derivatives were "
+        "written on save, or restored from a backup)"
+    )
+
+    def handle(self, *args, **options):
+        sources = [
+            ('photo', Tweet.objects.exclude(image='').values_list('image', flat=True)),
+            ('avatar', UserProfile.objects.exclude(avatar='').values_list('avatar', flat=True)),
+            ('cover', UserProfile.objects.exclude(cover_photo='').values_list('cover_photo', flat=True)),
+        ]
+
+        written = failed = 0
+        for kind, names in sources:
+            for name in names.iterator():
+                try:
+                    written += render_variants(kind, name)
+                except OSError as exc:
+                    failed += 1
+                    self.stderr.write(f"Skipped {name}: {exc}")
+
+        style = self.style.SUCCESS if not failed else self.style.WARNING
+        self.stdout.write(style(f"Wrote {written} image derivatives ({failed} unreadable uploads skipped)."))
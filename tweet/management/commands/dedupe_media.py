@@ -0,0 +1,104 @@
+import os
+import time
+import uuid
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from tweet.storage import BLOB_DIR, INODE_DIR, ContentAddressedStorage
+from tweet.uploads import MB, file_sha256
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-hash every file under MEDIA_ROOT in one streaming pass, hard-link "
+        "duplicates to a single content-addressed blob, drop blobs nothing "
+        "links to any more and rebuild the blob inode index"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true', help="Report what would be collapsed without changing anything"
+        )
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError("The default storage is not ContentAddressedStorage")
+        dry_run = options['dry_run']
+        root = default_storage.location
+        blob_root = os.path.join(root, BLOB_DIR)
+        # Blobs adopted or linked in this run, for --dry-run where none is created
+        seen = {}
+
+        files = duplicates = reclaimed = 0
+        for directory, subdirectories, filenames in os.walk(root):
+            if directory == root and BLOB_DIR in subdirectories:
+                subdirectories.remove(BLOB_DIR)
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                if os.path.islink(path):
+                    continue
+                files += 1
+                digest = file_sha256(path)
+                blob = default_storage.blob_path(digest)
+
+                if os.path.exists(blob) or digest in seen:
+                    if os.path.exists(blob) and os.path.samefile(blob, path):
+                        continue
+                    duplicates += 1
+                    stat = os.stat(path)
+                    if stat.st_nlink == 1:
+                        reclaimed += stat.st_size
+                    if not dry_run:
+                        # Swap the copy for a link in one step, so the name never goes missing
+                        replacement = f'{path}.{uuid.uuid4().hex}.tmp'
+                        os.link(blob, replacement)
+                        os.replace(replacement, path)
+                else:
+                    seen[digest] = path
+                    if not dry_run:
+                        default_storage._makedirs(os.path.dirname(blob))
+                        os.link(path, blob)
+
+        orphans = 0
+        spool_dir = os.path.join(blob_root, 'tmp')
+        inode_root = os.path.join(blob_root, INODE_DIR)
+        indexed = set()
+        for directory, subdirectories, filenames in os.walk(blob_root):
+            if directory == blob_root and INODE_DIR in subdirectories:
+                subdirectories.remove(INODE_DIR)
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                stat = os.stat(path)
+                if directory == spool_dir and stat.st_mtime > time.time() - 3600:
+                    # Probably still being written
+                    continue
+                # Only the blob itself is left, or a spool file a crash left behind
+                if stat.st_nlink == 1:
+                    orphans += 1
+                    if not dry_run:
+                        os.remove(path)
+                elif directory != spool_dir:
+                    indexed.add(stat.st_ino)
+                    # Blobs adopted above, and any whose inode changed in a restore
+                    link = default_storage.inode_path(stat.st_ino)
+                    if not dry_run and (not os.path.islink(link) or os.readlink(link) != filename):
+                        default_storage.index_blob(path, filename)
+
+        # Index entries of removed blobs, or left by a crash mid-update
+        if not dry_run:
+            for directory, _, filenames in os.walk(inode_root):
+                for filename in filenames:
+                    path = os.path.join(directory, filename)
+                    if filename.isdigit():
+                        stale = int(filename) not in indexed
+                    else:
+                        stale = os.lstat(path).st_mtime < time.time() - 3600
+                    if stale:
+                        os.remove(path)
+
+        verb = "Would collapse" if dry_run else "Collapsed"
+        self.stdout.write(self.style.SUCCESS(
+            f"Hashed {files} files. {verb} {duplicates} duplicates, reclaiming {reclaimed / MB:.1f}MB, "
+            f"and {'would remove' if dry_run else 'removed'} {orphans} unreferenced blobs."
+        ))
@@ -0,0 +1,119 @@
+import http.client
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpRequest
+from django.middleware.csrf import get_token
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire concurrent requests at a running server and report throughput and "
+        "latency. Run it against `gunicorn twick.wsgi` and then "
+        "`gunicorn -k uvicorn.workers.UvicornWorker twick.asgi` on the same "
+        "machine and database to compare the two."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help="Server to load, e.g. http://127.0.0.1:8000")
+        parser.add_argument(
+            '--path',
+            action='append',
+            dest='paths',
+            help="Path to request (repeat to rotate through several); "
+                 "defaults to /api/notifications/count/"
+        )
+        parser.add_argument('--method', default='GET', help="HTTP method for every request")
+        parser.add_argument('--user', help="Send requests signed in as this user")
+        parser.add_argument('--concurrency', type=int, default=50, help="Requests in flight at once")
+        parser.add_argument('--requests', type=int, default=2000, help="Total requests to send")
+        parser.add_argument('--timeout', type=float, default=30.0, help="Per-request timeout in seconds")
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme not in ('http', 'https') or not url.hostname:
+            raise CommandError(f"Not an http(s) URL: {options['url']}")
+        if options['requests'] < 2:
+            raise CommandError("--requests must be at least 2")
+
+        paths = options['paths'] or ['/api/notifications/count/']
+        headers = self.auth_headers(options['user'], options['url']) if options['user'] else {}
+        connection_class = (
+            http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        )
+        local = threading.local()
+
+        def send(index):
+            # One keep-alive connection per client thread
+            if getattr(local, 'connection', None) is None:
+                local.connection = connection_class(url.hostname, url.port, timeout=options['timeout'])
+            started = time.perf_counter()
+            try:
+                local.connection.request(options['method'], paths[index % len(paths)], headers=headers)
+                response = local.connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                local.connection.close()
+                local.connection = None
+                status = None
+            return status, time.perf_counter() - started
+
+        self.stdout.write(
+            f"{options['requests']} x {options['method']} {', '.join(paths)} "
+            f"with {options['concurrency']} in flight..."
+        )
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(send, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for _, latency in results)
+        failed = sum(1 for status, _ in results if status is None or status >= 400)
+        percentiles = statistics.quantiles(latencies, n=100)
+
+        self.stdout.write(f"Elapsed:     {elapsed:.2f}s")
+        self.stdout.write(f"Failed:      {failed}")
+        self.stdout.write(
+            f"Latency:     p50 {percentiles[49] * 1000:.1f}ms  "
+            f"p95 {percentiles[94] * 1000:.1f}ms  p99 {percentiles[98] * 1000:.1f}ms"
+        )
+        style = self.style.SUCCESS if not failed else self.style.WARNING
+        self.stdout.write(style(f"Throughput:  {len(results) / elapsed:.1f} requests/s"))
+
+    def auth_headers(self, username, origin):
+        """
+        Cookies for a fresh session and CSRF token, written straight to this
+        project's session store, which the server under test must share
+        """
+        try:
+            user = User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f"No such user: {username}")
+
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+
+        request = HttpRequest()
+        csrf_token = get_token(request)
+        return {
+            'Cookie': (
+                f"{settings.SESSION_COOKIE_NAME}={session.session_key}; "
+                f"{settings.CSRF_COOKIE_NAME}={request.META['CSRF_COOKIE']}"
+            ),
+            'X-CSRFToken': csrf_token,
+            # CSRF checks the Referer/Origin of unsafe requests over HTTPS
+            'Referer': origin,
+            'Origin': origin,
+        }
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from tweet.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for tweets, users and hashtags"
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt search index with {type(backend).__name__}."))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+
+from tweet.timeline import rebuild_timeline, BACKFILL_SIZE
+
+
+class Command(BaseCommand):
+    help = "Rebuild materialized home timelines from the follow graph"
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help="Only rebuild these users' timelines")
+        parser.add_argument(
+            '--per-author',
+            type=int,
+            default=BACKFILL_SIZE,
+            help="Latest tweets to copy from each followed account"
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+
+        rebuilt = 0
+        for user in users.iterator():
+            rebuild_timeline(user, limit=options['per_author'])
+            rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} timelines."))
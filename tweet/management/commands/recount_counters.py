@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from tweet.counters import recount_tweet_counters, recount_comment_counters
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized like/reply/comment counters on tweets and comments"
+
+    def handle(self, *args, **options):
+        tweets = recount_tweet_counters()
+        comments = recount_comment_counters()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Recounted counters for {tweets} tweets and {comments} comments."
+        ))
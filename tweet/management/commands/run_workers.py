@@ -0,0 +1,67 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tweet import images
+from tweet.images import render_pending_variants, render_variant_batch
+from tweet.notifications import BATCH_SIZE, deliver_notification_batch, deliver_pending_notifications
+from tweet.trending import REFRESH_SECONDS, prune_hashtag_activity, refresh_trending_hashtags
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver queued notifications and write queued image derivatives in batches, "
+        "and refresh trending hashtags periodically (run one or more alongside the web server)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help="Drain the queue and exit instead of polling"
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help="Jobs delivered per transaction"
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help="Seconds to sleep when the queue is empty"
+        )
+        parser.add_argument(
+            '--trending-interval',
+            type=float,
+            default=REFRESH_SECONDS,
+            help="Seconds between trending hashtag refreshes (0 to leave them to update_trending)"
+        )
+
+    def handle(self, *args, **options):
+        if options['once']:
+            delivered = deliver_pending_notifications(options['batch_size'])
+            rendered = render_pending_variants(images.BATCH_SIZE)
+            self.stdout.write(self.style.SUCCESS(
+                f"Delivered {delivered} queued notifications and rendered {rendered} queued images."
+            ))
+            return
+
+        self.stdout.write(self.style.SUCCESS("Notification worker started."))
+        trending_interval = options['trending_interval']
+        next_trending = time.monotonic()
+        try:
+            while True:
+                if trending_interval and time.monotonic() >= next_trending:
+                    # Refreshes from every worker are harmless, just redundant
+                    refresh_trending_hashtags()
+                    prune_hashtag_activity()
+                    next_trending = time.monotonic() + trending_interval
+                delivered = deliver_notification_batch(options['batch_size'])
+                # Few images per pass, so resizes don't hold up notifications
+                rendered = render_variant_batch(images.BATCH_SIZE)
+                if not delivered and not rendered:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write("Notification worker stopped.")
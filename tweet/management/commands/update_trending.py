@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from tweet.trending import prune_hashtag_activity, refresh_trending_hashtags
+
+
+class Command(BaseCommand):
+    help = "Recompute trending hashtags from hourly activity buckets (run periodically, e.g. every few minutes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--no-prune',
+            action='store_true',
+            help="Keep activity buckets older than the trending window"
+        )
+
+    def handle(self, *args, **options):
+        trending = refresh_trending_hashtags()
+        message = f"Stored {trending} trending hashtags."
+
+        if not options['no_prune']:
+            pruned = prune_hashtag_activity()
+            message += f" Pruned {pruned} old activity buckets."
+
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,150 @@
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .uploads import CHUNK_SIZE
+
+# Upload directories anyone may read; everything else belongs to a
+# conversation and is only served to its participants
+PUBLIC_PREFIXES = ('avatars/', 'covers/', 'photos/', 'derivatives/')
+
+# Conversation uploads: the model field each directory's files are stored in
+DM_FIELDS = {'dm_images/': 'image', 'dm_videos/': 'video', 'dm_audio/': 'audio', 'dm_files/': 'file'}
+
+# Saved names are never reused for other content (and stored blobs never
+# change), so any response may be cached for as long as browsers allow
+MAX_AGE = 365 * 24 * 60 * 60
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def media_access(user, name):
+    """
+    'public' or 'private' if user may read the upload stored as name, else
+    None (also for names that aren't uploads, like the blob store)
+    """
+    from .models import Conversation, DirectMessage
+
+    if any(part.startswith('.') for part in name.split('/')):
+        return None
+    if name.startswith(PUBLIC_PREFIXES):
+        return 'public'
+    if not user.is_authenticated:
+        return None
+
+    prefix = name.split('/', 1)[0] + '/'
+    if prefix in DM_FIELDS:
+        shared = DirectMessage.objects.filter(
+            **{DM_FIELDS[prefix]: name}, conversation__participants=user
+        ).exists()
+    elif prefix == 'group_avatars/':
+        shared = Conversation.objects.filter(group_avatar=name, participants=user).exists()
+    else:
+        shared = False
+    return 'private' if shared else None
+
+
+def byte_range(header, size):
+    """
+    (start, end) of a single-range `Range: bytes=...` header, inclusive;
+    None to send the whole file (no header, or several ranges), or False
+    if the range lies outside the file
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        # The last `end` bytes
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(CHUNK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def serve_upload(request, name, access):
+    """
+    Response for an upload the caller has checked access to: handed to nginx
+    with X-Accel-Redirect when configured, else streamed with ETag and
+    single-range support
+    """
+    path = os.path.join(settings.MEDIA_ROOT, *name.split('/'))
+    try:
+        stat = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404("Media not found")
+
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    headers = {
+        'Cache-Control': f'{access}, max-age={MAX_AGE}, immutable',
+        'Accept-Ranges': 'bytes',
+    }
+    if name.startswith('dm_files/'):
+        # Arbitrary files must not render as pages on this origin
+        headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(posixpath.basename(name))}"
+
+    accel_redirect = getattr(settings, 'MEDIA_ACCEL_REDIRECT', None)
+    if accel_redirect:
+        # nginx answers Range and conditional requests itself
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = accel_redirect + quote(name)
+    else:
+        response = _stream_file(request, path, stat, content_type, headers)
+
+    for header, value in headers.items():
+        response.headers.setdefault(header, value)
+    return response
+
+
+def _stream_file(request, path, stat, content_type, headers):
+    # The format nginx uses, so caches stay valid when it takes over
+    etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+    last_modified = http_date(stat.st_mtime)
+    headers.update({'ETag': etag, 'Last-Modified': last_modified})
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        return not_modified
+
+    span = byte_range(request.headers.get('Range'), stat.st_size)
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range not in (etag, last_modified):
+        # The client's partial copy is stale; send it all again
+        span = None
+
+    if span is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+    if span is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response.headers.pop('Content-Disposition', None)
+        return response
+
+    start, end = span
+    response = StreamingHttpResponse(
+        _read_range(path, start, end - start + 1), status=206, content_type=content_type
+    )
+    response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    response['Content-Length'] = str(end - start + 1)
+    return response
@@ -0,0 +1,76 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils.functional import SimpleLazyObject
+
+from .relationships import RelationshipContext
+
+
+class RelationshipContextMiddleware:
+    """Expose the viewer's RelationshipContext as request.relationships"""
+
+    # Runs inline under ASGI too, so async views aren't pushed onto a thread
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        request.relationships = SimpleLazyObject(
+            lambda: RelationshipContext.for_user(request.user)
+        )
+        # Under ASGI this hands back get_response's coroutine for the caller to await
+        return self.get_response(request)
+
+
+class PerfMiddleware:
+    """
+    Record each request's query count, DB and template time per URL name for
+    /debug/perf/ and send them back as a Server-Timing header. Only installed
+    when PERF_INSTRUMENTATION is on (DEBUG by default); put it first so the
+    total covers the other middleware too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        from django.core.exceptions import MiddlewareNotUsed
+        from . import perf
+
+        if not perf.PERF_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        perf.install()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        from . import perf
+
+        token = perf.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            recorder = perf.finish_request(token, self.url_name(request))
+        response['Server-Timing'] = recorder.server_timing()
+        return response
+
+    async def __acall__(self, request):
+        from . import perf
+
+        token = perf.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            recorder = perf.finish_request(token, self.url_name(request))
+        response['Server-Timing'] = recorder.server_timing()
+        return response
+
+    @staticmethod
+    def url_name(request):
+        match = getattr(request, 'resolver_match', None)
+        return match.url_name if match and match.url_name else '<unresolved>'
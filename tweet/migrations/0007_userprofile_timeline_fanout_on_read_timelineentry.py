@@ -0,0 +1,107 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_timelines(apps, schema_editor):
+    """Seed every user's timeline with recent tweets from accounts they follow"""
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Follow = apps.get_model("tweet", "Follow")
+    Tweet = apps.get_model("tweet", "Tweet")
+    TimelineEntry = apps.get_model("tweet", "TimelineEntry")
+
+    for user_id in User.objects.values_list("id", flat=True).iterator():
+        author_ids = list(
+            Follow.objects.filter(follower_id=user_id).values_list(
+                "following_id", flat=True
+            )
+        )
+        author_ids.append(user_id)
+        entries = []
+        for author_id in author_ids:
+            tweets = Tweet.objects.filter(user_id=author_id).order_by("-created_at")[
+                :50
+            ]
+            entries.extend(
+                TimelineEntry(
+                    user_id=user_id,
+                    tweet_id=tweet.id,
+                    author_id=author_id,
+                    created_at=tweet.created_at,
+                )
+                for tweet in tweets.only("id", "created_at")
+            )
+        TimelineEntry.objects.bulk_create(
+            entries, batch_size=1000, ignore_conflicts=True
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweet", "0006_hashtag_popularsearch_conversation_directmessage_and_more"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userprofile",
+            name="timeline_fanout_on_read",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.CreateModel(
+            name="TimelineEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField()),
+                (
+                    "author",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "tweet",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timeline_entries",
+                        to="tweet.tweet",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timeline_entries",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-created_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["user", "-created_at"],
+                        name="tweet_timel_user_id_5a162d_idx",
+                    ),
+                    models.Index(
+                        fields=["user", "author"], name="tweet_timel_user_id_8e9999_idx"
+                    ),
+                ],
+                "unique_together": {("user", "tweet")},
+            },
+        ),
+        migrations.RunPython(backfill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:16
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _count(queryset, fk_name):
+    counts = (
+        queryset.filter(**{fk_name: OuterRef("pk")})
+        .order_by()
+        .values(fk_name)
+        .annotate(total=Count("*"))
+        .values("total")
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def populate_counters(apps, schema_editor):
+    Tweet = apps.get_model("tweet", "Tweet")
+    Comment = apps.get_model("tweet", "Comment")
+
+    Tweet.objects.update(
+        likes_count=_count(Tweet.likes.through.objects.all(), "tweet"),
+        replies_count=_count(Tweet.objects.all(), "parent_tweet"),
+        comments_count=_count(Comment.objects.all(), "tweet"),
+    )
+    Comment.objects.update(
+        likes_count=_count(Comment.likes.through.objects.all(), "comment"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweet", "0007_userprofile_timeline_fanout_on_read_timelineentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="likes_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="tweet",
+            name="comments_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="tweet",
+            name="likes_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="tweet",
+            name="replies_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_read_cursors(apps, schema_editor):
+    """Start each participant's cursor at the newest message they have read"""
+    from django.db.models import Max
+
+    DirectMessage = apps.get_model("tweet", "DirectMessage")
+    ConversationReadState = apps.get_model("tweet", "ConversationReadState")
+
+    latest_read = (
+        DirectMessage.read_by.through.objects.values(
+            "directmessage__conversation_id", "user_id"
+        )
+        .annotate(last_id=Max("directmessage_id"))
+        .order_by()
+    )
+    ConversationReadState.objects.bulk_create(
+        (
+            ConversationReadState(
+                conversation_id=row["directmessage__conversation_id"],
+                user_id=row["user_id"],
+                last_read_message_id=row["last_id"],
+            )
+            for row in latest_read.iterator()
+        ),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweet", "0008_comment_likes_count_tweet_comments_count_and_more"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ConversationReadState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("last_read_message_id", models.PositiveBigIntegerField(default=0)),
+                ("last_read_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "conversation",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="read_states",
+                        to="tweet.conversation",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="conversation_read_states",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("conversation", "user")},
+            },
+        ),
+        migrations.RunPython(seed_read_cursors, migrations.RunPython.noop),
+    ]
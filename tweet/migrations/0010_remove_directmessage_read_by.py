@@ -0,0 +1,57 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:20
+
+from django.db import migrations
+from django.db.models import Max
+
+
+def collapse_read_by(apps, schema_editor):
+    """Fold per-message read_by rows into one read cursor per participant"""
+    DirectMessage = apps.get_model("tweet", "DirectMessage")
+    ConversationReadState = apps.get_model("tweet", "ConversationReadState")
+
+    latest_read = {
+        (row["directmessage__conversation_id"], row["user_id"]): row["last_id"]
+        for row in DirectMessage.read_by.through.objects.values(
+            "directmessage__conversation_id", "user_id"
+        )
+        .annotate(last_id=Max("directmessage_id"))
+        .order_by()
+        .iterator()
+    }
+
+    stale = []
+    for state in ConversationReadState.objects.iterator():
+        last_id = latest_read.pop((state.conversation_id, state.user_id), None)
+        if last_id is not None and last_id > state.last_read_message_id:
+            state.last_read_message_id = last_id
+            stale.append(state)
+    ConversationReadState.objects.bulk_update(
+        stale, ["last_read_message_id"], batch_size=1000
+    )
+    ConversationReadState.objects.bulk_create(
+        [
+            ConversationReadState(
+                conversation_id=conversation_id,
+                user_id=user_id,
+                last_read_message_id=last_id,
+            )
+            for (conversation_id, user_id), last_id in latest_read.items()
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweet", "0009_conversationreadstate"),
+    ]
+
+    operations = [
+        migrations.RunPython(collapse_read_by, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="directmessage",
+            name="read_by",
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_activity(apps, schema_editor):
+    """Bucket the last week of hashtag links by hour"""
+    from datetime import timedelta
+
+    from django.db.models import Count
+    from django.db.models.functions import TruncHour
+    from django.utils import timezone
+
+    TweetHashtag = apps.get_model("tweet", "TweetHashtag")
+    HashtagActivityBucket = apps.get_model("tweet", "HashtagActivityBucket")
+
+    rows = (
+        TweetHashtag.objects.filter(created_at__gte=timezone.now() - timedelta(days=7))
+        .annotate(bucket_start=TruncHour("created_at"))
+        .values("hashtag_id", "bucket_start")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    HashtagActivityBucket.objects.bulk_create(
+        (HashtagActivityBucket(**row) for row in rows.iterator()),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweet", "0010_remove_directmessage_read_by"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HashtagActivityBucket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("bucket_start", models.DateTimeField()),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "hashtag",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="activity_buckets",
+                        to="tweet.hashtag",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["bucket_start"], name="tweet_hasht_bucket__447e95_idx"
+                    )
+                ],
+                "unique_together": {("hashtag", "bucket_start")},
+            },
+        ),
+        migrations.RunPython(backfill_activity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:02
+
+from django.db import migrations
+
+# Kept in step with tweet.search.INDEXES
+INDEXES = [
+    ("tweet_search_fts", "tweet_tweet", ("text",), "english"),
+    ("user_search_fts", "auth_user", ("username", "first_name", "last_name"), "simple"),
+    ("hashtag_search_fts", "tweet_hashtag", ("name",), "simple"),
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA compile_options")
+            if "ENABLE_FTS5" not in {row[0] for row in cursor.fetchall()}:
+                # Without FTS5 the search backend falls back to icontains
+                return
+        for fts_table, table, columns, _ in INDEXES:
+            column_list = ", ".join(columns)
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE {fts_table} USING fts5("
+                f"{column_list}, tokenize='unicode61 remove_diacritics 2')"
+            )
+            schema_editor.execute(
+                f"INSERT INTO {fts_table} (rowid, {column_list}) "
+                f"SELECT id, {column_list} FROM {table}"
+            )
+    elif connection.vendor == "postgresql":
+        for fts_table, table, columns, config in INDEXES:
+            document = " || ' ' || ".join(f'"{column}"' for column in columns)
+            schema_editor.execute(
+                f"CREATE INDEX {fts_table}_gin ON {table} "
+                f"USING GIN (to_tsvector('{config}', {document}))"
+            )
+
+
+def drop_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    for fts_table, *_ in INDEXES:
+        if connection.vendor == "sqlite":
+            schema_editor.execute(f"DROP TABLE IF EXISTS {fts_table}")
+        elif connection.vendor == "postgresql":
+            schema_editor.execute(f"DROP INDEX IF EXISTS {fts_table}_gin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweet", "0011_hashtagactivitybucket"),
+        ("auth", "0012_alter_user_first_name_max_length"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
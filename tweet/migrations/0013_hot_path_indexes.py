@@ -0,0 +1,47 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweet", "0012_search_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="follow",
+            index=models.Index(
+                fields=["following", "follower"], name="follow_following_follower_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tweet",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="tweet_created_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tweet",
+            index=models.Index(
+                condition=models.Q(("parent_tweet__isnull", True)),
+                fields=["-created_at", "-id"],
+                name="tweet_root_created_id_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tweet",
+            index=models.Index(
+                fields=["user", "-created_at"], name="tweet_user_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tweethashtag",
+            index=models.Index(
+                fields=["hashtag", "-created_at"], name="tweethashtag_recent_idx"
+            ),
+        ),
+    ]
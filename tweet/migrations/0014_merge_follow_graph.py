@@ -0,0 +1,79 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:30
+
+from django.db import migrations
+
+
+def merge_followers_into_follow(apps, schema_editor):
+    """Copy UserProfile.followers edges missing from Follow, with their timelines"""
+    UserProfile = apps.get_model("tweet", "UserProfile")
+    Follow = apps.get_model("tweet", "Follow")
+    Tweet = apps.get_model("tweet", "Tweet")
+    TimelineEntry = apps.get_model("tweet", "TimelineEntry")
+
+    existing = set(Follow.objects.values_list("follower_id", "following_id"))
+    edges = {
+        (follower_id, following_id)
+        for follower_id, following_id in UserProfile.followers.through.objects.values_list(
+            "user_id", "userprofile__user_id"
+        ).iterator()
+        if follower_id != following_id
+    } - existing
+
+    Follow.objects.bulk_create(
+        [
+            Follow(follower_id=follower_id, following_id=following_id)
+            for follower_id, following_id in edges
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+    # New edges never went through the follow signal, so seed their timelines
+    entries = []
+    for follower_id, following_id in edges:
+        tweets = Tweet.objects.filter(user_id=following_id).order_by("-created_at")[:50]
+        entries.extend(
+            TimelineEntry(
+                user_id=follower_id,
+                tweet_id=tweet.id,
+                author_id=following_id,
+                created_at=tweet.created_at,
+            )
+            for tweet in tweets.only("id", "created_at")
+        )
+    TimelineEntry.objects.bulk_create(entries, batch_size=1000, ignore_conflicts=True)
+
+
+def split_follow_into_followers(apps, schema_editor):
+    """Mirror Follow edges back into UserProfile.followers"""
+    UserProfile = apps.get_model("tweet", "UserProfile")
+    Follow = apps.get_model("tweet", "Follow")
+
+    profile_ids = dict(UserProfile.objects.values_list("user_id", "id"))
+    Through = UserProfile.followers.through
+    Through.objects.bulk_create(
+        [
+            Through(userprofile_id=profile_ids[following_id], user_id=follower_id)
+            for follower_id, following_id in Follow.objects.values_list(
+                "follower_id", "following_id"
+            ).iterator()
+            if following_id in profile_ids
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweet", "0013_hot_path_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_followers_into_follow, split_follow_into_followers),
+        migrations.RemoveField(
+            model_name="userprofile",
+            name="followers",
+        ),
+    ]
@@ -0,0 +1,113 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Mirrors tweet.notifications at the time of writing; only rows whose message
+# has one of these endings are folded, so "accepted your follow request" stays
+VERBS = {
+    "like": {"tweet": "liked your tweet", "comment": "liked your comment"},
+    "comment": {"tweet": "commented on your tweet"},
+    "follow": {"": "started following you"},
+}
+
+
+def collapse_unread_notifications(apps, schema_editor):
+    """Fold each recipient's unread likes/comments/follows per target into one row"""
+    Notification = apps.get_model("tweet", "Notification")
+    User = apps.get_model("auth", "User")
+
+    groups = {}
+    for notification in (
+        Notification.objects.filter(is_read=False, notification_type__in=VERBS)
+        .order_by("-created_at", "-id")
+        .iterator()
+    ):
+        for target, verb in VERBS[notification.notification_type].items():
+            if notification.message.endswith(verb):
+                break
+        else:
+            continue
+        if target == "":
+            group_key = "follow"
+        elif target == "comment":
+            group_key = f"like:comment:{notification.comment_id}"
+        else:
+            group_key = (
+                f"{notification.notification_type}:tweet:{notification.tweet_id}"
+            )
+        groups.setdefault((notification.recipient_id, group_key, verb), []).append(
+            notification
+        )
+
+    usernames = dict(
+        User.objects.filter(
+            id__in={rows[0].sender_id for rows in groups.values()}
+        ).values_list("id", "username")
+    )
+    keep, drop = [], []
+    for (recipient_id, group_key, verb), rows in groups.items():
+        newest = rows[0]
+        actor_ids = list(dict.fromkeys(row.sender_id for row in rows if row.sender_id))
+        others = max(len(actor_ids), 1) - 1
+        actor = usernames.get(newest.sender_id, "")
+        newest.group_key = group_key
+        newest.actor_count = max(len(actor_ids), 1)
+        newest.recent_actor_ids = actor_ids[:5]
+        if others:
+            newest.message = (
+                f"{actor} and {others} other{'s' if others > 1 else ''} {verb}"
+            )
+        keep.append(newest)
+        drop.extend(row.id for row in rows[1:])
+
+    Notification.objects.bulk_update(
+        keep,
+        ["group_key", "actor_count", "recent_actor_ids", "message"],
+        batch_size=1000,
+    )
+    for start in range(0, len(drop), 1000):
+        Notification.objects.filter(id__in=drop[start : start + 1000]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweet", "0015_notificationjob"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notification",
+            name="actor_count",
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="group_key",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=64
+            ),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="recent_actor_ids",
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name="notificationjob",
+            name="group_key",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                condition=models.Q(("is_read", False)),
+                fields=["recipient", "group_key"],
+                name="notification_open_group_idx",
+            ),
+        ),
+        # Collapsed duplicates are not restored on reverse
+        migrations.RunPython(collapse_unread_notifications, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweet", "0017_chunkedupload"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="conversation",
+            name="group_avatar",
+            field=models.ImageField(
+                blank=True, db_index=True, null=True, upload_to="group_avatars/"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="directmessage",
+            name="audio",
+            field=models.FileField(
+                blank=True, db_index=True, null=True, upload_to="dm_audio/"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="directmessage",
+            name="file",
+            field=models.FileField(
+                blank=True, db_index=True, null=True, upload_to="dm_files/"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="directmessage",
+            name="image",
+            field=models.ImageField(
+                blank=True, db_index=True, null=True, upload_to="dm_images/"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="directmessage",
+            name="video",
+            field=models.FileField(
+                blank=True, db_index=True, null=True, upload_to="dm_videos/"
+            ),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:02
+
+import re
+
+from django.db import migrations, models
+
+# Mirrors tweet.entities.ENTITY_RE at the time of writing
+ENTITY_RE = re.compile(r"[#@]\w+")
+
+
+def tokenize_existing_tweets(apps, schema_editor):
+    Tweet = apps.get_model("tweet", "Tweet")
+    batch = []
+    for tweet in Tweet.objects.filter(entities__isnull=True).only("text").iterator():
+        tweet.entities = [[m.start(), m.end()] for m in ENTITY_RE.finditer(tweet.text)]
+        batch.append(tweet)
+        if len(batch) == 1000:
+            Tweet.objects.bulk_update(batch, ["entities"])
+            batch = []
+    Tweet.objects.bulk_update(batch, ["entities"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweet", "0018_media_lookup_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tweet",
+            name="entities",
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(tokenize_existing_tweets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_actors(apps, schema_editor):
+    # Older actors of open aggregates weren't recorded; the recent ones are
+    # the best record there is
+    Notification = apps.get_model("tweet", "Notification")
+    NotificationActor = apps.get_model("tweet", "NotificationActor")
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+    batch = []
+    for notification in (
+        Notification.objects.filter(is_read=False)
+        .exclude(group_key="")
+        .only("recent_actor_ids")
+        .iterator()
+    ):
+        user_ids = User.objects.filter(
+            id__in=notification.recent_actor_ids
+        ).values_list("id", flat=True)
+        batch += [
+            NotificationActor(notification_id=notification.pk, user_id=user_id)
+            for user_id in user_ids
+        ]
+        if len(batch) >= 1000:
+            NotificationActor.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    NotificationActor.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweet", "0019_tweet_entities"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NotificationActor",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "notification",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="actors",
+                        to="tweet.notification",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("notification", "user")},
+            },
+        ),
+        migrations.RunPython(seed_actors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.1 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweet", "0020_notificationactor"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImageDerivativeJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("kind", models.CharField(max_length=10)),
+                ("name", models.CharField(max_length=255)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "unique_together": {("kind", "name")},
+            },
+        ),
+    ]
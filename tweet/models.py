@@ -1,9 +1,32 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
-import re
+import uuid
 
 # Create your models here.
+class TweetQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """
+        Tweets the given user may see: public, their own, and private tweets of
+        accounts they follow, minus anyone they block, are blocked by, or mute.
+        Each relationship check is a correlated EXISTS on a unique index.
+        """
+        if user is None or not user.is_authenticated:
+            return self.filter(privacy='public')
+
+        author = models.OuterRef('user')
+        follows_author = Follow.objects.filter(follower=user, following=author)
+        return self.filter(
+            models.Q(privacy='public') | models.Q(user=user) | models.Exists(follows_author)
+        ).exclude(
+            models.Exists(Block.objects.filter(blocker=user, blocked=author))
+        ).exclude(
+            models.Exists(Block.objects.filter(blocker=author, blocked=user))
+        ).exclude(
+            models.Exists(Mute.objects.filter(muter=user, muted=author))
+        )
+
+
 class Tweet(models.Model):
     PRIVACY_CHOICES = [
         ('public', 'Public'),
@@ -17,21 +40,50 @@ class Tweet(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     likes = models.ManyToManyField(User, related_name='liked_tweets', blank=True)
     privacy = models.CharField(max_length=10, choices=PRIVACY_CHOICES, default='public')
+    # [start, end] offsets of the #hashtags and @mentions in text, found on save
+    entities = models.JSONField(null=True, blank=True, editable=False)
     
     # Reply functionality
     parent_tweet = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
     
+    # Denormalized counters, kept in sync by signals (see recount_counters)
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+    replies_count = models.PositiveIntegerField(default=0, editable=False)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+    
+    objects = TweetQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination order for global listings
+            models.Index(fields=['-created_at', '-id'], name='tweet_created_id_idx'),
+            # Top-level tweets only (home, tweet list)
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(parent_tweet__isnull=True),
+                name='tweet_root_created_id_idx'
+            ),
+            # Profile pages and fan-out-on-read authors
+            models.Index(fields=['user', '-created_at'], name='tweet_user_created_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user.username} - {self.text[:50]}'
     
     def get_likes_count(self):
-        return self.likes.count()
+        return self.likes_count
     
     def get_replies_count(self):
-        return self.replies.count()
+        return self.replies_count
+    
+    def get_comments_count(self):
+        return self.comments_count
+    
+    def get_image_attrs(self):
+        """src/srcset/sizes for the image's WebP derivatives, or None without an image"""
+        from .images import image_attrs
+        return image_attrs(self.image, 'photo') if self.image else None
     
     def is_reply(self):
         return self.parent_tweet is not None
@@ -50,50 +102,48 @@ class Tweet(models.Model):
                 models.Q(id=self.id) | models.Q(parent_tweet=self)
             ).order_by('created_at')
     
+    def get_entities(self):
+        """[start, end] offsets of hashtags and mentions, tokenizing only if never saved"""
+        if self.entities is None:
+            from .entities import tokenize
+            return tokenize(self.text)
+        return self.entities
+    
     def extract_hashtags(self):
         """Extract hashtags from tweet text"""
-        hashtag_pattern = r'#(\w+)'
-        return re.findall(hashtag_pattern, self.text, re.IGNORECASE)
+        return [self.text[start + 1:end] for start, end in self.get_entities() if self.text[start] == '#']
     
     def extract_mentions(self):
         """Extract user mentions from tweet text"""
-        mention_pattern = r'@(\w+)'
-        return re.findall(mention_pattern, self.text, re.IGNORECASE)
+        return [self.text[start + 1:end] for start, end in self.get_entities() if self.text[start] == '@']
+    
+    def get_text_html(self):
+        """The text as safe HTML with hashtags and mentions linked"""
+        from .entities import render_entities
+        return render_entities(self.text, self.get_entities())
     
     def save(self, *args, **kwargs):
         """Override save to handle hashtags and mentions"""
         is_new = self.pk is None
+        
+        # Tokenize once here rather than on every render
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'text' in update_fields:
+            from .entities import tokenize
+            self.entities = tokenize(self.text)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'entities'}
+        
         super().save(*args, **kwargs)
         
         if is_new:
-            # Process hashtags
-            hashtags = self.extract_hashtags()
-            for hashtag_name in hashtags:
-                hashtag, created = Hashtag.objects.get_or_create(
-                    name=hashtag_name.lower()
-                )
-                TweetHashtag.objects.get_or_create(
-                    tweet=self,
-                    hashtag=hashtag
-                )
-                hashtag.increment_count()
+            # Link hashtags and mentions in bulk
+            from .entities import link_tweet_entities
+            link_tweet_entities([self])
             
-            # Process mentions
-            mentions = self.extract_mentions()
-            for username in mentions:
-                try:
-                    mentioned_user = User.objects.get(username=username)
-                    Mention.objects.get_or_create(
-                        tweet=self,
-                        mentioned_user=mentioned_user
-                    )
-                    # Create notification for mention
-                    # Import here to avoid circular imports
-                    if mentioned_user != self.user:  # Don't notify self
-                        # We'll handle this in signals instead
-                        pass
-                except User.DoesNotExist:
-                    pass
+            # Push the new tweet into followers' home timelines
+            from .timeline import fan_out_tweet
+            fan_out_tweet(self)
     
     def get_hashtags(self):
         """Get all hashtags for this tweet"""
@@ -111,6 +161,9 @@ class Comment(models.Model):
     # Reply to comment functionality
     parent_comment = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
     
+    # Denormalized counter, kept in sync by signals (see recount_counters)
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+    
     class Meta:
         ordering = ['created_at']
     
@@ -118,7 +171,7 @@ class Comment(models.Model):
         return f'{self.user.username} commented: {self.text[:30]}'
     
     def get_likes_count(self):
-        return self.likes.count()
+        return self.likes_count
     
     def is_reply(self):
         return self.parent_comment is not None
@@ -146,14 +199,14 @@ class UserProfile(models.Model):
     is_private = models.BooleanField(default=False, help_text="Make profile private")
     is_verified = models.BooleanField(default=False, help_text="Verified account")
     
-    # Social connections
-    followers = models.ManyToManyField(User, related_name='following', blank=True)
-    
     # Profile customization
     theme_color = models.CharField(max_length=7, default='#1DA1F2', help_text="Profile theme color")
     show_birth_date = models.BooleanField(default=False, help_text="Show birth date publicly")
     show_email = models.BooleanField(default=False, help_text="Show email publicly")
     
+    # Timeline delivery: set once the account has too many followers to fan out on write
+    timeline_fanout_on_read = models.BooleanField(default=False, editable=False)
+    
     # Stats
     profile_views = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -162,17 +215,29 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.username}'s Profile"
     
+    def get_avatar_attrs(self, size=40):
+        """src/srcset of the avatar's WebP derivatives for a size px display, or None"""
+        from .images import image_attrs
+        return image_attrs(self.avatar, 'avatar', size) if self.avatar else None
+    
+    def get_cover_attrs(self):
+        """src/srcset/sizes of the cover photo's WebP derivatives, or None"""
+        from .images import image_attrs
+        return image_attrs(self.cover_photo, 'cover') if self.cover_photo else None
+    
     def get_followers_count(self):
-        return self.followers.count()
+        return Follow.objects.filter(following=self.user).count()
     
     def get_following_count(self):
-        return self.user.following.count()
+        return Follow.objects.filter(follower=self.user).count()
     
     def get_tweets_count(self):
         return Tweet.objects.filter(user=self.user).count()
     
     def get_total_likes_received(self):
-        return sum(tweet.get_likes_count() for tweet in Tweet.objects.filter(user=self.user))
+        return Tweet.objects.filter(user=self.user).aggregate(
+            total=models.Sum('likes_count')
+        )['total'] or 0
     
     def get_display_name(self):
         return self.user.get_full_name() or self.user.username
@@ -208,6 +273,11 @@ class Follow(models.Model):
     class Meta:
         unique_together = ('follower', 'following')
         ordering = ['-created_at']
+        indexes = [
+            # Covers follower lookups by followee (fan-out, follower counts);
+            # the unique constraint already covers the other direction
+            models.Index(fields=['following', 'follower'], name='follow_following_follower_idx'),
+        ]
     
     def __str__(self):
         return f"{self.follower.username} follows {self.following.username}"
@@ -255,6 +325,25 @@ class FollowRequest(models.Model):
         return False
 
 
+class TimelineEntry(models.Model):
+    """Materialized home timeline row: a tweet delivered to one user's feed"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE, related_name='timeline_entries')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()
+    
+    class Meta:
+        unique_together = ('user', 'tweet')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+            models.Index(fields=['user', 'author']),
+        ]
+    
+    def __str__(self):
+        return f"Tweet {self.tweet_id} in {self.user.username}'s timeline"
+
+
 # 2. HASHTAG SYSTEM
 class Hashtag(models.Model):
     """Model for hashtags"""
@@ -288,6 +377,9 @@ class TweetHashtag(models.Model):
     
     class Meta:
         unique_together = ('tweet', 'hashtag')
+        indexes = [
+            models.Index(fields=['hashtag', '-created_at'], name='tweethashtag_recent_idx'),
+        ]
     
     def __str__(self):
         return f"{self.tweet.user.username}'s tweet with #{self.hashtag.name}"
@@ -308,6 +400,22 @@ class TrendingHashtag(models.Model):
         return f"Trending: #{self.hashtag.name} (Score: {self.trend_score})"
 
 
+class HashtagActivityBucket(models.Model):
+    """Hourly tweet counter per hashtag, the input for trend scoring"""
+    hashtag = models.ForeignKey(Hashtag, on_delete=models.CASCADE, related_name='activity_buckets')
+    bucket_start = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('hashtag', 'bucket_start')
+        indexes = [
+            models.Index(fields=['bucket_start']),
+        ]
+    
+    def __str__(self):
+        return f"#{self.hashtag.name} @ {self.bucket_start:%Y-%m-%d %H:00}: {self.count}"
+
+
 # 3. DIRECT MESSAGING SYSTEM
 class Conversation(models.Model):
     """Model for conversations between users"""
@@ -316,7 +424,7 @@ class Conversation(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_group = models.BooleanField(default=False)
     group_name = models.CharField(max_length=100, blank=True, null=True)
-    group_avatar = models.ImageField(upload_to='group_avatars/', blank=True, null=True)
+    group_avatar = models.ImageField(upload_to='group_avatars/', blank=True, null=True, db_index=True)
     
     class Meta:
         ordering = ['-updated_at']
@@ -335,10 +443,10 @@ class Conversation(models.Model):
     
     def get_unread_count(self, user):
         """Get unread message count for a specific user"""
+        from .utils import get_read_cursor
         return self.messages.filter(
-            read_by__lt=models.F('id'),
-            sender__ne=user
-        ).count()
+            id__gt=get_read_cursor(self, user)
+        ).exclude(sender=user).count()
 
 
 class DirectMessage(models.Model):
@@ -357,16 +465,16 @@ class DirectMessage(models.Model):
     message_type = models.CharField(max_length=10, choices=MESSAGE_TYPES, default='text')
     
     # Media attachments
-    image = models.ImageField(upload_to='dm_images/', blank=True, null=True)
-    video = models.FileField(upload_to='dm_videos/', blank=True, null=True)
-    audio = models.FileField(upload_to='dm_audio/', blank=True, null=True)
-    file = models.FileField(upload_to='dm_files/', blank=True, null=True)
+    # Indexed for the permission check when serving them (tweet/media.py)
+    image = models.ImageField(upload_to='dm_images/', blank=True, null=True, db_index=True)
+    video = models.FileField(upload_to='dm_videos/', blank=True, null=True, db_index=True)
+    audio = models.FileField(upload_to='dm_audio/', blank=True, null=True, db_index=True)
+    file = models.FileField(upload_to='dm_files/', blank=True, null=True, db_index=True)
     
     # Message status
     sent_at = models.DateTimeField(auto_now_add=True)
     edited_at = models.DateTimeField(null=True, blank=True)
     is_edited = models.BooleanField(default=False)
-    read_by = models.ManyToManyField(User, related_name='read_messages', blank=True)
     
     # Reply functionality
     reply_to = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
@@ -378,12 +486,54 @@ class DirectMessage(models.Model):
         return f"{self.sender.username}: {self.content[:50] if self.content else f'[{self.message_type}]'}"
     
     def mark_as_read(self, user):
-        """Mark message as read by a user"""
-        self.read_by.add(user)
+        """Mark message (and everything before it) as read by a user"""
+        from .utils import mark_conversation_read
+        mark_conversation_read(self.conversation, user, up_to_message_id=self.id)
     
     def is_read_by(self, user):
         """Check if message is read by a user"""
-        return self.read_by.filter(id=user.id).exists()
+        if self.sender_id == user.id:
+            return True
+        from .utils import get_read_cursor
+        return self.id <= get_read_cursor(self.conversation_id, user)
+
+
+class ConversationReadState(models.Model):
+    """Per-participant read cursor: everything up to last_read_message_id has been read"""
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='read_states')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversation_read_states')
+    last_read_message_id = models.PositiveBigIntegerField(default=0)
+    last_read_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        unique_together = ('conversation', 'user')
+    
+    def __str__(self):
+        return f"{self.user.username} read {self.conversation} up to message {self.last_read_message_id}"
+
+
+class ChunkedUpload(models.Model):
+    """A large DM attachment being sent in pieces (see tweet/uploads.py)"""
+    FIELDS = [
+        ('image', 'Image'),
+        ('video', 'Video'),
+        ('audio', 'Audio'),
+        ('file', 'File'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='+')
+    field = models.CharField(max_length=10, choices=FIELDS)
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)  # Bytes received so far
+    sha256 = models.CharField(max_length=64, blank=True)  # Set once every byte is in
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    def __str__(self):
+        return f"{self.filename}: {self.offset}/{self.size} bytes"
 
 
 # 4. NOTIFICATION SYSTEM
@@ -411,6 +561,12 @@ class Notification(models.Model):
     comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True)
     direct_message = models.ForeignKey(DirectMessage, on_delete=models.CASCADE, null=True, blank=True)
     
+    # Aggregation: likes/follows/comments on the same target within a time
+    # window share one row; created_at moves to the latest actor's activity
+    group_key = models.CharField(max_length=64, blank=True, default='', editable=False)
+    actor_count = models.PositiveIntegerField(default=1, editable=False)
+    recent_actor_ids = models.JSONField(default=list, blank=True, editable=False)
+    
     # Status
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -420,6 +576,12 @@ class Notification(models.Model):
         indexes = [
             models.Index(fields=['recipient', 'is_read']),
             models.Index(fields=['created_at']),
+            # Open aggregates that new actors can still be folded into
+            models.Index(
+                fields=['recipient', 'group_key'],
+                condition=models.Q(is_read=False),
+                name='notification_open_group_idx'
+            ),
         ]
     
     def __str__(self):
@@ -431,6 +593,44 @@ class Notification(models.Model):
         self.save(update_fields=['is_read'])
 
 
+class NotificationActor(models.Model):
+    """Everyone folded into an aggregated notification, so repeat actors are counted once"""
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='actors')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    
+    class Meta:
+        unique_together = ('notification', 'user')
+
+
+class NotificationJob(models.Model):
+    """A notification waiting to be delivered by `manage.py run_workers`"""
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', null=True, blank=True)
+    notification_type = models.CharField(max_length=20, choices=Notification.NOTIFICATION_TYPES)
+    message = models.TextField(max_length=200)
+    tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE, null=True, blank=True)
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True)
+    direct_message = models.ForeignKey(DirectMessage, on_delete=models.CASCADE, null=True, blank=True)
+    group_key = models.CharField(max_length=64, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Pending {self.notification_type} for {self.recipient_id}"
+
+
+class ImageDerivativeJob(models.Model):
+    """An upload whose WebP derivatives `manage.py run_workers` has yet to write"""
+    kind = models.CharField(max_length=10)
+    name = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ('kind', 'name')
+    
+    def __str__(self):
+        return f"Pending {self.kind} derivatives of {self.name}"
+
+
 # 5. SEARCH SYSTEM
 class SearchQuery(models.Model):
     """Model to track search queries for analytics"""
@@ -0,0 +1,213 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+# Queue notifications for `manage.py run_workers`. When False they are
+# delivered as soon as the enqueuing transaction commits, without a worker.
+NOTIFICATIONS_ASYNC = getattr(settings, 'NOTIFICATIONS_ASYNC', True)
+
+BATCH_SIZE = 500
+
+# Likes, follows and comments on the same target are folded into one unread
+# notification ("alice and 41 others liked your tweet") for this long
+AGGREGATION_WINDOW = timedelta(hours=24)
+
+# Actor ids kept on an aggregate, newest first, for avatars; every actor is
+# recorded as a NotificationActor for de-duplication
+RECENT_ACTORS = 5
+
+# What an aggregate says after the actor names, by group_key prefix
+AGGREGATE_VERBS = {
+    'like:tweet': 'liked your tweet',
+    'like:comment': 'liked your comment',
+    'comment:tweet': 'commented on your tweet',
+    'follow': 'started following you',
+}
+
+
+def group_key_for(notification_type, tweet_id=None, comment_id=None):
+    """
+    The aggregation key for a notification, or '' if it is always delivered on its own
+    """
+    if notification_type == 'like':
+        return f'like:comment:{comment_id}' if comment_id else f'like:tweet:{tweet_id}'
+    if notification_type == 'comment' and tweet_id:
+        return f'comment:tweet:{tweet_id}'
+    if notification_type == 'follow':
+        return 'follow'
+    return ''
+
+
+def aggregate_message(group_key, actor_name, actor_count):
+    """E.g. "alice and 41 others liked your tweet" """
+    verb = AGGREGATE_VERBS[group_key.rsplit(':', 1)[0]]
+    others = actor_count - 1
+    if not others:
+        return f"{actor_name} {verb}"
+    return f"{actor_name} and {others} other{'s' if others > 1 else ''} {verb}"
+
+
+def enqueue_notifications(jobs):
+    """
+    Queue unsaved NotificationJob rows in one INSERT; self-notifications are dropped
+    """
+    from .models import NotificationJob
+
+    jobs = [job for job in jobs if job.recipient_id != job.sender_id]
+    if not jobs:
+        return
+    NotificationJob.objects.bulk_create(jobs, batch_size=BATCH_SIZE)
+
+    if not NOTIFICATIONS_ASYNC:
+        transaction.on_commit(deliver_pending_notifications)
+
+
+def deliver_notification_batch(batch_size=BATCH_SIZE):
+    """
+    Turn up to batch_size queued jobs into notifications, skipping recipients
+    who block the sender. Returns the number of jobs consumed.
+    """
+    from .models import Block, Notification, NotificationActor, NotificationJob
+    from .utils import invalidate_unread_counts
+
+    with transaction.atomic():
+        # skip_locked lets several workers drain the queue side by side
+        jobs = list(
+            NotificationJob.objects.select_for_update(skip_locked=True).order_by('id')[:batch_size]
+        )
+        if not jobs:
+            return 0
+
+        blocked = set(Block.objects.filter(
+            blocker_id__in={job.recipient_id for job in jobs},
+            blocked_id__in={job.sender_id for job in jobs if job.sender_id}
+        ).values_list('blocker_id', 'blocked_id'))
+
+        delivered = [job for job in jobs if (job.recipient_id, job.sender_id) not in blocked]
+
+        notifications = [
+            Notification(
+                recipient_id=job.recipient_id,
+                sender_id=job.sender_id,
+                notification_type=job.notification_type,
+                message=job.message,
+                tweet_id=job.tweet_id,
+                comment_id=job.comment_id,
+                direct_message_id=job.direct_message_id
+            )
+            for job in delivered
+            if not job.group_key
+        ]
+        aggregates, actors = _aggregate_jobs([job for job in delivered if job.group_key])
+        notifications += aggregates
+        Notification.objects.bulk_create(notifications)
+        # After the aggregates above, so new ones have their ids
+        NotificationActor.objects.bulk_create(
+            [NotificationActor(notification=notification, user_id=user_id) for notification, user_id in actors],
+            ignore_conflicts=True
+        )
+        NotificationJob.objects.filter(id__in=[job.id for job in jobs]).delete()
+
+    # bulk_create/bulk_update skip post_save, so the badge counts are dropped here
+    invalidate_unread_counts(*{job.recipient_id for job in delivered})
+    return len(jobs)
+
+
+def _aggregate_jobs(jobs):
+    """
+    Fold grouped jobs into the recipients' open aggregates (updated in place).
+    Returns unsaved Notifications for the groups that have none yet, and the
+    (notification, actor id) pairs to record for actors not counted before.
+    """
+    from django.contrib.auth.models import User
+
+    from .models import Notification, NotificationActor
+
+    if not jobs:
+        return [], []
+
+    groups = {}
+    for job in jobs:
+        groups.setdefault((job.recipient_id, job.group_key), []).append(job)
+
+    usernames = dict(User.objects.filter(
+        id__in={job.sender_id for job in jobs}
+    ).values_list('id', 'username'))
+
+    now = timezone.now()
+    open_aggregates = {}
+    for notification in Notification.objects.select_for_update().filter(
+        recipient_id__in={recipient_id for recipient_id, _ in groups},
+        group_key__in={group_key for _, group_key in groups},
+        is_read=False,
+        created_at__gte=now - AGGREGATION_WINDOW
+    ).order_by('created_at'):
+        # Newest wins if an earlier race left two open rows for a group
+        open_aggregates[notification.recipient_id, notification.group_key] = notification
+
+    # Actors already folded into those aggregates, however long ago
+    counted = set()
+    if open_aggregates:
+        counted = set(NotificationActor.objects.filter(
+            notification__in=open_aggregates.values(),
+            user_id__in={job.sender_id for job in jobs}
+        ).values_list('notification_id', 'user_id'))
+
+    created, updated, actors = [], [], []
+    for (recipient_id, group_key), group in groups.items():
+        latest = group[-1]
+        actor_ids = list(dict.fromkeys(job.sender_id for job in reversed(group)))
+        notification = open_aggregates.get((recipient_id, group_key))
+
+        if notification is None:
+            notification = Notification(
+                recipient_id=recipient_id,
+                sender_id=latest.sender_id,
+                notification_type=latest.notification_type,
+                message=aggregate_message(group_key, usernames.get(latest.sender_id), len(actor_ids)),
+                tweet_id=latest.tweet_id,
+                comment_id=latest.comment_id,
+                group_key=group_key,
+                actor_count=len(actor_ids),
+                recent_actor_ids=actor_ids[:RECENT_ACTORS]
+            )
+            created.append(notification)
+            actors += [(notification, pk) for pk in actor_ids]
+            continue
+
+        # Actors repeating themselves (unlike, like again) aren't counted twice
+        new_actor_ids = [pk for pk in actor_ids if (notification.pk, pk) not in counted]
+        if not new_actor_ids:
+            continue
+        actors += [(notification, pk) for pk in new_actor_ids]
+        notification.actor_count += len(new_actor_ids)
+        notification.recent_actor_ids = list(dict.fromkeys(
+            new_actor_ids + notification.recent_actor_ids
+        ))[:RECENT_ACTORS]
+        notification.sender_id = latest.sender_id
+        notification.comment_id = latest.comment_id
+        notification.message = aggregate_message(
+            group_key, usernames.get(latest.sender_id), notification.actor_count
+        )
+        # Resurface the aggregate at the top of the newest-first list
+        notification.created_at = now
+        updated.append(notification)
+
+    Notification.objects.bulk_update(updated, [
+        'sender', 'comment', 'message', 'actor_count', 'recent_actor_ids', 'created_at'
+    ])
+    return created, actors
+
+
+def deliver_pending_notifications(batch_size=BATCH_SIZE):
+    """
+    Deliver batches until the queue is empty; returns the number of jobs consumed
+    """
+    total = 0
+    while True:
+        consumed = deliver_notification_batch(batch_size)
+        if not consumed:
+            return total
+        total += consumed
@@ -0,0 +1,76 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+PAGE_SIZE = 20
+
+
+def encode_cursor(created_at, pk):
+    """Opaque ?before= token for the row at (created_at, pk)"""
+    raw = f'{created_at.isoformat()}_{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    """
+    Parse a ?before= token back into (created_at, pk); None if missing or malformed
+    """
+    if not value:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode()
+        created_at, pk = raw.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def keyset_filter(queryset, cursor, created_field='created_at', id_field='id'):
+    """
+    Restrict a queryset to rows strictly older than cursor in (created_at, id) order
+    """
+    if cursor is None:
+        return queryset
+    created_at, pk = cursor
+    return queryset.filter(
+        Q(**{f'{created_field}__lt': created_at}) |
+        Q(**{created_field: created_at, f'{id_field}__lt': pk})
+    )
+
+
+class KeysetPage:
+    """One page of rows plus the cursor that fetches the next (older) page"""
+
+    def __init__(self, items, has_next, next_cursor=None):
+        self.items = items
+        self.has_next = has_next
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @classmethod
+    def from_rows(cls, rows, per_page):
+        """Build a page from up to per_page + 1 rows fetched newest first"""
+        rows = list(rows)
+        has_next = len(rows) > per_page
+        items = rows[:per_page]
+        next_cursor = None
+        if has_next:
+            last = items[-1]
+            next_cursor = encode_cursor(last.created_at, last.pk)
+        return cls(items, has_next, next_cursor)
+
+
+def paginate_keyset(queryset, before=None, per_page=PAGE_SIZE):
+    """
+    Return the page of a queryset that comes after the ?before= cursor, newest
+    first. Each page is one indexed range scan, however deep the reader scrolls.
+    """
+    queryset = keyset_filter(queryset, decode_cursor(before)).order_by('-created_at', '-id')
+    return KeysetPage.from_rows(queryset[:per_page + 1], per_page)
@@ -0,0 +1,205 @@
+import contextvars
+import heapq
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import request_started
+
+# Record per-request query counts and timings (PerfMiddleware); off by default
+# in production, where the Server-Timing header would be public
+PERF_INSTRUMENTATION = getattr(settings, 'PERF_INSTRUMENTATION', settings.DEBUG)
+
+# Most queries one request to each view may run, by URL name, measured on
+# QueryBudgetTests' fixture (five followed accounts) with a cold cache. The
+# tests fail above these, and also when a page's count changes as the fixture
+# grows to fifteen accounts, which is how per-row queries show up. Lower them
+# when a view gets cheaper.
+QUERY_BUDGETS = {
+    'home': 7,
+    'tweet_list': 7,
+    'tweet_detail': 11,
+    'hashtag_detail': 8,
+    'personalized_feed': 10,
+    'user_profile': 12,
+    'notifications_list': 8,
+    'conversations_list': 10,
+    'search': 11,
+    'tweet_list_api': 3,
+    'notifications_api': 3,
+    'personalized_feed_api': 6,
+    'notifications_count': 3,
+}
+
+# Slowest statements kept per request and per view
+SLOWEST_KEPT = 5
+
+_recorder = contextvars.ContextVar('perf_recorder', default=None)
+
+
+class RequestRecorder:
+    """Query count, DB and template time of the request being served"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        # Min-heap of (duration, sql) holding the slowest statements
+        self.slowest = []
+
+    def record_query(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        _keep_slowest(self.slowest, (duration, sql))
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """Server-Timing header value; template time includes queries run while rendering"""
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ])
+
+
+def _keep_slowest(heap, entry):
+    if len(heap) < SLOWEST_KEPT:
+        heapq.heappush(heap, entry)
+    elif entry > heap[0]:
+        heapq.heapreplace(heap, entry)
+
+
+def start_request():
+    """Begin recording for the current request; returns the token finish_request needs"""
+    return _recorder.set(RequestRecorder())
+
+
+def finish_request(token, url_name):
+    """Stop recording, fold the request into the per-view stats and return its recorder"""
+    recorder = _recorder.get()
+    _recorder.reset(token)
+    _record_view(url_name, recorder)
+    return recorder
+
+
+def _time_query(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.record_query(sql, time.perf_counter() - started)
+
+
+def instrument_connections(**kwargs):
+    """
+    Time queries on this thread's connections. request_started is sent on the
+    thread the request's ORM calls run on, under WSGI and ASGI alike.
+    """
+    from django.db import connections
+
+    for connection in connections.all():
+        if _time_query not in connection.execute_wrappers:
+            connection.execute_wrappers.append(_time_query)
+
+
+def _instrument_templates():
+    """Time top-level template renders (nested includes are part of their parent)"""
+    from django.template.backends.django import Template
+
+    render = Template.render
+    if getattr(render, 'perf_instrumented', False):
+        return
+
+    def timed_render(self, context=None, request=None):
+        recorder = _recorder.get()
+        if recorder is None:
+            return render(self, context, request)
+        recorder.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            recorder.template_depth -= 1
+            if not recorder.template_depth:
+                recorder.template_time += time.perf_counter() - started
+
+    timed_render.perf_instrumented = True
+    Template.render = timed_render
+
+
+def install():
+    """Hook query and template timing into this process (idempotent)"""
+    request_started.connect(instrument_connections, dispatch_uid='tweet.perf')
+    _instrument_templates()
+
+
+# Per-view aggregates for this process, keyed by URL name
+_lock = threading.Lock()
+_views = {}
+
+
+def _record_view(url_name, recorder):
+    budget = QUERY_BUDGETS.get(url_name)
+    with _lock:
+        stats = _views.setdefault(url_name, {
+            'requests': 0,
+            'queries': 0,
+            'max_queries': 0,
+            'over_budget': 0,
+            'total_time': 0.0,
+            'db_time': 0.0,
+            'template_time': 0.0,
+            'slowest': [],
+        })
+        stats['requests'] += 1
+        stats['queries'] += recorder.queries
+        stats['max_queries'] = max(stats['max_queries'], recorder.queries)
+        stats['over_budget'] += budget is not None and recorder.queries > budget
+        stats['total_time'] += recorder.total_time
+        stats['db_time'] += recorder.db_time
+        stats['template_time'] += recorder.template_time
+        for entry in recorder.slowest:
+            _keep_slowest(stats['slowest'], entry)
+
+
+def get_perf_stats():
+    """
+    Per-view request stats since this process started (or was reset), the
+    views spending the most time in the database first
+    """
+    with _lock:
+        views = {name: dict(stats, slowest=list(stats['slowest'])) for name, stats in _views.items()}
+
+    report = []
+    for name, stats in views.items():
+        requests = stats['requests']
+        report.append({
+            'view': name,
+            'requests': requests,
+            'query_budget': QUERY_BUDGETS.get(name),
+            'avg_queries': round(stats['queries'] / requests, 1),
+            'max_queries': stats['max_queries'],
+            'over_budget': stats['over_budget'],
+            'avg_ms': round(stats['total_time'] * 1000 / requests, 1),
+            'avg_db_ms': round(stats['db_time'] * 1000 / requests, 1),
+            'avg_template_ms': round(stats['template_time'] * 1000 / requests, 1),
+            'db_ms': round(stats['db_time'] * 1000, 1),
+            'slowest_queries': [
+                {'ms': round(duration * 1000, 2), 'sql': sql}
+                for duration, sql in sorted(stats['slowest'], reverse=True)
+            ],
+        })
+    return sorted(report, key=lambda view: view['db_ms'], reverse=True)
+
+
+def reset_perf_stats():
+    with _lock:
+        _views.clear()
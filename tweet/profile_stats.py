@@ -0,0 +1,53 @@
+from django.contrib.auth.models import User
+from django.db.models import F, Func, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from . import cache
+
+
+def _scalar(queryset, function='COUNT', field='pk'):
+    """Wrap COUNT/SUM over a correlated queryset as a scalar subquery"""
+    value = queryset.order_by().annotate(value=Func(F(field), function=function)).values('value')
+    return Coalesce(Subquery(value, output_field=IntegerField()), Value(0))
+
+
+def get_profile_stats(user, viewer=None):
+    """
+    Return follower/following/tweet/reply/like totals for a user in one query.
+    When a viewer is given, also count the user's followers the viewer follows.
+    """
+    from .models import Follow, Tweet
+
+    user_tweets = Tweet.objects.filter(user=OuterRef('pk'))
+
+    annotations = {
+        'followers': _scalar(Follow.objects.filter(following=OuterRef('pk'))),
+        'following': _scalar(Follow.objects.filter(follower=OuterRef('pk'))),
+        'tweets': _scalar(user_tweets),
+        'replies': _scalar(user_tweets.filter(parent_tweet__isnull=False)),
+        'likes_received': _scalar(user_tweets, 'SUM', 'likes_count'),
+    }
+    if viewer is not None and viewer.is_authenticated:
+        viewer_following = Follow.objects.filter(follower=viewer).values('following_id')
+        annotations['mutuals'] = _scalar(
+            Follow.objects.filter(following=OuterRef('pk'), follower_id__in=viewer_following)
+        )
+
+    # Aliased because names like 'following' clash with User's reverse relations
+    aliased = {f'stat_{name}': expression for name, expression in annotations.items()}
+    row = User.objects.filter(pk=user.pk).annotate(**aliased).values(*aliased).first() or {}
+    return {name: row.get(f'stat_{name}', 0) for name in annotations}
+
+
+def get_cached_profile_stats(user):
+    """
+    Viewer-independent profile stats, cached until a follow/like/tweet changes them
+    """
+    return cache.profile_stats.get_or_compute(lambda: get_profile_stats(user), user.pk)
+
+
+def invalidate_profile_stats(*user_ids):
+    """
+    Drop cached stats for the given users
+    """
+    cache.profile_stats.invalidate_many(user_ids)
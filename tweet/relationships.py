@@ -0,0 +1,127 @@
+from django.utils.functional import cached_property
+
+
+class RelationshipContext:
+    """
+    The viewer's follow/request/block/mute id sets, loaded at most once per
+    request so templates can check relationships without a query per user.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    @classmethod
+    def for_user(cls, user):
+        """Return the context attached to this user object, creating it on first use"""
+        context = getattr(user, '_relationship_context', None)
+        if context is None:
+            context = cls(user)
+            user._relationship_context = context
+        return context
+
+    def _ids(self, queryset, field):
+        if not self.user.is_authenticated:
+            return frozenset()
+        return frozenset(queryset.values_list(field, flat=True))
+
+    @cached_property
+    def following_ids(self):
+        from .models import Follow
+        return self._ids(Follow.objects.filter(follower=self.user), 'following_id')
+
+    @cached_property
+    def requested_ids(self):
+        from .models import FollowRequest
+        return self._ids(
+            FollowRequest.objects.filter(from_user=self.user, status='pending'), 'to_user_id'
+        )
+
+    @cached_property
+    def blocked_ids(self):
+        from .models import Block
+        return self._ids(Block.objects.filter(blocker=self.user), 'blocked_id')
+
+    @cached_property
+    def muted_ids(self):
+        from .models import Mute
+        return self._ids(Mute.objects.filter(muter=self.user), 'muted_id')
+
+    def is_following(self, target_user):
+        return getattr(target_user, 'pk', target_user) in self.following_ids
+
+    def has_requested(self, target_user):
+        return getattr(target_user, 'pk', target_user) in self.requested_ids
+
+    def is_blocked(self, target_user):
+        return getattr(target_user, 'pk', target_user) in self.blocked_ids
+
+    def is_muted(self, target_user):
+        return getattr(target_user, 'pk', target_user) in self.muted_ids
+
+    def invalidate(self):
+        """Forget loaded id sets after the viewer's relationships change"""
+        for name in ('following_ids', 'requested_ids', 'blocked_ids', 'muted_ids'):
+            self.__dict__.pop(name, None)
+
+
+class FollowGraph:
+    """
+    Service API over the Follow table, the single store of follow edges.
+    A viewer's own following set is read through their RelationshipContext,
+    so repeated is_following checks within a request cost no queries.
+    """
+
+    @staticmethod
+    def is_following(follower, target_user):
+        if not follower.is_authenticated:
+            return False
+        return RelationshipContext.for_user(follower).is_following(target_user)
+
+    @staticmethod
+    def followers_of(user):
+        """Users following user, most recent first"""
+        from django.contrib.auth.models import User
+        return User.objects.filter(following_set__following=user).order_by('-following_set__created_at')
+
+    @staticmethod
+    def following_of(user):
+        """Users that user follows, most recent first"""
+        from django.contrib.auth.models import User
+        return User.objects.filter(followers_set__follower=user).order_by('-followers_set__created_at')
+
+    @classmethod
+    def mutuals(cls, user, viewer):
+        """Followers of user whom viewer follows"""
+        return cls.followers_of(user).filter(followers_set__follower=viewer)
+
+    @staticmethod
+    def follow(follower, target_user):
+        """Create the follow edge; returns False if it already existed"""
+        from .models import Follow
+        _, created = Follow.objects.get_or_create(follower=follower, following=target_user)
+        RelationshipContext.for_user(follower).invalidate()
+        return created
+
+    @staticmethod
+    def unfollow(follower, target_user):
+        """Remove the follow edge; returns False if there was none"""
+        from .models import Follow
+        deleted, _ = Follow.objects.filter(follower=follower, following=target_user).delete()
+        RelationshipContext.for_user(follower).invalidate()
+        return bool(deleted)
+
+    @staticmethod
+    async def afollow(follower, target_user):
+        """follow() for async views"""
+        from .models import Follow
+        _, created = await Follow.objects.aget_or_create(follower=follower, following=target_user)
+        RelationshipContext.for_user(follower).invalidate()
+        return created
+
+    @staticmethod
+    async def aunfollow(follower, target_user):
+        """unfollow() for async views"""
+        from .models import Follow
+        deleted, _ = await Follow.objects.filter(follower=follower, following=target_user).adelete()
+        RelationshipContext.for_user(follower).invalidate()
+        return bool(deleted)
@@ -0,0 +1,183 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+SearchIndex = namedtuple('SearchIndex', ['fts_table', 'columns', 'pg_config'])
+
+# Searchable models, keyed by model label
+INDEXES = {
+    'tweet.tweet': SearchIndex('tweet_search_fts', ('text',), 'english'),
+    'auth.user': SearchIndex('user_search_fts', ('username', 'first_name', 'last_name'), 'simple'),
+    'tweet.hashtag': SearchIndex('hashtag_search_fts', ('name',), 'simple'),
+}
+
+MAX_TERMS = 8
+
+_TERM_RE = re.compile(r'\w+')
+
+
+def search_terms(query):
+    """Split a free-text query into lowercase word terms"""
+    return _TERM_RE.findall(query.lower())[:MAX_TERMS]
+
+
+class BaseSearchBackend:
+    """Interface shared by all search backends"""
+
+    def filter(self, queryset, query):
+        """
+        Restrict a Tweet/User/Hashtag queryset to matches of query, annotated
+        with search_rank (higher is more relevant)
+        """
+        raise NotImplementedError
+
+    def index(self, instance):
+        """Add or refresh one object in the index"""
+        self.index_many([instance])
+
+    def index_many(self, instances):
+        """Add or refresh several objects of one model in the index"""
+
+    def remove(self, model, pk):
+        """Drop an object from the index"""
+
+    def rebuild(self):
+        """Rebuild every index from the source tables"""
+
+    def _index_for(self, model):
+        return INDEXES[model._meta.label_lower]
+
+    def _no_results(self, queryset):
+        return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class BasicSearchBackend(BaseSearchBackend):
+    """Unindexed icontains matching, for databases without full-text support"""
+
+    def filter(self, queryset, query):
+        terms = search_terms(query)
+        if not terms:
+            return self._no_results(queryset)
+
+        columns = self._index_for(queryset.model).columns
+        for term in terms:
+            condition = Q()
+            for column in columns:
+                condition |= Q(**{f'{column}__icontains': term})
+            queryset = queryset.filter(condition)
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """FTS5 virtual tables whose rowid is the indexed object's primary key"""
+
+    def _match_expression(self, query):
+        # Quote every term and prefix-match it, so user input cannot inject FTS syntax
+        return ' '.join(f'"{term}"*' for term in search_terms(query))
+
+    def filter(self, queryset, query):
+        match = self._match_expression(query)
+        if not match:
+            return self._no_results(queryset)
+
+        table = self._index_for(queryset.model).fts_table
+        pk_column = f'"{queryset.model._meta.db_table}"."{queryset.model._meta.pk.column}"'
+        return queryset.filter(
+            pk__in=RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [match])
+        ).annotate(
+            # FTS5 rank is bm25, where more negative means more relevant
+            search_rank=RawSQL(
+                f'SELECT -rank FROM {table} WHERE {table} MATCH %s AND rowid = {pk_column}',
+                [match],
+                output_field=FloatField()
+            )
+        )
+
+    def index_many(self, instances):
+        instances = [instance for instance in instances if instance.pk]
+        if not instances:
+            return
+
+        search_index = self._index_for(type(instances[0]))
+        columns = ', '.join(search_index.columns)
+        placeholders = ', '.join(['%s'] * (len(search_index.columns) + 1))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {search_index.fts_table} (rowid, {columns}) VALUES ({placeholders})',
+                [
+                    [instance.pk] + [getattr(instance, column) or '' for column in search_index.columns]
+                    for instance in instances
+                ]
+            )
+
+    def remove(self, model, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self._index_for(model).fts_table} WHERE rowid = %s', [pk])
+
+    def rebuild(self):
+        from django.apps import apps
+
+        with connection.cursor() as cursor:
+            for label, search_index in INDEXES.items():
+                model = apps.get_model(label)
+                columns = ', '.join(search_index.columns)
+                cursor.execute(f'DELETE FROM {search_index.fts_table}')
+                cursor.execute(
+                    f'INSERT INTO {search_index.fts_table} (rowid, {columns}) '
+                    f'SELECT {model._meta.pk.column}, {columns} FROM {model._meta.db_table}'
+                )
+
+
+class PostgresFTSBackend(BaseSearchBackend):
+    """to_tsvector() expressions backed by GIN expression indexes; nothing to sync"""
+
+    @staticmethod
+    def document_sql(search_index, table=None):
+        """The indexed tsvector expression; must match the migration's CREATE INDEX"""
+        prefix = f'"{table}".' if table else ''
+        document = " || ' ' || ".join(f'{prefix}"{column}"' for column in search_index.columns)
+        return f"to_tsvector('{search_index.pg_config}', {document})"
+
+    def filter(self, queryset, query):
+        terms = search_terms(query)
+        if not terms:
+            return self._no_results(queryset)
+
+        search_index = self._index_for(queryset.model)
+        document = self.document_sql(search_index, queryset.model._meta.db_table)
+        tsquery = f"to_tsquery('{search_index.pg_config}', %s)"
+        prefix_query = ' & '.join(f'{term}:*' for term in terms)
+
+        return queryset.filter(
+            RawSQL(f'{document} @@ {tsquery}', [prefix_query], output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL(f'ts_rank({document}, {tsquery})', [prefix_query], output_field=FloatField())
+        )
+
+
+VENDOR_BACKENDS = {
+    'sqlite': 'tweet.search.SQLiteFTSBackend',
+    'postgresql': 'tweet.search.PostgresFTSBackend',
+}
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    """
+    Return the search backend named by settings.SEARCH_BACKEND, or pick one from
+    the database vendor: FTS5 on SQLite, tsvector/GIN on PostgreSQL, icontains otherwise
+    """
+    path = getattr(settings, 'SEARCH_BACKEND', None)
+    if not path:
+        path = VENDOR_BACKENDS.get(connection.vendor, 'tweet.search.BasicSearchBackend')
+        # FTS5 may be missing from the SQLite build, in which case the migration skipped it
+        if connection.vendor == 'sqlite' and \
+                INDEXES['tweet.tweet'].fts_table not in connection.introspection.table_names():
+            path = 'tweet.search.BasicSearchBackend'
+    return import_string(path)()
@@ -1,8 +1,15 @@
 from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile, Tweet, Comment
-from .utils import create_notification
+from .models import (
+    UserProfile, Tweet, Comment, Follow, Hashtag, TrendingHashtag, PopularSearch,
+    Notification, DirectMessage, ConversationReadState, TweetHashtag
+)
+from .utils import create_notification, invalidate_unread_counts
+from .counters import adjust_counter
+from .profile_stats import invalidate_profile_stats
+from .search import get_search_backend
+from . import cache, events
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -26,44 +33,52 @@ def save_user_profile(sender, instance, **kwargs):
 
 
 # Notification signals for likes
+def _queue_like_notifications(instance, liker_ids, noun, **target):
+    """Queue one like notification per liker, looking all likers up in one query"""
+    from .models import NotificationJob
+    from .notifications import enqueue_notifications, group_key_for
+    
+    group_key = group_key_for('like', **{f'{noun}_id': instance.pk})
+    likers = User.objects.filter(id__in=liker_ids).exclude(id=instance.user_id)
+    enqueue_notifications([
+        NotificationJob(
+            recipient_id=instance.user_id,
+            sender_id=liker_id,
+            notification_type='like',
+            message=f"{username} liked your {noun}",
+            group_key=group_key,
+            **target
+        )
+        for liker_id, username in likers.values_list('id', 'username')
+    ])
+
+
+def _queue_reverse_like_notifications(model, user, pk_set, noun):
+    """user.liked_<noun>s.add(...): queue one notification per liked object"""
+    for obj in model.objects.filter(pk__in=pk_set).exclude(user=user):
+        _queue_like_notifications(obj, [user.pk], noun, **{noun: obj})
+
+
 @receiver(m2m_changed, sender=Tweet.likes.through)
-def tweet_like_notification(sender, instance, action, pk_set, **kwargs):
+def tweet_like_notification(sender, instance, action, reverse, pk_set, **kwargs):
     """Send notification when someone likes a tweet"""
-    if action == 'post_add':
-        for user_id in pk_set:
-            if user_id != instance.user.id:  # Don't notify self
-                try:
-                    from django.contrib.auth.models import User
-                    liker = User.objects.get(id=user_id)
-                    create_notification(
-                        recipient=instance.user,
-                        sender=liker,
-                        notification_type='like',
-                        message=f"{liker.username} liked your tweet",
-                        tweet=instance
-                    )
-                except User.DoesNotExist:
-                    pass
+    if action != 'post_add':
+        return
+    if reverse:
+        _queue_reverse_like_notifications(Tweet, instance, pk_set, 'tweet')
+    else:
+        _queue_like_notifications(instance, pk_set, 'tweet', tweet=instance)
 
 
 @receiver(m2m_changed, sender=Comment.likes.through)
-def comment_like_notification(sender, instance, action, pk_set, **kwargs):
+def comment_like_notification(sender, instance, action, reverse, pk_set, **kwargs):
     """Send notification when someone likes a comment"""
-    if action == 'post_add':
-        for user_id in pk_set:
-            if user_id != instance.user.id:  # Don't notify self
-                try:
-                    from django.contrib.auth.models import User
-                    liker = User.objects.get(id=user_id)
-                    create_notification(
-                        recipient=instance.user,
-                        sender=liker,
-                        notification_type='like',
-                        message=f"{liker.username} liked your comment",
-                        comment=instance
-                    )
-                except User.DoesNotExist:
-                    pass
+    if action != 'post_add':
+        return
+    if reverse:
+        _queue_reverse_like_notifications(Comment, instance, pk_set, 'comment')
+    else:
+        _queue_like_notifications(instance, pk_set, 'comment', comment=instance)
 
 
 @receiver(post_save, sender=Comment)
@@ -95,3 +110,239 @@ def reply_notification(sender, instance, created, **kwargs):
                 message=f"{instance.user.username} replied to your tweet",
                 tweet=instance.parent_tweet
             )
+
+
+# Denormalized counter maintenance
+def _sync_likes_count(model, instance, action, reverse, pk_set, field_name):
+    """Keep model.likes_count in step with its likes M2M using F() updates"""
+    through = model.likes.through
+    pending_attr = f'_pending_{field_name}_unlikes'
+    
+    if not reverse:
+        # instance is the liked object, pk_set holds user ids
+        if action == 'post_add':
+            adjust_counter(model, [instance.pk], 'likes_count', len(pk_set))
+            instance.likes_count += len(pk_set)
+        elif action == 'pre_remove':
+            # pk_set may contain users that never liked it, so count the real rows
+            setattr(instance, pending_attr, through.objects.filter(
+                **{field_name: instance}, user_id__in=pk_set
+            ).count())
+        elif action == 'post_remove':
+            removed = getattr(instance, pending_attr, 0)
+            adjust_counter(model, [instance.pk], 'likes_count', -removed)
+            instance.likes_count = max(instance.likes_count - removed, 0)
+        elif action == 'post_clear':
+            model.objects.filter(pk=instance.pk).update(likes_count=0)
+            instance.likes_count = 0
+    else:
+        # instance is the user, pk_set holds ids of liked objects
+        if action == 'post_add':
+            adjust_counter(model, pk_set, 'likes_count', 1)
+        elif action in ('pre_remove', 'pre_clear'):
+            liked = through.objects.filter(user=instance)
+            if action == 'pre_remove':
+                liked = liked.filter(**{f'{field_name}_id__in': pk_set})
+            setattr(instance, pending_attr, list(liked.values_list(f'{field_name}_id', flat=True)))
+        elif action in ('post_remove', 'post_clear'):
+            adjust_counter(model, getattr(instance, pending_attr, []), 'likes_count', -1)
+
+
+@receiver(m2m_changed, sender=Tweet.likes.through)
+def tweet_likes_count(sender, instance, action, reverse, pk_set, **kwargs):
+    """Update Tweet.likes_count when likes are added or removed"""
+    _sync_likes_count(Tweet, instance, action, reverse, pk_set, 'tweet')
+
+
+@receiver(m2m_changed, sender=Comment.likes.through)
+def comment_likes_count(sender, instance, action, reverse, pk_set, **kwargs):
+    """Update Comment.likes_count when likes are added or removed"""
+    _sync_likes_count(Comment, instance, action, reverse, pk_set, 'comment')
+
+
+@receiver(post_save, sender=Tweet)
+def tweet_replies_count_add(sender, instance, created, **kwargs):
+    """Bump the parent's replies_count when a reply is posted"""
+    if created and instance.parent_tweet_id:
+        adjust_counter(Tweet, [instance.parent_tweet_id], 'replies_count', 1)
+
+
+@receiver(post_delete, sender=Tweet)
+def tweet_replies_count_remove(sender, instance, **kwargs):
+    """Drop the parent's replies_count when a reply is deleted"""
+    if instance.parent_tweet_id:
+        adjust_counter(Tweet, [instance.parent_tweet_id], 'replies_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+def tweet_comments_count_add(sender, instance, created, **kwargs):
+    """Bump the tweet's comments_count when a comment is posted"""
+    if created:
+        adjust_counter(Tweet, [instance.tweet_id], 'comments_count', 1)
+
+
+@receiver(post_delete, sender=Comment)
+def tweet_comments_count_remove(sender, instance, **kwargs):
+    """Drop the tweet's comments_count when a comment is deleted"""
+    adjust_counter(Tweet, [instance.tweet_id], 'comments_count', -1)
+
+
+@receiver(post_delete, sender=TweetHashtag)
+def hashtag_tweet_count_remove(sender, instance, **kwargs):
+    """Drop the hashtag's tweet_count when a tagged tweet is deleted"""
+    adjust_counter(Hashtag, [instance.hashtag_id], 'tweet_count', -1)
+
+
+# Profile stats cache invalidation
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def follow_profile_stats_invalidation(sender, instance, **kwargs):
+    """Drop cached follower/following counts for both ends of a follow change"""
+    if kwargs.get('created', True):
+        invalidate_profile_stats(instance.follower_id, instance.following_id)
+
+
+@receiver(m2m_changed, sender=Tweet.likes.through)
+def like_profile_stats_invalidation(sender, instance, action, reverse, pk_set, **kwargs):
+    """Drop cached likes-received totals for the authors of liked/unliked tweets"""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_profile_stats(instance.user_id)
+    else:
+        tweets = instance.liked_tweets.all() if action == 'pre_clear' else Tweet.objects.filter(pk__in=pk_set)
+        invalidate_profile_stats(*tweets.values_list('user_id', flat=True).distinct())
+
+
+@receiver(post_save, sender=Tweet)
+@receiver(post_delete, sender=Tweet)
+def tweet_profile_stats_invalidation(sender, instance, **kwargs):
+    """Drop cached tweet/reply totals for the tweet's author"""
+    if kwargs.get('created', True):
+        invalidate_profile_stats(instance.user_id)
+
+
+# Home timeline maintenance
+@receiver(post_save, sender=Follow)
+def follow_timeline_backfill(sender, instance, created, **kwargs):
+    """Copy the followed user's recent tweets into the follower's timeline"""
+    if created:
+        from .timeline import backfill_timeline
+        backfill_timeline(instance.follower, instance.following)
+
+
+@receiver(post_delete, sender=Follow)
+def unfollow_timeline_cleanup(sender, instance, **kwargs):
+    """Remove the unfollowed user's tweets from the follower's timeline"""
+    from .timeline import remove_from_timeline
+    remove_from_timeline(instance.follower, instance.following)
+
+
+# Full-text search index maintenance
+@receiver(post_save, sender=Tweet)
+def index_tweet_for_search(sender, instance, **kwargs):
+    """Add or refresh a tweet in the search index"""
+    get_search_backend().index(instance)
+
+
+@receiver(post_delete, sender=Tweet)
+def unindex_tweet_for_search(sender, instance, **kwargs):
+    """Remove a deleted tweet from the search index"""
+    get_search_backend().remove(Tweet, instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+def index_user_for_search(sender, instance, **kwargs):
+    """Add or refresh the profile's user in the search index"""
+    get_search_backend().index(instance.user)
+
+
+@receiver(post_delete, sender=User)
+def unindex_user_for_search(sender, instance, **kwargs):
+    """Remove a deleted user from the search index"""
+    get_search_backend().remove(User, instance.pk)
+
+
+@receiver(post_save, sender=Hashtag)
+def index_hashtag_for_search(sender, instance, created, **kwargs):
+    """Add a hashtag created outside of tweet linking to the search index"""
+    if created:
+        get_search_backend().index(instance)
+
+
+@receiver(post_delete, sender=Hashtag)
+def unindex_hashtag_for_search(sender, instance, **kwargs):
+    """Remove a deleted hashtag from the search index"""
+    get_search_backend().remove(Hashtag, instance.pk)
+
+
+# Cache invalidation
+@receiver(post_save, sender=Tweet)
+@receiver(post_delete, sender=Tweet)
+def tweet_fragment_invalidation(sender, instance, **kwargs):
+    """Drop the rendered body of an edited or deleted tweet"""
+    cache.tweet_fragments.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=TrendingHashtag)
+@receiver(post_delete, sender=TrendingHashtag)
+def trending_invalidation(sender, instance, **kwargs):
+    """Drop the cached trending list when a row is edited outside the refresh job"""
+    cache.trending.invalidate('top')
+
+
+@receiver(post_save, sender=PopularSearch)
+@receiver(post_delete, sender=PopularSearch)
+def popular_searches_invalidation(sender, instance, **kwargs):
+    """Drop the cached popular searches when a search is counted"""
+    cache.popular_searches.invalidate('top')
+
+
+@receiver(post_save, sender=Notification)
+@receiver(post_delete, sender=Notification)
+def notification_badge_invalidation(sender, instance, **kwargs):
+    """Drop the recipient's cached unread counts"""
+    invalidate_unread_counts(instance.recipient_id)
+
+
+@receiver(post_save, sender=DirectMessage)
+@receiver(post_delete, sender=DirectMessage)
+def message_badge_invalidation(sender, instance, created=False, **kwargs):
+    """Drop cached unread counts for everyone in the conversation and push new messages"""
+    participant_ids = list(instance.conversation.participants.values_list('id', flat=True))
+    invalidate_unread_counts(*participant_ids)
+    
+    if created:
+        events.publish(
+            [pk for pk in participant_ids if pk != instance.sender_id],
+            'message',
+            {
+                'id': instance.id,
+                'conversation_id': instance.conversation_id,
+                'sender': instance.sender.username,
+                'message_type': instance.message_type,
+                'content': instance.content,
+                'sent_at': instance.sent_at.isoformat(),
+            }
+        )
+
+
+@receiver(post_save, sender=ConversationReadState)
+def read_state_badge_invalidation(sender, instance, **kwargs):
+    """Drop the reader's cached unread counts when their read cursor moves"""
+    invalidate_unread_counts(instance.user_id)
+
+
+# Image derivatives
+@receiver(post_save, sender=Tweet)
+def tweet_photo_derivatives(sender, instance, update_fields=None, **kwargs):
+    """Queue a new photo's WebP derivatives for run_workers"""
+    from .images import queue_field_variants
+    queue_field_variants(instance, {'image': 'photo'}, update_fields)
+
+
+@receiver(post_save, sender=UserProfile)
+def profile_image_derivatives(sender, instance, update_fields=None, **kwargs):
+    """Queue the WebP derivatives of a new avatar or cover photo"""
+    from .images import queue_field_variants
+    queue_field_variants(instance, {'avatar': 'avatar', 'cover_photo': 'cover'}, update_fields)
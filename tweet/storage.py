@@ -0,0 +1,184 @@
+import hashlib
+import os
+import uuid
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+
+from .uploads import file_sha256
+
+# Blobs live under MEDIA_ROOT so that names can be hard links to them (links
+# can't cross filesystems). The dot keeps the directory out of what the web
+# server publishes under MEDIA_URL.
+BLOB_DIR = '.blobs'
+
+# Under BLOB_DIR: one symlink per blob, named by its inode and pointing at its
+# digest. Every name shares its blob's inode, so delete() can find the blob
+# without reading the file.
+INODE_DIR = 'inodes'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that keeps each distinct file once, as a blob named
+    by its SHA-256 under BLOB_DIR, and saves every name as a hard link to its
+    blob. The same meme forwarded in a hundred DMs is one blob and a hundred
+    directory entries; saving a duplicate writes nothing new to disk.
+
+    A blob's link count is its reference count: names are added with
+    os.link() and deleting or overwriting the last one removes the blob.
+    Uploads that carry their digest (StreamingUploadHandler, SpooledUpload)
+    aren't read again.
+    """
+
+    def blob_path(self, digest):
+        return os.path.join(self.location, BLOB_DIR, digest[:2], digest[2:4], digest)
+
+    def inode_path(self, inode):
+        return os.path.join(self.location, BLOB_DIR, INODE_DIR, f'{inode % 256:02x}', str(inode))
+
+    def index_blob(self, blob, digest):
+        """Record the digest of the blob's inode, for delete()"""
+        link = self.inode_path(os.stat(blob).st_ino)
+        self._makedirs(os.path.dirname(link))
+        replacement = f'{link}.{uuid.uuid4().hex}.tmp'
+        os.symlink(digest, replacement)
+        os.replace(replacement, link)
+
+    def _unindex_blob(self, inode):
+        try:
+            os.remove(self.inode_path(inode))
+        except FileNotFoundError:
+            pass
+
+    def _blob_for(self, path, stat):
+        """Path of the blob the name at path links to, or None"""
+        try:
+            blob = self.blob_path(os.readlink(self.inode_path(stat.st_ino)))
+            if os.path.samefile(blob, path):
+                return blob
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+        # Stored before the index existed, or restored onto another filesystem
+        blob = self.blob_path(file_sha256(path))
+        try:
+            if os.path.samefile(blob, path):
+                return blob
+        except FileNotFoundError:
+            pass
+        return None
+
+    def _makedirs(self, directory):
+        if self.directory_permissions_mode is None:
+            os.makedirs(directory, exist_ok=True)
+            return
+        # os.makedirs() doesn't apply mode to intermediate directories
+        old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+        try:
+            os.makedirs(directory, self.directory_permissions_mode, exist_ok=True)
+        finally:
+            os.umask(old_umask)
+
+    def _store_blob(self, content):
+        """Make sure content's blob exists and return its path"""
+        if hasattr(content, 'temporary_file_path'):
+            path = content.temporary_file_path()
+            digest = getattr(content, 'sha256', None) or file_sha256(path)
+            blob = self.blob_path(digest)
+            if not os.path.exists(blob):
+                self._makedirs(os.path.dirname(blob))
+                try:
+                    file_move_safe(path, blob)
+                except FileExistsError:
+                    # Saved concurrently; the upload is a duplicate after all
+                    pass
+                else:
+                    self._set_permissions(blob)
+                    self.index_blob(blob, digest)
+            return blob
+
+        # Spool to a temporary file beside the blobs, hashing on the way
+        spool_dir = os.path.join(self.location, BLOB_DIR, 'tmp')
+        self._makedirs(spool_dir)
+        spool = os.path.join(spool_dir, uuid.uuid4().hex)
+        sha256 = hashlib.sha256()
+        with open(spool, 'wb') as f:
+            for chunk in content.chunks():
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                sha256.update(chunk)
+                f.write(chunk)
+
+        digest = sha256.hexdigest()
+        blob = self.blob_path(digest)
+        try:
+            self._makedirs(os.path.dirname(blob))
+            os.link(spool, blob)
+        except FileExistsError:
+            pass
+        else:
+            self._set_permissions(blob)
+            self.index_blob(blob, digest)
+        finally:
+            os.remove(spool)
+        return blob
+
+    def _set_permissions(self, path):
+        if self.file_permissions_mode is not None:
+            os.chmod(path, self.file_permissions_mode)
+        self._ensure_location_group_id(path)
+
+    def _save(self, name, content):
+        blob = self._store_blob(content)
+
+        full_path = self.path(name)
+        self._makedirs(os.path.dirname(full_path))
+        while True:
+            try:
+                if self._allow_overwrite:
+                    replaced = self._last_link_blob(full_path)
+                    replacement = f'{full_path}.{uuid.uuid4().hex}.tmp'
+                    os.link(blob, replacement)
+                    os.replace(replacement, full_path)
+                    if replaced:
+                        self._remove_if_unused(replaced)
+                else:
+                    os.link(blob, full_path)
+            except FileExistsError:
+                name = self.get_available_name(name)
+                full_path = self.path(name)
+            else:
+                break
+
+        name = os.path.relpath(full_path, self.location)
+        return str(name).replace('\\', '/')
+
+    def _last_link_blob(self, path):
+        """The blob of the name at path if that name is its only one, else None"""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return self._blob_for(path, stat) if stat.st_nlink == 2 else None
+
+    def _remove_if_unused(self, blob):
+        try:
+            stat = os.stat(blob)
+            if stat.st_nlink == 1:
+                os.remove(blob)
+                self._unindex_blob(stat.st_ino)
+        except FileNotFoundError:
+            pass
+
+    def delete(self, name):
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        path = self.path(name)
+        try:
+            # The last name for its blob takes the blob with it
+            blob = self._last_link_blob(path)
+        except FileNotFoundError:
+            return
+        super().delete(name)
+        if blob:
+            self._remove_if_unused(blob)
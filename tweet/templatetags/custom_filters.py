@@ -1,36 +1,31 @@
 from django import template
+from django.utils.html import format_html_join
 from django.utils.safestring import mark_safe
-from django.urls import reverse
-import re
+
+from ..relationships import RelationshipContext
 
 register = template.Library()
 
 @register.filter
 def highlight_hashtags(text):
     """Convert hashtags to clickable links"""
-    def replace_hashtag(match):
-        hashtag = match.group(1)
-        url = reverse('hashtag_detail', kwargs={'hashtag_name': hashtag})
-        return f'<a href="{url}" class="text-primary text-decoration-none">#{hashtag}</a>'
-    
-    return mark_safe(re.sub(r'#(\w+)', replace_hashtag, text))
+    from ..entities import render_entities
+    return render_entities(text, sigils='#')
 
 @register.filter
 def highlight_mentions(text):
     """Convert mentions to clickable links"""
-    def replace_mention(match):
-        username = match.group(1)
-        url = reverse('user_profile', kwargs={'username': username})
-        return f'<a href="{url}" class="text-info text-decoration-none">@{username}</a>'
-    
-    return mark_safe(re.sub(r'@(\w+)', replace_mention, text))
+    from ..entities import render_entities
+    return render_entities(text, sigils='@')
 
 @register.filter
 def format_tweet_text(text):
-    """Apply both hashtag and mention highlighting"""
-    text = highlight_hashtags(text)
-    text = highlight_mentions(text)
-    return text
+    """
+    Apply both hashtag and mention highlighting. For tweets, prefer
+    tweet.get_text_html, which uses the offsets found when it was saved.
+    """
+    from ..entities import render_entities
+    return render_entities(text)
 
 @register.filter
 def unread_notifications_count(user):
@@ -38,8 +33,8 @@ def unread_notifications_count(user):
     if not user.is_authenticated:
         return 0
     
-    from ..models import Notification
-    return Notification.objects.filter(recipient=user, is_read=False).count()
+    from ..utils import get_unread_counts
+    return get_unread_counts(user)['notifications']
 
 @register.filter
 def unread_messages_count(user):
@@ -47,14 +42,8 @@ def unread_messages_count(user):
     if not user.is_authenticated:
         return 0
     
-    from ..models import DirectMessage
-    return DirectMessage.objects.filter(
-        conversation__participants=user
-    ).exclude(
-        sender=user
-    ).exclude(
-        read_by=user
-    ).count()
+    from ..utils import get_unread_counts
+    return get_unread_counts(user)['messages']
 
 @register.filter
 def is_following(user, target_user):
@@ -62,8 +51,7 @@ def is_following(user, target_user):
     if not user.is_authenticated:
         return False
     
-    from ..models import Follow
-    return Follow.objects.filter(follower=user, following=target_user).exists()
+    return RelationshipContext.for_user(user).is_following(target_user)
 
 @register.filter
 def follow_status(user, target_user):
@@ -71,14 +59,14 @@ def follow_status(user, target_user):
     if not user.is_authenticated or user == target_user:
         return 'self'
     
-    from ..models import Follow, FollowRequest
+    relationships = RelationshipContext.for_user(user)
     
     # Check if already following
-    if Follow.objects.filter(follower=user, following=target_user).exists():
+    if relationships.is_following(target_user):
         return 'following'
     
     # Check if follow request is pending
-    if FollowRequest.objects.filter(from_user=user, to_user=target_user, status='pending').exists():
+    if relationships.has_requested(target_user):
         return 'requested'
     
     return 'not_following'
@@ -89,8 +77,7 @@ def is_blocked(user, target_user):
     if not user.is_authenticated:
         return False
     
-    from ..models import Block
-    return Block.objects.filter(blocker=user, blocked=target_user).exists()
+    return RelationshipContext.for_user(user).is_blocked(target_user)
 
 @register.filter
 def is_muted(user, target_user):
@@ -98,20 +85,19 @@ def is_muted(user, target_user):
     if not user.is_authenticated:
         return False
     
-    from ..models import Mute
-    return Mute.objects.filter(muter=user, muted=target_user).exists()
+    return RelationshipContext.for_user(user).is_muted(target_user)
 
 @register.simple_tag
 def trending_hashtags(limit=5):
     """Get trending hashtags"""
-    from ..models import TrendingHashtag
-    return TrendingHashtag.objects.select_related('hashtag')[:limit]
+    from ..utils import get_trending_hashtags
+    return get_trending_hashtags(limit)
 
 @register.simple_tag
 def popular_searches(limit=5):
     """Get popular search terms"""
-    from ..models import PopularSearch
-    return PopularSearch.objects.all()[:limit]
+    from ..utils import get_popular_searches
+    return get_popular_searches(limit)
 
 # Badge components removed - using simple_tag versions below
 
@@ -122,10 +108,11 @@ def notification_badge(user):
         return ""
     
     try:
-        from ..models import Notification
-        count = Notification.objects.filter(recipient=user, is_read=False).count()
-        if count > 0:
-            return mark_safe(f'<span class="position-absolute top-0 start-100 translate-middle badge rounded-pill bg-danger">{count}</span>')
+        from ..utils import get_unread_counts
+        count = get_unread_counts(user)['notifications']
+        # Rendered even when empty so the event stream can fill it in
+        hidden = '' if count > 0 else ' d-none'
+        return mark_safe(f'<span class="notification-badge position-absolute top-0 start-100 translate-middle badge rounded-pill bg-danger{hidden}">{count}</span>')
     except Exception:
         pass
     return ""
@@ -137,24 +124,37 @@ def message_badge(user):
         return ""
     
     try:
-        from ..models import Conversation, DirectMessage
-        unread_count = 0
+        from ..utils import get_unread_counts
+        unread_count = get_unread_counts(user)['conversations']
         
-        # Get all conversations for the user
-        conversations = Conversation.objects.filter(participants=user)
-        
-        for conversation in conversations:
-            # Count unread messages in this conversation
-            unread_messages = DirectMessage.objects.filter(
-                conversation=conversation
-            ).exclude(sender=user).exclude(read_by=user)
-            
-            if unread_messages.exists():
-                unread_count += 1
-        
-        if unread_count > 0:
-            return mark_safe(f'<span class="position-absolute top-0 start-100 translate-middle badge rounded-pill bg-danger">{unread_count}</span>')
+        hidden = '' if unread_count > 0 else ' d-none'
+        return mark_safe(f'<span class="message-badge position-absolute top-0 start-100 translate-middle badge rounded-pill bg-danger{hidden}">{unread_count}</span>')
     except Exception:
         pass
     
     return ""
+
+@register.simple_tag
+def tweet_body(tweet):
+    """Render a tweet's text, image and hashtags, cached until the tweet changes"""
+    from django.template.loader import render_to_string
+    from ..cache import tweet_fragments
+    
+    html = tweet_fragments.get_or_compute(
+        lambda: render_to_string('components/tweet_body.html', {'tweet': tweet}),
+        tweet.pk
+    )
+    return mark_safe(html)
+
+
+@register.simple_tag
+def img_attrs(image, kind, size=None):
+    """
+    src/srcset attributes serving WebP derivatives of an uploaded image, e.g.
+    <img {% img_attrs profile.avatar 'avatar' 40 %} alt="...">; kind is
+    'avatar' (size = displayed px), 'photo' or 'cover'
+    """
+    if not image:
+        return ''
+    from ..images import image_attrs
+    return format_html_join(' ', '{}="{}"', image_attrs(image, kind, size).items())
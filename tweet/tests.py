@@ -1,3 +1,1329 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import os
+import re
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache as default_cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from . import events, notifications
+from .cache import get_cache_stats, reset_cache_stats
+from .entities import link_tweet_entities
+from .images import render_pending_variants, variant_name
+from .likes import toggle_like
+from .models import (
+    Block, ChunkedUpload, Comment, Conversation, DirectMessage, Follow, FollowRequest, Hashtag,
+    HashtagActivityBucket, ImageDerivativeJob, Mute, Notification, NotificationJob, TimelineEntry,
+    TrendingHashtag, Tweet, TweetHashtag, UserProfile
+)
+from .notifications import aggregate_message, deliver_notification_batch, deliver_pending_notifications
+from .perf import QUERY_BUDGETS, get_perf_stats, reset_perf_stats
+from .pagination import decode_cursor, encode_cursor, keyset_filter, paginate_keyset
+from .profile_stats import get_cached_profile_stats, get_profile_stats
+from .relationships import FollowGraph
+from .search import BasicSearchBackend, SQLiteFTSBackend, get_search_backend
+from .storage import ContentAddressedStorage
+from . import timeline
+from .timeline import get_timeline_tweets
+from .utils import (
+    create_notification, create_notifications, get_trending_hashtags, get_unread_conversations_count, get_unread_counts, get_unread_messages_count, mark_all_notifications_read,
+    mark_conversation_read, search_tweets, with_unread_counts
+)
+from . import views
+
+# A SQLite plan step that walks a whole table rather than an index. Ordered
+# walks of an index ("SCAN t USING INDEX") are fine: pages stop at their LIMIT.
+SQLITE_FULL_SCAN = re.compile(r'\bSCAN (?!.*\b(USING|VIRTUAL TABLE INDEX)\b)')
+
+
+class QueryPlanTests(TestCase):
+    """The main query behind each listing view must be answered from an index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer')
+        cls.author = User.objects.create_user('author')
+        Follow.objects.create(follower=cls.viewer, following=cls.author)
+        cls.hashtag = Hashtag.objects.create(name='django')
+        # A cursor, so deep pages are checked as well as the first one
+        cls.cursor = (timezone.now(), 1000)
+
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+        self.request.user = self.viewer
+
+    def assertNoFullScan(self, queryset):
+        if connection.vendor == 'postgresql':
+            # Tiny test tables make a seq scan cheapest, so forbid it unless unavoidable
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+            self.assertNotIn('Seq Scan', plan, plan)
+        elif connection.vendor == 'sqlite':
+            plan = queryset.explain()
+            self.assertIsNone(SQLITE_FULL_SCAN.search(plan), plan)
+        else:
+            self.skipTest(f'No plan check for {connection.vendor}')
+
+    def page(self, queryset):
+        return keyset_filter(queryset, self.cursor).order_by('-created_at', '-id')[:21]
+
+    def test_tweet_list(self):
+        self.assertNoFullScan(self.page(views._tweet_list_queryset(self.request, '')))
+
+    def test_hashtag_detail(self):
+        self.assertNoFullScan(self.page(views._hashtag_tweets(self.request, self.hashtag)))
+
+    def test_personalized_feed(self):
+        self.assertNoFullScan(get_timeline_tweets(self.viewer, limit=51, before=self.cursor))
+
+    def test_user_profile(self):
+        self.assertNoFullScan(
+            Tweet.objects.filter(user=self.author, parent_tweet__isnull=True).order_by('-created_at')
+        )
+
+    def test_search(self):
+        self.assertNoFullScan(search_tweets('django', user=self.viewer))
+
+    def test_fan_out_followers(self):
+        self.assertNoFullScan(
+            Follow.objects.filter(following=self.author).order_by().values_list('follower_id', flat=True)
+        )
+
+    def test_trending_buckets(self):
+        self.assertNoFullScan(
+            HashtagActivityBucket.objects.filter(bucket_start__gte=timezone.now() - timedelta(days=7))
+        )
+
+
+class CacheInvalidationTests(TestCase):
+    """Cached reads are dropped by the signals that change them (runs on locmem)"""
+
+    def setUp(self):
+        default_cache.clear()
+        reset_cache_stats()
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+
+    def test_profile_stats_follow(self):
+        self.assertEqual(get_cached_profile_stats(self.alice)['followers'], 0)
+        Follow.objects.create(follower=self.bob, following=self.alice)
+        self.assertEqual(get_cached_profile_stats(self.alice)['followers'], 1)
+        self.assertEqual(get_cached_profile_stats(self.bob)['following'], 1)
+
+    def test_unread_counts(self):
+        self.assertEqual(get_unread_counts(self.alice)['notifications'], 0)
+        Notification.objects.create(
+            recipient=self.alice, sender=self.bob, notification_type='follow', message='hi'
+        )
+        self.assertEqual(get_unread_counts(self.alice)['notifications'], 1)
+        mark_all_notifications_read(self.alice)
+        self.assertEqual(get_unread_counts(self.alice)['notifications'], 0)
+
+    def test_tweet_fragment_edit(self):
+        tweet = Tweet.objects.create(user=self.alice, text='first draft')
+        template = Template('{% load custom_filters %}{% tweet_body tweet %}')
+        self.assertIn('first draft', template.render(Context({'tweet': tweet})))
+        tweet.text = 'second draft'
+        tweet.save()
+        self.assertIn('second draft', template.render(Context({'tweet': tweet})))
+
+    def test_hit_miss_counters(self):
+        get_cached_profile_stats(self.alice)
+        with self.assertNumQueries(0):
+            get_cached_profile_stats(self.alice)
+        stats = get_cache_stats()['profile_stats']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+
+class ProfileStatsTests(TestCase):
+    """Profile stats are one query and the cached copy follows follows, tweets and likes"""
+
+    def setUp(self):
+        default_cache.clear()
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.carol = User.objects.create_user('carol')
+        Follow.objects.create(follower=self.bob, following=self.alice)
+        Follow.objects.create(follower=self.carol, following=self.alice)
+        Follow.objects.create(follower=self.bob, following=self.carol)
+        tweet = Tweet.objects.create(user=self.alice, text='hello')
+        Tweet.objects.create(user=self.alice, text='re', parent_tweet=tweet)
+        tweet.likes.add(self.bob, self.carol)
+
+    def test_one_query(self):
+        with self.assertNumQueries(1):
+            stats = get_profile_stats(self.alice, viewer=self.bob)
+        self.assertEqual(stats, {
+            'followers': 2, 'following': 0, 'tweets': 2, 'replies': 1, 'likes_received': 2, 'mutuals': 1,
+        })
+        with self.assertNumQueries(1):
+            get_cached_profile_stats(self.alice)
+        with self.assertNumQueries(0):
+            get_cached_profile_stats(self.alice)
+
+    def test_invalidation(self):
+        def stats():
+            return get_cached_profile_stats(self.alice)
+
+        self.assertEqual(stats()['followers'], 2)
+        follow = Follow.objects.create(follower=self.alice, following=self.bob)
+        self.assertEqual(stats()['following'], 1)
+        follow.delete()
+        self.assertEqual(stats()['following'], 0)
+        Follow.objects.filter(follower=self.carol).get().delete()
+        self.assertEqual(stats()['followers'], 1)
+        tweet = Tweet.objects.create(user=self.alice, text='another')
+        self.assertEqual(stats()['tweets'], 3)
+        tweet.likes.add(self.bob)
+        self.assertEqual(stats()['likes_received'], 3)
+        tweet.delete()
+        self.assertEqual((stats()['tweets'], stats()['likes_received']), (2, 2))
+
+
+class EventStreamTests(TestCase):
+    """Events reach a user's open stream through the in-process broker"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+
+    @async_to_sync
+    async def next_event(self, publish, heartbeat=events.HEARTBEAT_INTERVAL):
+        stream = events.listen(self.alice.pk, heartbeat)
+        pending = asyncio.ensure_future(anext(stream))
+        # Let the listener subscribe before anything is published
+        await asyncio.sleep(0)
+        await sync_to_async(publish)()
+        try:
+            return await asyncio.wait_for(pending, 1)
+        finally:
+            await stream.aclose()
+
+    def test_published_after_commit(self):
+        def publish():
+            with self.captureOnCommitCallbacks(execute=True):
+                Notification.objects.create(
+                    recipient=self.alice, notification_type='follow', message='hi'
+                )
+        self.assertEqual(self.next_event(publish), ('counts', None))
+
+    def test_heartbeat_when_idle(self):
+        self.assertIsNone(self.next_event(lambda: None, heartbeat=0.01))
+
+    def test_stream_only_under_asgi(self):
+        self.client.force_login(self.alice)
+        # A WSGI worker can't be parked on an endless stream
+        self.assertEqual(self.client.get(reverse('event_stream')).status_code, 204)
+
+        self.async_client.force_login(self.alice)
+
+        @async_to_sync
+        async def first_chunk():
+            response = await self.async_client.get(reverse('event_stream'))
+            stream = response.streaming_content
+            try:
+                return response['Content-Type'], await anext(stream)
+            finally:
+                await stream.aclose()
+        self.assertEqual(first_chunk(), ('text/event-stream', b'retry: 5000\n\n'))
+
+    def test_redis_reader_restarts(self):
+        broker = events.RedisBroker('redis://localhost:1/0')
+        attempts = mock.AsyncMock(side_effect=[ConnectionError('gone'), asyncio.CancelledError()])
+        with mock.patch.object(broker, '_read_subscription', attempts), \
+                mock.patch.object(events, 'RECONNECT_DELAY', 0), \
+                self.assertLogs('tweet.events', 'ERROR'):
+            with self.assertRaises(asyncio.CancelledError):
+                async_to_sync(broker._read)()
+        # Resubscribed, asking open streams to refetch what they missed
+        self.assertEqual([c.kwargs for c in attempts.call_args_list], [{'resync': False}, {'resync': True}])
+
+
+class TimelineTests(TestCase):
+    """Tweets are written into followers' timelines, or merged in at read time for large accounts"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.followers = [User.objects.create_user(f'follower{i}') for i in range(5)]
+        for follower in self.followers:
+            Follow.objects.create(follower=follower, following=self.author)
+
+    def test_fan_out_on_write(self):
+        # Several batches, so the follower ids are streamed rather than loaded at once
+        with mock.patch.object(timeline, 'BATCH_SIZE', 2):
+            tweet = Tweet.objects.create(user=self.author, text='hello')
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(tweet=tweet).values_list('user_id', flat=True)),
+            {self.author.pk, *(follower.pk for follower in self.followers)}
+        )
+        self.assertFalse(UserProfile.objects.get(user=self.author).timeline_fanout_on_read)
+
+    def test_fan_out_on_read(self):
+        with mock.patch.object(timeline, 'FANOUT_MAX_FOLLOWERS', 4):
+            tweet = Tweet.objects.create(user=self.author, text='hello')
+        # Only the author's own timeline is written to
+        self.assertEqual(
+            list(TimelineEntry.objects.filter(tweet=tweet).values_list('user_id', flat=True)), [self.author.pk]
+        )
+        self.assertTrue(UserProfile.objects.get(user=self.author).timeline_fanout_on_read)
+
+        reader = self.followers[0]
+        other = User.objects.create_user('other')
+        Follow.objects.create(follower=reader, following=other)
+        newer = Tweet.objects.create(user=other, text='fanned out on write')
+        self.assertEqual(list(get_timeline_tweets(reader)), [newer, tweet])
+        # Not merged into timelines of accounts that don't follow the author
+        self.assertEqual(list(get_timeline_tweets(other)), [newer])
+
+
+class ReadCursorTests(TestCase):
+    """Unread state comes from one read cursor per participant and conversation"""
+
+    def setUp(self):
+        default_cache.clear()
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.carol = User.objects.create_user('carol')
+        self.chats = []
+        for other in (self.bob, self.carol):
+            conversation = Conversation.objects.create()
+            conversation.participants.add(self.alice, other)
+            self.chats.append(conversation)
+
+    def send(self, conversation, sender, count=1):
+        return [
+            DirectMessage.objects.create(conversation=conversation, sender=sender, content=f'message {i}')
+            for i in range(count)
+        ]
+
+    def test_unread_counts(self):
+        self.send(self.chats[0], self.bob, 3)
+        self.send(self.chats[1], self.carol, 2)
+        # Alice's own messages are never unread to her
+        self.send(self.chats[1], self.alice)
+        # One query each, however many conversations there are
+        with self.assertNumQueries(1):
+            self.assertEqual(get_unread_conversations_count(self.alice), 2)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_unread_messages_count(self.alice), 5)
+
+        mark_conversation_read(self.chats[0], self.alice)
+        self.assertEqual(get_unread_counts(self.alice)['conversations'], 1)
+        self.assertEqual(get_unread_counts(self.alice)['messages'], 2)
+        self.assertEqual(get_unread_counts(self.bob)['messages'], 0)
+
+        # A new message invalidates the cached counts
+        self.send(self.chats[0], self.bob)
+        self.assertEqual(get_unread_counts(self.alice)['conversations'], 2)
+
+    def test_cursor_only_moves_forward(self):
+        first, second, third = self.send(self.chats[0], self.bob, 3)
+        second.mark_as_read(self.alice)
+        self.assertTrue(first.is_read_by(self.alice))
+        self.assertTrue(second.is_read_by(self.alice))
+        self.assertFalse(third.is_read_by(self.alice))
+        # Reading an older message again doesn't move the cursor back
+        first.mark_as_read(self.alice)
+        self.assertTrue(second.is_read_by(self.alice))
+        self.assertEqual(self.chats[0].get_unread_count(self.alice), 1)
+
+        # Marking the whole conversation read is one UPDATE of the cursor
+        with self.assertNumQueries(1):
+            mark_conversation_read(self.chats[0], self.alice)
+        self.assertTrue(third.is_read_by(self.alice))
+
+    def test_with_unread_counts(self):
+        self.send(self.chats[0], self.bob, 2)
+        conversations = with_unread_counts(Conversation.objects.filter(participants=self.alice), self.alice)
+        self.assertEqual(
+            {conversation.pk: conversation.unread_count for conversation in conversations},
+            {self.chats[0].pk: 2, self.chats[1].pk: 0}
+        )
+
+
+class TrendingTests(TestCase):
+    """Hashtag activity is bucketed on save and turned into trends by the worker"""
+
+    def setUp(self):
+        default_cache.clear()
+        self.alice = User.objects.create_user('alice')
+
+    def run_worker(self):
+        # The worker refreshes trends before its first batch; stop it once the queue is empty
+        with mock.patch('time.sleep', side_effect=KeyboardInterrupt):
+            call_command('run_workers', stdout=io.StringIO())
+
+    def test_worker_refreshes_trending(self):
+        for text in ('#django rocks', '#django again', '#python too'):
+            Tweet.objects.create(user=self.alice, text=text)
+        self.assertEqual(get_trending_hashtags(), [])
+
+        self.run_worker()
+        trending = get_trending_hashtags()
+        self.assertEqual([trend.hashtag.name for trend in trending], ['django', 'python'])
+        self.assertEqual(trending[0].tweets_last_24h, 2)
+
+    def test_old_buckets_pruned(self):
+        hashtag = Hashtag.objects.create(name='stale')
+        HashtagActivityBucket.objects.create(
+            hashtag=hashtag, bucket_start=timezone.now() - timedelta(days=8), count=5
+        )
+        self.run_worker()
+        self.assertFalse(HashtagActivityBucket.objects.exists())
+        self.assertFalse(TrendingHashtag.objects.exists())
+
+
+class VisibilityTests(TestCase):
+    """Tweet.objects.visible_to applies privacy, blocks and mutes"""
+
+    def setUp(self):
+        self.viewer = User.objects.create_user('viewer')
+        self.author = User.objects.create_user('author')
+        self.public = Tweet.objects.create(user=self.author, text='public')
+        self.private = Tweet.objects.create(user=self.author, text='private', privacy='private')
+        self.own = Tweet.objects.create(user=self.viewer, text='mine', privacy='private')
+
+    def visible(self, user):
+        return set(Tweet.objects.visible_to(user).values_list('text', flat=True))
+
+    def test_anonymous(self):
+        self.assertEqual(self.visible(None), {'public'})
+        self.assertEqual(self.visible(AnonymousUser()), {'public'})
+
+    def test_privacy(self):
+        self.assertEqual(self.visible(self.viewer), {'public', 'mine'})
+        Follow.objects.create(follower=self.viewer, following=self.author)
+        self.assertEqual(self.visible(self.viewer), {'public', 'private', 'mine'})
+        self.assertEqual(self.visible(self.author), {'public', 'private'})
+
+    def test_blocks_hide_both_ways(self):
+        Follow.objects.create(follower=self.viewer, following=self.author)
+        Follow.objects.create(follower=self.author, following=self.viewer)
+        block = Block.objects.create(blocker=self.viewer, blocked=self.author)
+        self.assertEqual(self.visible(self.viewer), {'mine'})
+        self.assertEqual(self.visible(self.author), {'public', 'private'})
+        block.delete()
+        Block.objects.create(blocker=self.author, blocked=self.viewer)
+        self.assertEqual(self.visible(self.viewer), {'mine'})
+        self.assertEqual(self.visible(self.author), {'public', 'private'})
+
+    def test_mutes_hide_from_the_muter(self):
+        Follow.objects.create(follower=self.viewer, following=self.author)
+        Follow.objects.create(follower=self.author, following=self.viewer)
+        Mute.objects.create(muter=self.viewer, muted=self.author)
+        self.assertEqual(self.visible(self.viewer), {'mine'})
+        # Muting is silent: the muted account still sees the muter's tweets
+        self.assertEqual(self.visible(self.author), {'public', 'private', 'mine'})
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages walk a listing newest first without skipping or repeating rows"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.tweets = [Tweet.objects.create(user=self.alice, text=f'tweet {i}') for i in range(5)]
+        # Ties on created_at are broken by id
+        Tweet.objects.filter(pk__in=[tweet.pk for tweet in self.tweets[1:4]]).update(
+            created_at=self.tweets[0].created_at
+        )
+        self.expected = list(Tweet.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_cursor_round_trip(self):
+        created_at = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor(created_at, 42)), (created_at, 42))
+        for garbage in (None, '', 'not-a-cursor', '!!!'):
+            self.assertIsNone(decode_cursor(garbage))
+
+    def test_pages(self):
+        seen, before = [], None
+        while True:
+            page = paginate_keyset(Tweet.objects.all(), before=before, per_page=2)
+            seen.extend(tweet.pk for tweet in page)
+            if not page.has_next:
+                break
+            before = page.next_cursor
+        self.assertEqual(seen, self.expected)
+        self.assertIsNone(page.next_cursor)
+
+    def test_api(self):
+        response = self.client.get(reverse('tweet_list_api'))
+        data = response.json()
+        self.assertEqual([tweet['id'] for tweet in data['results']], self.expected)
+        self.assertFalse(data['has_next'])
+
+        last = Tweet.objects.get(pk=self.tweets[2].pk)
+        response = self.client.get(
+            reverse('tweet_list_api'), {'before': encode_cursor(last.created_at, last.pk)}
+        )
+        older = self.expected[self.expected.index(last.pk) + 1:]
+        self.assertEqual([tweet['id'] for tweet in response.json()['results']], older)
+
+
+class RelationshipFilterTests(TestCase):
+    """Relationship filters load the viewer's id sets once, however many users a page lists"""
+
+    template = Template(
+        '{% load custom_filters %}{% for person in people %}'
+        '{{ person.pk }}:{{ viewer|is_following:person }}/{{ viewer|follow_status:person }}/'
+        '{{ viewer|is_blocked:person }}/{{ viewer|is_muted:person }} '
+        '{% endfor %}'
+    )
+
+    def setUp(self):
+        self.viewer = User.objects.create_user('viewer')
+
+    def add_people(self, count):
+        for _ in range(count):
+            followed, requested, blocked, muted = [
+                User.objects.create_user(f'user{User.objects.count()}') for _ in range(4)
+            ]
+            Follow.objects.create(follower=self.viewer, following=followed)
+            FollowRequest.objects.create(from_user=self.viewer, to_user=requested)
+            Block.objects.create(blocker=self.viewer, blocked=blocked)
+            Mute.objects.create(muter=self.viewer, muted=muted)
+
+    def render(self):
+        # A fresh user object per render, as a new request would have
+        viewer = User.objects.get(pk=self.viewer.pk)
+        people = list(User.objects.exclude(pk=viewer.pk))
+        # following, requested, blocked and muted ids: one query each
+        with self.assertNumQueries(4):
+            return self.template.render(Context({'viewer': viewer, 'people': people}))
+
+    def test_queries_independent_of_rows(self):
+        self.add_people(2)
+        self.render()
+        self.add_people(6)
+        output = self.render()
+        self.assertEqual(output.count('True/following/False/False'), 8)
+        self.assertEqual(output.count('False/requested/False/False'), 8)
+        self.assertEqual(output.count('False/not_following/True/False'), 8)
+        self.assertEqual(output.count('False/not_following/False/True'), 8)
+
+
+class FollowGraphTests(TestCase):
+    """Follow edges are read and written through FollowGraph"""
+
+    def setUp(self):
+        default_cache.clear()
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.carol = User.objects.create_user('carol')
+
+    def test_follow_unfollow(self):
+        self.assertTrue(FollowGraph.follow(self.alice, self.bob))
+        self.assertFalse(FollowGraph.follow(self.alice, self.bob))
+        self.assertTrue(FollowGraph.is_following(self.alice, self.bob))
+        self.assertFalse(FollowGraph.is_following(self.bob, self.alice))
+
+        self.assertTrue(FollowGraph.unfollow(self.alice, self.bob))
+        self.assertFalse(FollowGraph.unfollow(self.alice, self.bob))
+        self.assertFalse(FollowGraph.is_following(self.alice, self.bob))
+        self.assertFalse(Follow.objects.exists())
+
+    def test_is_following_loads_once(self):
+        FollowGraph.follow(self.alice, self.bob)
+        with self.assertNumQueries(1):
+            for target in (self.bob, self.carol, self.bob.pk):
+                FollowGraph.is_following(self.alice, target)
+
+    def test_lists(self):
+        FollowGraph.follow(self.bob, self.alice)
+        FollowGraph.follow(self.carol, self.alice)
+        FollowGraph.follow(self.alice, self.carol)
+        # Most recent first
+        Follow.objects.filter(follower=self.bob).update(created_at=timezone.now() - timedelta(days=1))
+
+        self.assertEqual(list(FollowGraph.followers_of(self.alice)), [self.carol, self.bob])
+        self.assertEqual(list(FollowGraph.following_of(self.alice)), [self.carol])
+        self.assertEqual(list(FollowGraph.mutuals(self.alice, viewer=self.alice)), [self.carol])
+        self.assertEqual(get_cached_profile_stats(self.alice)['followers'], 2)
+
+    def test_async_follow(self):
+        self.assertTrue(async_to_sync(FollowGraph.afollow)(self.alice, self.bob))
+        self.assertTrue(FollowGraph.is_following(self.alice, self.bob))
+        self.assertTrue(async_to_sync(FollowGraph.aunfollow)(self.alice, self.bob))
+        self.assertFalse(FollowGraph.is_following(self.alice, self.bob))
+
+
+@mock.patch.object(notifications, 'NOTIFICATIONS_ASYNC', True)
+class NotificationQueueTests(TestCase):
+    """Notifications are queued on the request path and delivered in batches by the worker"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.users = [User.objects.create_user(f'user{i}') for i in range(5)]
+
+    def queue_mentions(self, recipients):
+        create_notifications(recipients, self.alice, 'mention', 'alice mentioned you')
+
+    def test_self_notifications_dropped(self):
+        create_notification(self.alice, self.alice, 'mention', 'alice mentioned you')
+        self.queue_mentions([self.alice, *self.users[:2]])
+        self.assertEqual(
+            set(NotificationJob.objects.values_list('recipient_id', flat=True)),
+            {self.users[0].pk, self.users[1].pk}
+        )
+
+    def test_batch_delivery(self):
+        self.users[0].blocking.create(blocked=self.alice)
+        self.queue_mentions(self.users)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(deliver_notification_batch(), 5)
+        statements = [query['sql'] for query in queries.captured_queries]
+        # One block lookup and one INSERT for the whole batch
+        self.assertEqual(sum('"tweet_block"' in sql for sql in statements), 1)
+        self.assertEqual(sum(sql.startswith('INSERT INTO "tweet_notification"') for sql in statements), 1)
+
+        self.assertFalse(NotificationJob.objects.exists())
+        self.assertEqual(
+            set(Notification.objects.values_list('recipient_id', flat=True)),
+            {user.pk for user in self.users[1:]}
+        )
+
+    def test_delivery_on_commit(self):
+        with mock.patch.object(notifications, 'NOTIFICATIONS_ASYNC', False):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.queue_mentions(self.users[:2])
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertFalse(NotificationJob.objects.exists())
+
+    def test_worker_loop(self):
+        self.queue_mentions(self.users)
+        batches = mock.Mock(wraps=deliver_notification_batch)
+        with mock.patch('tweet.management.commands.run_workers.deliver_notification_batch', batches), \
+                mock.patch('time.sleep', side_effect=KeyboardInterrupt) as sleep:
+            call_command('run_workers', batch_size=2, trending_interval=0, stdout=io.StringIO())
+        # Batches of 2, 2 and 1, then the empty poll that sleeps
+        self.assertEqual([c.args for c in batches.call_args_list], [(2,)] * 4)
+        sleep.assert_called_once()
+        self.assertEqual(Notification.objects.count(), 5)
+        self.assertFalse(NotificationJob.objects.exists())
+
+    def test_worker_once(self):
+        self.queue_mentions(self.users)
+        out = io.StringIO()
+        call_command('run_workers', once=True, batch_size=2, stdout=out)
+        self.assertIn('Delivered 5 queued notifications', out.getvalue())
+        self.assertEqual(deliver_pending_notifications(), 0)
+
+
+@mock.patch.object(notifications, 'NOTIFICATIONS_ASYNC', True)
+class NotificationAggregationTests(TestCase):
+    """Likes, follows and comments on one target fold into a single unread notification"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.fans = [User.objects.create_user(f'fan{i}') for i in range(8)]
+        self.tweet = Tweet.objects.create(user=self.alice, text='hello')
+
+    def like(self, *users):
+        for user in users:
+            toggle_like(self.tweet, user)
+        deliver_pending_notifications()
+
+    def test_grouping(self):
+        self.like(*self.fans[:3])
+        create_notification(self.alice, self.fans[0], 'follow', 'fan0 started following you')
+        Comment.objects.create(tweet=self.tweet, user=self.fans[1], text='nice')
+        deliver_pending_notifications()
+
+        likes = Notification.objects.get(recipient=self.alice, notification_type='like')
+        self.assertEqual(likes.actor_count, 3)
+        self.assertEqual(likes.sender, self.fans[2])
+        self.assertEqual(likes.recent_actor_ids, [fan.pk for fan in reversed(self.fans[:3])])
+        self.assertEqual(likes.message, 'fan2 and 2 others liked your tweet')
+        self.assertEqual(
+            Notification.objects.filter(recipient=self.alice).exclude(pk=likes.pk).count(), 2
+        )
+
+        # Later likes fold in, across deliveries
+        self.like(self.fans[3])
+        likes.refresh_from_db()
+        self.assertEqual((likes.actor_count, likes.message), (4, 'fan3 and 3 others liked your tweet'))
+
+    def test_repeat_actor_counted_once(self):
+        self.like(self.fans[0])
+        # Enough later likers to push fan0 out of the recent actors
+        self.like(*self.fans[1:7])
+        toggle_like(self.tweet, self.fans[0])
+        self.like(self.fans[0])
+        notification = Notification.objects.get(recipient=self.alice)
+        self.assertEqual(notification.actor_count, 7)
+        self.assertEqual(notification.actors.count(), 7)
+        self.assertEqual(len(notification.recent_actor_ids), notifications.RECENT_ACTORS)
+
+    def test_read_aggregate_closes(self):
+        self.like(self.fans[0])
+        mark_all_notifications_read(self.alice)
+        self.like(self.fans[1])
+        latest = Notification.objects.filter(recipient=self.alice).latest('created_at')
+        self.assertEqual((latest.actor_count, latest.message), (1, 'fan1 liked your tweet'))
+        self.assertEqual(Notification.objects.filter(recipient=self.alice).count(), 2)
+
+    def test_message(self):
+        self.assertEqual(aggregate_message('follow', 'bob', 1), 'bob started following you')
+        self.assertEqual(aggregate_message('like:comment:3', 'bob', 2), 'bob and 1 other liked your comment')
+        self.assertEqual(aggregate_message('comment:tweet:3', 'bob', 42), 'bob and 41 others commented on your tweet')
+
+
+class LikeToggleTests(TestCase):
+    """Likes toggle with a fixed number of queries and keep likes_count exact"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.tweet = Tweet.objects.create(user=self.alice, text='hello')
+
+    def test_toggle(self):
+        self.assertEqual(toggle_like(self.tweet, self.bob), (True, 1))
+        self.assertEqual(NotificationJob.objects.filter(recipient=self.alice).count(), 1)
+        self.assertEqual(toggle_like(self.tweet, self.bob), (False, 0))
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.likes_count, 0)
+        self.assertFalse(self.tweet.likes.exists())
+
+    def test_queries_independent_of_likers(self):
+        self.tweet.likes.add(*[User.objects.create_user(f'fan{i}') for i in range(50)])
+        # DELETE, SAVEPOINT, INSERT, RELEASE, UPDATE, SELECT count, queue notification,
+        # plus the savepoint TestCase turns the outer transaction into
+        with self.assertNumQueries(9):
+            self.assertEqual(toggle_like(self.tweet, self.bob), (True, 51))
+        with self.assertNumQueries(5):
+            self.assertEqual(toggle_like(self.tweet, self.bob), (False, 50))
+
+    def test_comment(self):
+        comment = Comment.objects.create(tweet=self.tweet, user=self.alice, text='hi')
+        self.assertEqual(toggle_like(comment, self.bob), (True, 1))
+        self.assertEqual(comment.likes.get(), self.bob)
+
+    def test_pages_flag_viewer_likes_without_loading_likers(self):
+        other = Tweet.objects.create(user=self.alice, text='#tagged')
+        Follow.objects.create(follower=self.bob, following=self.alice)
+        comment = Comment.objects.create(tweet=self.tweet, user=self.alice, text='hi')
+        Comment.objects.create(tweet=self.tweet, user=self.alice, text='reply', parent_comment=comment)
+        self.tweet.likes.add(self.bob)
+        comment.likes.add(self.bob)
+        self.client.force_login(self.bob)
+        pages = [
+            reverse('home'), reverse('tweet_list'), reverse('hashtag_detail', args=['tagged']),
+            reverse('personalized_feed'), reverse('user_profile', args=['alice']),
+            f"{reverse('search')}?query=tagged", f"{reverse('advanced_search')}?from_user=alice",
+            reverse('tweet_detail', args=[self.tweet.pk]),
+        ]
+
+        def render():
+            counts = []
+            for url in pages:
+                default_cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200, url)
+                # Likers are never loaded, only tested for the viewer with EXISTS
+                self.assertFalse([q for q in queries if re.search(r'JOIN "tweet_\w+_likes"', q['sql'])], url)
+                counts.append(len(queries))
+            return counts, response
+
+        render()  # the first search creates its PopularSearch row
+        before, response = render()
+        comment_flags = [
+            (row.viewer_liked, [reply.viewer_liked for reply in row.replies.all()])
+            for row in response.context['comments']
+        ]
+        self.assertTrue(response.context['tweet'].viewer_liked)
+        self.assertEqual(comment_flags, [(True, [False])])
+
+        fans = [User.objects.create_user(f'fan{i}') for i in range(20)]
+        for obj in (self.tweet, other, comment):
+            obj.likes.add(*fans)
+        self.assertEqual(render()[0], before)
+
+        response = self.client.get(reverse('tweet_list'))
+        flags = {tweet.pk: tweet.viewer_liked for tweet in response.context['tweets']}
+        self.assertEqual(flags, {self.tweet.pk: True, other.pk: False})
+
+
+class CounterTests(TestCase):
+    """Counter signals keep the stored counts exact and recount_counters repairs drift"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.carol = User.objects.create_user('carol')
+        self.tweet = Tweet.objects.create(user=self.alice, text='hello')
+
+    def counts(self):
+        self.tweet.refresh_from_db()
+        return self.tweet.likes_count, self.tweet.replies_count, self.tweet.comments_count
+
+    def test_likes(self):
+        self.tweet.likes.add(self.bob, self.carol)
+        self.assertEqual(self.counts(), (2, 0, 0))
+        # Removing a user who never liked it must not touch the count
+        self.tweet.likes.remove(self.bob, self.alice)
+        self.assertEqual(self.counts(), (1, 0, 0))
+        self.bob.liked_tweets.add(self.tweet)
+        self.assertEqual(self.counts(), (2, 0, 0))
+        self.assertEqual(NotificationJob.objects.filter(recipient=self.alice, sender=self.bob).count(), 2)
+        self.bob.liked_tweets.clear()
+        self.assertEqual(self.counts(), (1, 0, 0))
+        self.tweet.likes.clear()
+        self.assertEqual(self.counts(), (0, 0, 0))
+
+    def test_comments_and_replies(self):
+        comment = Comment.objects.create(tweet=self.tweet, user=self.bob, text='hi')
+        reply = Tweet.objects.create(user=self.carol, text='re', parent_tweet=self.tweet)
+        self.assertEqual(self.counts(), (0, 1, 1))
+        comment.likes.add(self.alice)
+        comment.refresh_from_db()
+        self.assertEqual(comment.likes_count, 1)
+        comment.delete()
+        reply.delete()
+        self.assertEqual(self.counts(), (0, 0, 0))
+
+    def test_never_below_zero(self):
+        Comment.objects.create(tweet=self.tweet, user=self.bob, text='hi')
+        Tweet.objects.filter(pk=self.tweet.pk).update(comments_count=0)
+        Comment.objects.get().delete()
+        self.tweet.likes.add(self.bob)
+        Tweet.objects.filter(pk=self.tweet.pk).update(likes_count=0)
+        self.tweet.likes.remove(self.bob)
+        self.assertEqual(self.counts(), (0, 0, 0))
+
+    def test_recount(self):
+        self.tweet.likes.add(self.bob, self.carol)
+        Tweet.objects.create(user=self.carol, text='re', parent_tweet=self.tweet)
+        comment = Comment.objects.create(tweet=self.tweet, user=self.bob, text='hi')
+        comment.likes.add(self.alice)
+        Tweet.objects.filter(pk=self.tweet.pk).update(likes_count=7, replies_count=0, comments_count=3)
+        Comment.objects.update(likes_count=0)
+        out = io.StringIO()
+        call_command('recount_counters', stdout=out)
+        self.assertIn('Recounted counters for 2 tweets and 1 comments', out.getvalue())
+        self.assertEqual(self.counts(), (2, 1, 1))
+        comment.refresh_from_db()
+        self.assertEqual(comment.likes_count, 1)
+
+
+class SearchTests(TestCase):
+    """Search views and backends find what they should and only that"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+
+    def test_advanced_search_min_likes(self):
+        liked = Tweet.objects.create(user=self.alice, text='liked')
+        Tweet.objects.create(user=self.alice, text='ignored')
+        toggle_like(liked, self.bob)
+        self.client.force_login(self.bob)
+        response = self.client.get(reverse('advanced_search'), {'from_user': 'alice', 'min_likes': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['tweets']), [liked])
+        # Filters alone aren't a search; the form asks for more
+        response = self.client.get(reverse('advanced_search'), {'min_likes': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'at least one search criteria')
+
+    def test_fts_backend(self):
+        backend = get_search_backend()
+        if not isinstance(backend, SQLiteFTSBackend):
+            self.skipTest('SQLite FTS5 not in use')
+        tips = Tweet.objects.create(user=self.alice, text='Django tips and tricks')
+        fans = Tweet.objects.create(user=self.alice, text='djangonauts unite')
+        Tweet.objects.create(user=self.alice, text='python news')
+
+        # Terms are prefix matches, ANDed together
+        self.assertEqual(set(backend.filter(Tweet.objects.all(), 'djang')), {tips, fans})
+        self.assertEqual(list(backend.filter(Tweet.objects.all(), 'django TIPS')), [tips])
+        # FTS syntax in the query is matched as plain words, not interpreted
+        self.assertEqual(list(backend.filter(Tweet.objects.all(), '"tips" OR NEAR(')), [])
+
+        # Kept in step with edits and deletes by signals
+        tips.text = 'Flask tips'
+        tips.save()
+        self.assertEqual(list(backend.filter(Tweet.objects.all(), 'flask')), [tips])
+        fans.delete()
+        self.assertEqual(list(backend.filter(Tweet.objects.all(), 'djang')), [])
+
+        self.assertEqual(list(backend.filter(User.objects.all(), 'ali')), [self.alice])
+
+    def test_basic_backend(self):
+        backend = BasicSearchBackend()
+        tips = Tweet.objects.create(user=self.alice, text='Django tips and tricks')
+        Tweet.objects.create(user=self.alice, text='django news')
+
+        self.assertEqual(list(backend.filter(Tweet.objects.all(), 'DJANGO tips')), [tips])
+        self.assertEqual(backend.filter(Tweet.objects.all(), 'tips')[0].search_rank, 0.0)
+        self.assertFalse(backend.filter(Tweet.objects.all(), '!!!').exists())
+
+    def test_search_respects_privacy(self):
+        Tweet.objects.create(user=self.alice, text='secret django plans', privacy='private')
+        self.assertEqual(list(search_tweets('django', user=self.bob)), [])
+        self.assertEqual(len(search_tweets('django', user=self.alice)), 1)
+
+
+class QueryBudgetTestCase(TestCase):
+    """TestCase whose assertQueryBudget holds a view to its perf.QUERY_BUDGETS entry"""
+
+    def captureQueries(self, path, client=None):
+        """Request path with a cold cache and return the response and the SQL it ran"""
+        default_cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = (client or self.client).get(path)
+        self.assertEqual(response.status_code, 200)
+        return response, queries
+
+    def assertQueryBudget(self, path, client=None):
+        """Request path (cold cache) and fail, listing its SQL, if it runs over budget"""
+        url_name = resolve(path.split('?')[0]).url_name
+        budget = QUERY_BUDGETS[url_name]
+        response, queries = self.captureQueries(path, client)
+        if len(queries) > budget:
+            self.fail(f"{url_name} ran {len(queries)} queries, budget {budget}:\n" + '\n'.join(
+                f"{number}. {query['sql']}" for number, query in enumerate(queries, 1)
+            ))
+        return response
+
+    def assertQueriesConstant(self, paths, grow, client=None):
+        """
+        Request each path, call grow() to add rows, and request them again:
+        fail, listing the larger run's SQL, where the query count changed
+        """
+        before = {path: len(self.captureQueries(path, client)[1]) for path in paths}
+        grow()
+        for path in paths:
+            with self.subTest(path):
+                queries = self.captureQueries(path, client)[1]
+                if len(queries) != before[path]:
+                    self.fail(f"{path} ran {before[path]} then {len(queries)} queries:\n" + '\n'.join(
+                        f"{number}. {query['sql']}" for number, query in enumerate(queries, 1)
+                    ))
+
+
+class QueryBudgetTests(QueryBudgetTestCase):
+    """
+    The main pages stay within their query budgets for five followed accounts
+    with a tweet, a like, a comment and a conversation each, and run the same
+    number of queries for fifteen
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user('viewer', password='secret')
+        cls.tweet = Tweet.objects.create(user=cls.viewer, text='thread #budget')
+        cls.add_authors(5)
+
+    @classmethod
+    def add_authors(cls, count):
+        first = User.objects.filter(username__startswith='author').count()
+        for i in range(first, first + count):
+            author = User.objects.create_user(f'author{i}')
+            Follow.objects.create(follower=cls.viewer, following=author)
+            Follow.objects.create(follower=author, following=cls.viewer)
+            tweet = Tweet.objects.create(user=author, text='hello #budget')
+            tweet.likes.add(cls.viewer)
+            Tweet.objects.create(user=author, text='reply', parent_tweet=cls.tweet)
+            Comment.objects.create(tweet=tweet, user=cls.viewer, text='hi')
+            comment = Comment.objects.create(tweet=cls.tweet, user=author, text='hi')
+            Comment.objects.create(tweet=cls.tweet, user=cls.viewer, text='hi', parent_comment=comment)
+            own_tweet = Tweet.objects.create(user=cls.viewer, text='mine #budget')
+            own_tweet.likes.add(author)
+            conversation = Conversation.objects.create()
+            conversation.participants.add(cls.viewer, author)
+            DirectMessage.objects.create(conversation=conversation, sender=author, content='hey')
+        deliver_pending_notifications()
+
+    def setUp(self):
+        self.client.login(username='viewer', password='secret')
+
+    def pages(self):
+        return [
+            reverse('home'),
+            reverse('tweet_list'),
+            reverse('tweet_detail', args=[self.tweet.id]),
+            reverse('hashtag_detail', args=['budget']),
+            reverse('personalized_feed'),
+            reverse('user_profile', args=[self.viewer.username]),
+            reverse('notifications_list'),
+            reverse('conversations_list'),
+            reverse('search') + '?query=hello',
+        ]
+
+    def json_endpoints(self):
+        return [
+            reverse(name) for name in
+            ['tweet_list_api', 'notifications_api', 'personalized_feed_api', 'notifications_count']
+        ]
+
+    def test_pages(self):
+        for path in self.pages():
+            with self.subTest(path):
+                self.assertQueryBudget(path)
+
+    def test_json_endpoints(self):
+        for path in self.json_endpoints():
+            with self.subTest(path):
+                self.assertQueryBudget(path)
+
+    def test_queries_independent_of_rows(self):
+        # The first search creates its PopularSearch row
+        self.client.get(reverse('search') + '?query=hello')
+        self.assertQueriesConstant(self.pages() + self.json_endpoints(), lambda: self.add_authors(10))
+
+    def test_server_timing_and_report(self):
+        reset_perf_stats()
+        response = self.client.get(reverse('notifications_count'))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=')
+        report = {view['view']: view for view in get_perf_stats()}
+        self.assertEqual(report['notifications_count']['requests'], 1)
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        user = User.objects.create_user(username='photographer', password='secret')
+        # Its derivatives are queued, not written, until a worker runs
+        self.tweet = Tweet.objects.create(user=user, text='sunset', image=self.image('sunset.jpg', (1600, 800)))
+
+    def render(self):
+        return Template("{% load custom_filters %}<img {% img_attrs tweet.image 'photo' %}>").render(
+            Context({'tweet': self.tweet})
+        )
+
+    def image(self, name, size):
+        from PIL import Image
+
+        upload = io.BytesIO()
+        Image.new('RGB', size, 'red').save(upload, 'JPEG')
+        return SimpleUploadedFile(name, upload.getvalue(), 'image/jpeg')
+
+    def test_variants_written_by_worker(self):
+        from PIL import Image
+
+        tweet = Tweet.objects.create(user=self.tweet.user, text='dawn', image=self.image('dawn.jpg', (1600, 800)))
+        name = variant_name(tweet.image.name, 640)
+        self.assertFalse(default_storage.exists(name))
+        self.assertEqual(ImageDerivativeJob.objects.count(), 2)
+
+        out = io.StringIO()
+        call_command('run_workers', once=True, stdout=out)
+        self.assertIn('rendered 2 queued images', out.getvalue())
+        self.assertFalse(ImageDerivativeJob.objects.exists())
+        with Image.open(f'{self.media_root}/{name}') as variant:
+            self.assertEqual((variant.format, variant.size), ('WEBP', (640, 320)))
+
+        # Pages link straight to the files, after one storage lookup per image
+        self.tweet = tweet
+        with mock.patch.object(ContentAddressedStorage, 'exists', return_value=True) as exists:
+            self.assertIn(f'/media/{name} 640w', self.render())
+        exists.assert_called_once()
+
+    def test_missing_variants_link_to_view(self):
+        lazy = reverse('image_variant', args=['photo', 640, self.tweet.image.name])
+        self.assertIn(f'{lazy} 640w', self.render())
+
+        response = self.client.get(lazy)
+        self.assertRedirects(
+            response, f'/media/{variant_name(self.tweet.image.name, 640)}',
+            status_code=301, fetch_redirect_response=False
+        )
+        # Every width was written, so the page links to the files now
+        self.assertIn(f'/media/{variant_name(self.tweet.image.name, 320)} 320w', self.render())
+
+    def test_unreadable_upload_falls_back_to_original(self):
+        self.tweet.image = SimpleUploadedFile('broken.jpg', b'not an image', 'image/jpeg')
+        self.tweet.save()
+        render_pending_variants()
+        self.assertNotIn('/media/derivatives/', self.render())
+
+        response = self.client.get(reverse('image_variant', args=['photo', 640, self.tweet.image.name]))
+        self.assertRedirects(response, self.tweet.image.url, fetch_redirect_response=False)
+
+    def test_avatar_variants_queued(self):
+        profile = self.tweet.user.userprofile
+        profile.avatar = self.image('me.jpg', (300, 200))
+        profile.save()
+        profile.save(update_fields=['bio'])
+        self.assertEqual(
+            set(ImageDerivativeJob.objects.values_list('kind', flat=True)), {'photo', 'avatar'}
+        )
+        ImageDerivativeJob.objects.create(kind='photo', name='photos/missing.jpg')
+        self.assertEqual(render_pending_variants(batch_size=1), 3)
+        for width in (48, 96, 192, 288):
+            self.assertTrue(default_storage.exists(variant_name(profile.avatar.name, width)))
+
+    def test_redirect_for_older_links(self):
+        from PIL import Image
+
+        response = self.client.get(reverse('image_variant', args=['photo', 640, self.tweet.image.name]))
+
+        name = variant_name(self.tweet.image.name, 640)
+        self.assertRedirects(response, f'/media/{name}', status_code=301, fetch_redirect_response=False)
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+        with Image.open(f'{self.media_root}/{name}') as variant:
+            self.assertEqual((variant.format, variant.size), ('WEBP', (640, 320)))
+
+    def test_rejects_unknown_variants(self):
+        for args in [
+            ['photo', 500, self.tweet.image.name],
+            ['avatar', 48, self.tweet.image.name],
+            ['photo', 640, 'photos/../settings.py'],
+        ]:
+            with self.subTest(args):
+                self.assertEqual(self.client.get(reverse('image_variant', args=args)).status_code, 404)
+
+
+class AttachmentUploadTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        upload_dir = mock.patch('tweet.uploads.UPLOAD_DIR', f'{self.media_root}/parts')
+        upload_dir.start()
+        self.addCleanup(upload_dir.stop)
+
+        self.sender = User.objects.create_user(username='sender', password='secret')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.sender, User.objects.create_user(username='recipient'))
+        self.client.login(username='sender', password='secret')
+        self.url = reverse('conversation_detail', args=[self.conversation.id])
+
+    def test_resumable_upload_is_sent_as_attachment(self):
+        video = bytes(range(256)) * 1000
+        response = self.client.post(reverse('start_upload', args=[self.conversation.id]), {
+            'field': 'video', 'filename': 'clip.mp4', 'content_type': 'video/mp4', 'size': len(video),
+        })
+        self.assertEqual(response.status_code, 201)
+        upload = response.json()
+
+        def put(offset, data):
+            return self.client.put(
+                upload['url'], data, content_type='application/octet-stream', headers={'Upload-Offset': str(offset)}
+            )
+
+        self.assertEqual(put(0, video[:100000]).json(), {'offset': 100000, 'complete': False})
+        # A retried chunk the server already has is answered with where to resume
+        retried = put(0, video[:100000])
+        self.assertEqual((retried.status_code, retried.json()['offset']), (409, 100000))
+        self.assertEqual(put(100000, video[100000:] + b'x').status_code, 413)
+        self.assertEqual(put(100000, video[100000:]).json(), {'offset': len(video), 'complete': True})
+
+        self.client.post(self.url, {'content': '', 'upload': upload['id']})
+        message = DirectMessage.objects.get()
+        self.assertEqual(message.message_type, 'video')
+        with message.video.open() as stored:
+            self.assertEqual(hashlib.sha256(stored.read()).hexdigest(), hashlib.sha256(video).hexdigest())
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    def test_oversized_attachment_is_cut_off_during_transfer(self):
+        with mock.patch.dict('tweet.uploads.ATTACHMENT_LIMITS', {'file': 100 * 1024}):
+            response = self.client.post(self.url, {
+                'content': 'see attached',
+                'file': SimpleUploadedFile('big.bin', b'x' * (200 * 1024)),
+            })
+        self.assertContains(response, 'File too large.')
+        self.assertFalse(DirectMessage.objects.exists())
+
+    def test_small_attachment_is_sent_directly(self):
+        self.client.post(self.url, {'content': '', 'file': SimpleUploadedFile('notes.txt', b'hello')})
+        with DirectMessage.objects.get().file.open() as stored:
+            self.assertEqual(stored.read(), b'hello')
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.content = b'same meme' * 1000
+        self.blob = default_storage.blob_path(hashlib.sha256(self.content).hexdigest())
+
+    def test_duplicates_share_one_blob_until_the_last_is_deleted(self):
+        first = default_storage.save('dm_images/meme.png', ContentFile(self.content))
+        second = default_storage.save('dm_images/meme.png', ContentFile(self.content))
+
+        self.assertNotEqual(first, second)
+        self.assertTrue(os.path.samefile(default_storage.path(first), self.blob))
+        self.assertTrue(os.path.samefile(default_storage.path(second), self.blob))
+        default_storage.delete(first)
+        self.assertTrue(os.path.exists(self.blob))
+        default_storage.delete(second)
+        self.assertFalse(os.path.exists(self.blob))
+
+    def test_dedupe_media_links_existing_copies(self):
+        os.makedirs(f'{self.media_root}/dm_files')
+        for name in ['a.bin', 'b.bin']:
+            with open(f'{self.media_root}/dm_files/{name}', 'wb') as f:
+                f.write(self.content)
+
+        call_command('dedupe_media', stdout=io.StringIO())
+
+        self.assertTrue(os.path.samefile(f'{self.media_root}/dm_files/a.bin', f'{self.media_root}/dm_files/b.bin'))
+        self.assertEqual(os.stat(self.blob).st_nlink, 3)
+        # Indexed, so deleting them needn't read them again
+        self.assertEqual(
+            os.readlink(default_storage.inode_path(os.stat(self.blob).st_ino)), os.path.basename(self.blob)
+        )
+
+    def test_delete_finds_blob_by_inode(self):
+        names = [default_storage.save('dm_files/big.bin', ContentFile(self.content)) for _ in range(2)]
+        inode = os.stat(self.blob).st_ino
+        with mock.patch('tweet.storage.file_sha256', side_effect=AssertionError('re-hashed')):
+            for name in names:
+                default_storage.delete(name)
+        self.assertFalse(os.path.exists(self.blob))
+        self.assertFalse(os.path.lexists(default_storage.inode_path(inode)))
+
+    def test_overwrite_keeps_other_names(self):
+        # Several spool chunks, not just a few bytes
+        other = os.urandom(3 * 64 * 1024 + 1)
+        other_blob = default_storage.blob_path(hashlib.sha256(other).hexdigest())
+        first = default_storage.save('dm_files/a.bin', ContentFile(self.content))
+        second = default_storage.save('dm_files/b.bin', ContentFile(self.content))
+        overwriting = ContentAddressedStorage(allow_overwrite=True)
+
+        self.assertEqual(overwriting.save(first, ContentFile(other)), first)
+        with default_storage.open(first) as f:
+            self.assertEqual(f.read(), other)
+        with default_storage.open(second) as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertTrue(os.path.samefile(default_storage.path(first), other_blob))
+        self.assertEqual(os.stat(self.blob).st_nlink, 2)
+
+        # Overwriting the last name of a blob drops the blob
+        overwriting.save(second, ContentFile(other))
+        self.assertFalse(os.path.exists(self.blob))
+        self.assertEqual(os.stat(other_blob).st_nlink, 3)
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        sender = User.objects.create_user(username='sender', password='secret')
+        User.objects.create_user(username='outsider', password='secret')
+        conversation = Conversation.objects.create()
+        conversation.participants.add(sender)
+        message = DirectMessage.objects.create(
+            conversation=conversation,
+            sender=sender,
+            file=SimpleUploadedFile('notes.txt', b'0123456789'),
+        )
+        self.url = message.file.url
+        self.client.login(username='sender', password='secret')
+
+    def test_only_participants_get_attachments(self):
+        response = self.client.get(self.url)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+        self.assertTrue(response['Content-Disposition'].startswith('attachment;'))
+
+        self.client.login(username='outsider', password='secret')
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(self.client.get('/media/.blobs/').status_code, 404)
+
+    def test_range_and_conditional_requests(self):
+        response = self.client.get(self.url, headers={'Range': 'bytes=2-5'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+
+        suffix = self.client.get(self.url, headers={'Range': 'bytes=-3'})
+        self.assertEqual(b''.join(suffix.streaming_content), b'789')
+        self.assertEqual(self.client.get(self.url, headers={'Range': 'bytes=10-'}).status_code, 416)
+
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': etag}).status_code, 304)
+        stale = self.client.get(self.url, headers={'Range': 'bytes=2-5', 'If-Range': '"stale"'})
+        self.assertEqual(stale.status_code, 200)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/')
+    def test_hands_off_to_nginx(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.url.removeprefix('/media/'))
+        self.assertEqual(response.content, b'')
+
+
+class TweetEntityTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+
+    def test_linking_queries_independent_of_entities(self):
+        users = [User.objects.create_user(f'user{i}') for i in range(10)]
+
+        def create(count):
+            tags = ' '.join(f'#tag{i}' for i in range(count))
+            mentions = ' '.join(f'@{user.username}' for user in users[:count])
+            with CaptureQueriesContext(connection) as queries:
+                Tweet.objects.create(user=self.author, text=f'{tags} {mentions}')
+            return len(queries)
+
+        self.assertEqual(create(1), create(10))
+        self.assertEqual(
+            dict(Hashtag.objects.values_list('name', 'tweet_count')),
+            {'tag0': 2, **{f'tag{i}': 1 for i in range(1, 10)}}
+        )
+
+    def test_hashtag_tweet_count(self):
+        first = Tweet.objects.create(user=self.author, text='#django #python')
+        Tweet.objects.create(user=self.author, text='#Django again')
+        Tweet.objects.bulk_create([Tweet(user=self.author, text='#python') for _ in range(2)])
+        link_tweet_entities(Tweet.objects.filter(text='#python'))
+        first.delete()
+        counts = dict(Hashtag.objects.values_list('name', 'tweet_count'))
+        self.assertEqual(counts, {'django': 1, 'python': 2})
+        self.assertEqual(counts['python'], TweetHashtag.objects.filter(hashtag__name='python').count())
+
+    def test_entities_found_on_save_and_edit(self):
+        tweet = Tweet.objects.create(user=self.author, text='#one for @two')
+        self.assertEqual(Tweet.objects.get(pk=tweet.pk).entities, [[0, 4], [9, 13]])
+        self.assertEqual((tweet.extract_hashtags(), tweet.extract_mentions()), (['one'], ['two']))
+
+        tweet.text = 'now #three'
+        tweet.save(update_fields=['text'])
+        self.assertEqual(Tweet.objects.get(pk=tweet.pk).entities, [[4, 10]])
+
+    def test_rendering_splices_links_without_reversing_urls(self):
+        tweet = Tweet.objects.create(user=self.author, text='<b>#django</b> & @author')
+        tweet.get_text_html()
+
+        with mock.patch('tweet.entities.reverse') as reverse_mock:
+            html = tweet.get_text_html()
+        reverse_mock.assert_not_called()
+        self.assertHTMLEqual(html, (
+            f'&lt;b&gt;<a href="{reverse("hashtag_detail", args=["django"])}" '
+            'class="text-primary text-decoration-none">#django</a>&lt;/b&gt; &amp; '
+            f'<a href="{reverse("user_profile", args=["author"])}" class="text-info text-decoration-none">@author</a>'
+        ))
@@ -0,0 +1,126 @@
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Q
+
+# Accounts with more followers than this are not fanned out on write; their
+# tweets are merged into followers' feeds at read time instead.
+FANOUT_MAX_FOLLOWERS = getattr(settings, 'TIMELINE_FANOUT_MAX_FOLLOWERS', 10000)
+
+# Number of an account's latest tweets copied into a timeline on follow/rebuild
+BACKFILL_SIZE = getattr(settings, 'TIMELINE_BACKFILL_SIZE', 50)
+
+BATCH_SIZE = 1000
+
+
+def _entries_for(tweet, user_ids):
+    from .models import TimelineEntry
+
+    return [
+        TimelineEntry(
+            user_id=user_id,
+            tweet_id=tweet.id,
+            author_id=tweet.user_id,
+            created_at=tweet.created_at
+        )
+        for user_id in user_ids
+    ]
+
+
+def fan_out_tweet(tweet):
+    """
+    Deliver a newly created tweet to the author's and followers' timelines
+    """
+    from .models import Follow, TimelineEntry, UserProfile
+
+    # Unordered, so both are read straight off the (following, follower) index
+    followers = Follow.objects.filter(following_id=tweet.user_id).order_by()
+    # Counting a capped slice stops at the threshold instead of walking every row
+    fanout_on_read = followers[:FANOUT_MAX_FOLLOWERS + 1].count() > FANOUT_MAX_FOLLOWERS
+
+    # Remember the decision so readers know to pull this author's tweets themselves
+    UserProfile.objects.filter(user_id=tweet.user_id).exclude(
+        timeline_fanout_on_read=fanout_on_read
+    ).update(timeline_fanout_on_read=fanout_on_read)
+
+    TimelineEntry.objects.bulk_create(_entries_for(tweet, [tweet.user_id]), ignore_conflicts=True)
+    if fanout_on_read:
+        return
+
+    follower_ids = followers.values_list('follower_id', flat=True).iterator(chunk_size=BATCH_SIZE)
+    while batch := list(islice(follower_ids, BATCH_SIZE)):
+        TimelineEntry.objects.bulk_create(_entries_for(tweet, batch), ignore_conflicts=True)
+
+
+def backfill_timeline(user, author, limit=BACKFILL_SIZE):
+    """
+    Copy an author's latest tweets into a user's timeline (e.g. after a follow)
+    """
+    from .models import Tweet, TimelineEntry, UserProfile
+
+    if user.pk != author.pk and UserProfile.objects.filter(
+        user=author, timeline_fanout_on_read=True
+    ).exists():
+        return
+
+    tweets = Tweet.objects.filter(user=author).only('id', 'user_id', 'created_at')[:limit]
+    TimelineEntry.objects.bulk_create(
+        [entry for tweet in tweets for entry in _entries_for(tweet, [user.pk])],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def remove_from_timeline(user, author):
+    """
+    Drop an author's tweets from a user's timeline (e.g. after an unfollow)
+    """
+    from .models import TimelineEntry
+
+    TimelineEntry.objects.filter(user=user, author=author).delete()
+
+
+def rebuild_timeline(user, limit=BACKFILL_SIZE):
+    """
+    Rebuild a user's timeline from scratch out of the follow graph
+    """
+    from django.contrib.auth.models import User
+    from .models import Follow, TimelineEntry
+
+    TimelineEntry.objects.filter(user=user).delete()
+
+    author_ids = list(Follow.objects.filter(follower=user).values_list('following_id', flat=True))
+    author_ids.append(user.pk)
+    for author in User.objects.filter(id__in=author_ids):
+        backfill_timeline(user, author, limit=limit)
+
+
+def get_timeline_tweets(user, limit=50, before=None):
+    """
+    Read a user's home timeline: precomputed entries merged with tweets from
+    followed accounts that are delivered on read. before is a decoded
+    (created_at, id) keyset cursor; only older tweets are returned.
+    """
+    from .models import Tweet, Follow, Block, Mute, TimelineEntry
+    from .pagination import keyset_filter
+
+    blocked_users = Block.objects.filter(blocker=user).values_list('blocked', flat=True)
+    muted_users = Mute.objects.filter(muter=user).values_list('muted', flat=True)
+
+    # Skip hidden authors up front so they do not eat into the page size
+    entries = keyset_filter(TimelineEntry.objects.filter(user=user), before, id_field='tweet_id')
+    tweet_ids = list(
+        entries.exclude(
+            Q(author__in=blocked_users) | Q(author__in=muted_users)
+        ).order_by('-created_at', '-tweet_id').values_list('tweet_id', flat=True)[:limit]
+    )
+
+    fanout_on_read_authors = Follow.objects.filter(
+        follower=user,
+        following__userprofile__timeline_fanout_on_read=True
+    ).values_list('following', flat=True)
+
+    tweets = Tweet.objects.visible_to(user).filter(
+        Q(id__in=tweet_ids) | Q(user__in=fanout_on_read_authors)
+    )
+    return keyset_filter(tweets, before).order_by('-created_at', '-id')[:limit]
@@ -0,0 +1,111 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from . import cache
+
+# Trend scores halve for every TRENDING_HALF_LIFE_HOURS of bucket age
+HALF_LIFE_HOURS = getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 12)
+
+# How many hashtags are kept in the precomputed TrendingHashtag table
+TOP_K = getattr(settings, 'TRENDING_TOP_K', 100)
+
+# How often run_workers recomputes the TrendingHashtag table
+REFRESH_SECONDS = getattr(settings, 'TRENDING_REFRESH_SECONDS', 300)
+
+WINDOW = timedelta(days=7)
+
+
+def bucket_for(when):
+    """Start of the hourly activity bucket containing the given time"""
+    return when.replace(minute=0, second=0, microsecond=0)
+
+
+def record_hashtag_counts(counts):
+    """
+    Add tweet counts to activity buckets; counts maps (hashtag_id, bucket_start) to n
+    """
+    from .models import HashtagActivityBucket
+
+    if not counts:
+        return
+
+    # Make sure the rows exist, then increment them atomically
+    HashtagActivityBucket.objects.bulk_create(
+        [
+            HashtagActivityBucket(hashtag_id=hashtag_id, bucket_start=bucket_start)
+            for hashtag_id, bucket_start in counts
+        ],
+        ignore_conflicts=True
+    )
+
+    grouped = defaultdict(list)
+    for (hashtag_id, bucket_start), n in counts.items():
+        grouped[(bucket_start, n)].append(hashtag_id)
+    for (bucket_start, n), hashtag_ids in grouped.items():
+        HashtagActivityBucket.objects.filter(
+            hashtag_id__in=hashtag_ids,
+            bucket_start=bucket_start
+        ).update(count=F('count') + n)
+
+
+def refresh_trending_hashtags(now=None):
+    """
+    Recompute decayed trend scores from the activity buckets and store the top K
+    """
+    from .models import HashtagActivityBucket, TrendingHashtag
+
+    now = now or timezone.now()
+    day_ago = now - timedelta(hours=24)
+
+    totals = {}
+    buckets = HashtagActivityBucket.objects.filter(
+        bucket_start__gte=now - WINDOW
+    ).values_list('hashtag_id', 'bucket_start', 'count')
+
+    for hashtag_id, bucket_start, count in buckets.iterator():
+        score, last_24h, last_week = totals.get(hashtag_id, (0.0, 0, 0))
+        age_hours = max((now - bucket_start).total_seconds() / 3600, 0)
+        score += count * (1 + 10 * 0.5 ** (age_hours / HALF_LIFE_HOURS))
+        if bucket_start >= bucket_for(day_ago):
+            last_24h += count
+        totals[hashtag_id] = (score, last_24h, last_week + count)
+
+    top = sorted(
+        ((hashtag_id, values) for hashtag_id, values in totals.items() if values[1] > 0),
+        key=lambda item: item[1][0],
+        reverse=True
+    )[:TOP_K]
+
+    TrendingHashtag.objects.exclude(hashtag_id__in=[hashtag_id for hashtag_id, _ in top]).delete()
+    TrendingHashtag.objects.bulk_create(
+        [
+            TrendingHashtag(
+                hashtag_id=hashtag_id,
+                trend_score=round(score, 2),
+                tweets_last_24h=last_24h,
+                tweets_last_week=last_week
+            )
+            for hashtag_id, (score, last_24h, last_week) in top
+        ],
+        update_conflicts=True,
+        unique_fields=['hashtag'],
+        update_fields=['trend_score', 'tweets_last_24h', 'tweets_last_week', 'last_updated']
+    )
+    # Bulk writes skip signals, so drop the cached list here
+    cache.trending.invalidate('top')
+    return len(top)
+
+
+def prune_hashtag_activity(now=None):
+    """
+    Delete activity buckets that have fallen out of the trending window
+    """
+    from .models import HashtagActivityBucket
+
+    now = now or timezone.now()
+    deleted, _ = HashtagActivityBucket.objects.filter(bucket_start__lt=now - WINDOW).delete()
+    return deleted
@@ -0,0 +1,224 @@
+import hashlib
+import os
+import tempfile
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopUpload
+from django.utils import timezone
+
+MB = 1024 * 1024
+
+# Largest attachment each DirectMessage file field takes, and the content
+# types it accepts (None: any)
+ATTACHMENT_LIMITS = {'image': 10 * MB, 'video': 100 * MB, 'audio': 50 * MB, 'file': 25 * MB}
+ATTACHMENT_TYPES = {
+    'video': ['video/mp4', 'video/webm', 'video/avi', 'video/mov'],
+    'audio': ['audio/mp3', 'audio/wav', 'audio/ogg', 'audio/m4a'],
+}
+ATTACHMENT_LABELS = {'image': 'Image file', 'video': 'Video file', 'audio': 'Audio file', 'file': 'File'}
+TYPE_ERRORS = {
+    'image': "Please upload a valid image file.",
+    'video': "Please upload a valid video file (MP4, WebM, AVI, MOV).",
+    'audio': "Please upload a valid audio file (MP3, WAV, OGG, M4A).",
+}
+
+# Bytes read from the request and written to disk at a time; what one upload
+# costs in memory whatever its size
+CHUNK_SIZE = 64 * 1024
+
+# Attachments larger than this are sent in RESUMABLE_CHUNK_SIZE pieces through
+# the resumable upload endpoints rather than in the message form
+DIRECT_UPLOAD_MAX = 5 * MB
+RESUMABLE_CHUNK_SIZE = 4 * MB
+
+# Unfinished resumable uploads are deleted after this long, and a user may
+# have at most MAX_OPEN_UPLOADS of them at once
+UPLOAD_EXPIRY = timedelta(hours=24)
+MAX_OPEN_UPLOADS = 5
+
+UPLOAD_DIR = getattr(
+    settings,
+    'RESUMABLE_UPLOAD_DIR',
+    os.path.join(settings.FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir(), 'twick-uploads'),
+)
+
+
+def attachment_error(field, content_type, size):
+    """Why a file may not be attached as field, or None if it may"""
+    if field not in ATTACHMENT_LIMITS:
+        return "Unknown attachment type."
+    if size > ATTACHMENT_LIMITS[field]:
+        return f"{ATTACHMENT_LABELS[field]} too large. Please keep it under {ATTACHMENT_LIMITS[field] // MB}MB."
+    if field == 'image' and not content_type.startswith('image/'):
+        return TYPE_ERRORS['image']
+    if field in ATTACHMENT_TYPES and content_type not in ATTACHMENT_TYPES[field]:
+        return TYPE_ERRORS[field]
+    return None
+
+
+class StreamingUploadHandler(FileUploadHandler):
+    """
+    Spool DM attachments straight to temporary files in CHUNK_SIZE pieces,
+    hashing them (SHA-256, exposed as the file's .sha256) and enforcing
+    ATTACHMENT_LIMITS as the bytes arrive. An oversized request is cut off
+    as soon as it goes over instead of being read to the end; why is kept
+    in .errors by field name.
+    """
+    chunk_size = CHUNK_SIZE
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.errors = {}
+        self.file = None
+        self.request_length = 0
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.request_length = content_length
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.file = None
+        if field_name not in ATTACHMENT_LIMITS:
+            raise SkipFile()
+        self.limit = ATTACHMENT_LIMITS[field_name]
+        # No attachment plus the text fields can be this large; don't read it
+        if self.request_length > max(ATTACHMENT_LIMITS.values()) + settings.DATA_UPLOAD_MAX_MEMORY_SIZE:
+            self.errors[field_name] = attachment_error(field_name, '', self.request_length)
+            raise StopUpload(connection_reset=True)
+        self.sha256 = hashlib.sha256()
+        self.file = TemporaryUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.limit:
+            self.errors[self.field_name] = attachment_error(self.field_name, '', start + len(raw_data))
+            raise StopUpload(connection_reset=True)
+        self.sha256.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.sha256.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class SpooledUpload(UploadedFile):
+    """A finished resumable upload; storage moves it into place rather than copying it"""
+
+    def __init__(self, path, name, content_type, size, sha256):
+        super().__init__(open(path, 'rb'), name, content_type, size)
+        self.path = path
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def upload_path(upload):
+    return os.path.join(UPLOAD_DIR, f'{upload.pk}.part')
+
+
+def begin_upload(user, conversation, field, filename, content_type, size):
+    """
+    Begin a resumable upload of a DM attachment and return it, or raise
+    ValueError saying why it can't be sent
+    """
+    from .models import ChunkedUpload
+
+    error = attachment_error(field, content_type, size)
+    if error:
+        raise ValueError(error)
+
+    discard_uploads(ChunkedUpload.objects.filter(created_at__lt=timezone.now() - UPLOAD_EXPIRY))
+    if ChunkedUpload.objects.filter(user=user).count() >= MAX_OPEN_UPLOADS:
+        raise ValueError("Too many uploads in progress. Please wait for them to finish.")
+
+    upload = ChunkedUpload.objects.create(
+        user=user,
+        conversation=conversation,
+        field=field,
+        filename=os.path.basename(filename)[:255] or 'upload',
+        content_type=content_type,
+        size=size,
+    )
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    with open(upload_path(upload), 'xb'):
+        pass
+    return upload
+
+
+def receive_chunk(upload, offset, stream, length):
+    """
+    Write length bytes read from stream at offset and return the upload's new
+    offset. Bytes received before a dropped connection are kept, so the
+    client resumes from wherever the returned (or next fetched) offset says.
+    Returns None if another request moved the upload past offset first.
+    """
+    from .models import ChunkedUpload
+
+    if offset != upload.offset or offset + length > upload.size:
+        return None
+
+    received = 0
+    with open(upload_path(upload), 'r+b') as part:
+        part.seek(offset)
+        while received < length:
+            data = stream.read(min(CHUNK_SIZE, length - received))
+            if not data:
+                break
+            part.write(data)
+            received += len(data)
+
+    # Only one writer can advance the upload from this offset
+    claimed = ChunkedUpload.objects.filter(pk=upload.pk, offset=offset).update(offset=offset + received)
+    if not claimed:
+        return None
+    upload.offset = offset + received
+
+    if upload.offset == upload.size:
+        upload.sha256 = file_sha256(upload_path(upload))
+        upload.save(update_fields=['sha256'])
+    return upload.offset
+
+
+def file_sha256(path):
+    """SHA-256 of a file, read CHUNK_SIZE bytes at a time"""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha256.update(data)
+    return sha256.hexdigest()
+
+
+def finished_upload(user, conversation, upload_id):
+    """The user's completed resumable upload to conversation, or None"""
+    from .models import ChunkedUpload
+
+    try:
+        upload_id = uuid.UUID(str(upload_id))
+    except ValueError:
+        return None
+    return ChunkedUpload.objects.filter(
+        pk=upload_id, user=user, conversation=conversation
+    ).exclude(sha256='').first()
+
+
+def spooled_file(upload):
+    return SpooledUpload(upload_path(upload), upload.filename, upload.content_type, upload.size, upload.sha256)
+
+
+def discard_uploads(uploads):
+    """Delete resumable uploads and whatever part of their files is left"""
+    for upload in uploads:
+        try:
+            os.remove(upload_path(upload))
+        except FileNotFoundError:
+            pass
+        upload.delete()
@@ -5,6 +5,7 @@ urlpatterns = [
     # Core Tweet URLs
     path("", views.home, name="home"),
     path("tweets/", views.tweet_list, name="tweet_list"),
+    path("api/tweets/", views.tweet_list_api, name="tweet_list_api"),
     path("create/", views.tweet_create, name="tweet_create"),
     path("tweet/<int:tweet_id>/", views.tweet_detail, name="tweet_detail"),
     path("tweet/<int:tweet_id>/edit/", views.tweet_edit, name="tweet_edit"),
@@ -35,9 +36,12 @@ urlpatterns = [
     path("messages/", views.conversations_list, name="conversations_list"),
     path("messages/<int:conversation_id>/", views.conversation_detail, name="conversation_detail"),
     path("messages/start/", views.start_conversation, name="start_conversation"),
+    path("messages/<int:conversation_id>/uploads/", views.start_upload, name="start_upload"),
+    path("messages/uploads/<uuid:upload_id>/", views.upload_chunk, name="upload_chunk"),
     
     # Hashtag URLs
     path("hashtag/<str:hashtag_name>/", views.hashtag_detail, name="hashtag_detail"),
+    path("api/hashtag/<str:hashtag_name>/", views.hashtag_tweets_api, name="hashtag_tweets_api"),
     path("trending/", views.trending_hashtags, name="trending_hashtags"),
     
     # Search URLs
@@ -46,8 +50,10 @@ urlpatterns = [
     
     # Notification URLs
     path("notifications/", views.notifications_list, name="notifications_list"),
+    path("api/notifications/", views.notifications_api, name="notifications_api"),
     path("api/notifications/<int:notification_id>/read/", views.mark_notification_read, name="mark_notification_read"),
     path("api/notifications/count/", views.notifications_count, name="notifications_count"),
+    path("events/", views.event_stream, name="event_stream"),
     
     # Block and Mute URLs
     path("api/block/<str:username>/", views.block_user, name="block_user"),
@@ -59,7 +65,11 @@ urlpatterns = [
     
     # Enhanced Feed
     path("feed/", views.personalized_feed, name="personalized_feed"),
+    path("api/feed/", views.personalized_feed_api, name="personalized_feed_api"),
     
     # Debug features
     path("debug/", views.debug_features, name="debug_features"),
+    path("debug/cache/", views.cache_stats, name="cache_stats"),
+    path("debug/perf/", views.perf_stats, name="perf_stats"),
+    path("media-variants/<str:kind>/<int:width>/<path:name>", views.image_variant, name="image_variant"),
 ]
\ No newline at end of file
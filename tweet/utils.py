@@ -3,188 +3,321 @@ from django.db import models
 from .models import Notification
 
 
-def create_notification(recipient, sender, notification_type, message, tweet=None, comment=None, direct_message=None):
+def create_notification(recipient, sender, notification_type, message, tweet=None, comment=None, direct_message=None, aggregate=True):
     """
     Helper function to create notifications
     """
-    # Don't create notification if recipient is the same as sender
-    if recipient == sender:
-        return None
-    
-    # Don't create notification if recipient has blocked the sender
-    from .models import Block
-    if Block.objects.filter(blocker=recipient, blocked=sender).exists():
-        return None
-    
-    notification = Notification.objects.create(
-        recipient=recipient,
-        sender=sender,
-        notification_type=notification_type,
-        message=message,
-        tweet=tweet,
-        comment=comment,
-        direct_message=direct_message
+    create_notifications(
+        [recipient], sender, notification_type, message,
+        tweet=tweet, comment=comment, direct_message=direct_message, aggregate=aggregate
     )
+
+
+def create_notifications(recipients, sender, notification_type, message, tweet=None, comment=None, direct_message=None, aggregate=True):
+    """
+    Queue the same notification for many recipients (users or ids) in one INSERT.
+    Delivery, including the block check, happens in the notification workers.
+    Likes, follows and comments are aggregated per target unless aggregate=False.
+    """
+    from .models import NotificationJob
+    from .notifications import enqueue_notifications, group_key_for
+    
+    group_key = ''
+    if aggregate:
+        group_key = group_key_for(
+            notification_type,
+            tweet_id=getattr(tweet, 'pk', None),
+            comment_id=getattr(comment, 'pk', None)
+        )
     
-    return notification
+    enqueue_notifications([
+        NotificationJob(
+            recipient_id=getattr(recipient, 'pk', recipient),
+            sender_id=getattr(sender, 'pk', sender),
+            notification_type=notification_type,
+            message=message,
+            tweet=tweet,
+            comment=comment,
+            direct_message=direct_message,
+            group_key=group_key
+        )
+        for recipient in recipients
+    ])
+
+
+CACHED_LIST_SIZE = 50
 
 
 def get_trending_hashtags(limit=10):
     """
     Get trending hashtags based on recent activity
     """
-    from django.utils import timezone
-    from datetime import timedelta
+    from .cache import trending
     from .models import TrendingHashtag
     
-    # Update trending scores before returning
-    update_trending_hashtags()
+    # Scores are precomputed by the update_trending command; cache one list
+    # long enough for every caller and slice it
+    top = trending.get_or_compute(
+        lambda: list(TrendingHashtag.objects.select_related('hashtag')[:CACHED_LIST_SIZE]),
+        'top'
+    )
+    return top[:limit]
+
+
+def get_popular_searches(limit=5):
+    """
+    Most frequent search terms
+    """
+    from .cache import popular_searches
+    from .models import PopularSearch
     
-    return TrendingHashtag.objects.select_related('hashtag')[:limit]
+    top = popular_searches.get_or_compute(
+        lambda: list(PopularSearch.objects.all()[:CACHED_LIST_SIZE]),
+        'top'
+    )
+    return top[:limit]
 
 
 def update_trending_hashtags():
     """
     Update trending hashtag scores based on recent activity
     """
-    from django.utils import timezone
-    from datetime import timedelta
-    from django.db.models import Count
-    from .models import Hashtag, TrendingHashtag, TweetHashtag
+    from .trending import refresh_trending_hashtags
     
-    now = timezone.now()
-    twenty_four_hours_ago = now - timedelta(hours=24)
-    one_week_ago = now - timedelta(days=7)
-    
-    # Get hashtags with recent activity
-    hashtags_with_activity = Hashtag.objects.annotate(
-        tweets_24h=Count(
-            'tweet_relations',
-            filter=models.Q(tweet_relations__created_at__gte=twenty_four_hours_ago)
-        ),
-        tweets_week=Count(
-            'tweet_relations',
-            filter=models.Q(tweet_relations__created_at__gte=one_week_ago)
-        )
-    ).filter(tweets_24h__gt=0)
-    
-    for hashtag in hashtags_with_activity:
-        # Calculate trend score (weighted by recency)
-        trend_score = (hashtag.tweets_24h * 10) + (hashtag.tweets_week * 1)
-        
-        trending_hashtag, created = TrendingHashtag.objects.get_or_create(
-            hashtag=hashtag,
-            defaults={
-                'trend_score': trend_score,
-                'tweets_last_24h': hashtag.tweets_24h,
-                'tweets_last_week': hashtag.tweets_week,
-            }
-        )
-        
-        if not created:
-            trending_hashtag.trend_score = trend_score
-            trending_hashtag.tweets_last_24h = hashtag.tweets_24h
-            trending_hashtag.tweets_last_week = hashtag.tweets_week
-            trending_hashtag.save()
+    return refresh_trending_hashtags()
 
 
-def search_users(query, limit=20):
+def search_users(query, limit=20, offset=0):
     """
     Search for users by username, first name, or last name
     """
-    from django.db.models import Q
+    from .search import get_search_backend
+    
+    users = get_search_backend().filter(User.objects.all(), query)
     
-    return User.objects.filter(
-        Q(username__icontains=query) |
-        Q(first_name__icontains=query) |
-        Q(last_name__icontains=query)
-    ).select_related('userprofile')[:limit]
+    return users.select_related('userprofile').order_by('-search_rank', 'username')[offset:offset + limit]
 
 
-def search_tweets(query, user=None, limit=50):
+def search_tweets(query, user=None, limit=50, offset=0):
     """
     Search for tweets containing the query text
     """
-    from django.db.models import Q
-    from .models import Tweet, Block
+    from .likes import with_viewer_liked
+    from .models import Tweet
+    from .search import get_search_backend
     
-    tweets = Tweet.objects.filter(text__icontains=query)
+    # Anonymous searches (user=None) only see public tweets
+    tweets = get_search_backend().filter(Tweet.objects.visible_to(user), query)
     
-    # If user is provided, filter out blocked users and private tweets
-    if user:
-        # Get blocked users
-        blocked_users = Block.objects.filter(blocker=user).values_list('blocked', flat=True)
-        blocking_users = Block.objects.filter(blocked=user).values_list('blocker', flat=True)
-        
-        tweets = tweets.exclude(
-            Q(user__in=blocked_users) | Q(user__in=blocking_users)
-        )
-        
-        # Filter private tweets (only show if user follows the author)
-        from .models import Follow
-        following = Follow.objects.filter(follower=user).values_list('following', flat=True)
-        
-        tweets = tweets.filter(
-            Q(privacy='public') |
-            Q(user=user) |  # User's own tweets
-            Q(user__in=following, privacy='private')  # Private tweets from followed users
-        )
-    else:
-        # For anonymous users, only show public tweets
-        tweets = tweets.filter(privacy='public')
+    tweets = with_viewer_liked(tweets.order_by('-search_rank', '-created_at'), user)
     
-    return tweets.select_related('user').prefetch_related('likes')[:limit]
+    return tweets.select_related('user')[offset:offset + limit]
 
 
-def search_hashtags(query, limit=20):
+def search_hashtags(query, limit=20, offset=0):
     """
     Search for hashtags by name
     """
     from .models import Hashtag
+    from .search import get_search_backend
+    
+    hashtags = get_search_backend().filter(Hashtag.objects.all(), query)
     
-    return Hashtag.objects.filter(
-        name__icontains=query
-    ).order_by('-tweet_count')[:limit]
+    return hashtags.order_by('-search_rank', '-tweet_count')[offset:offset + limit]
 
 
-def get_user_feed(user, limit=50):
+def get_user_feed(user, limit=50, before=None):
     """
-    Get personalized feed for a user (tweets from followed users)
+    Get personalized feed for a user (tweets from followed users), optionally
+    only those older than a decoded keyset cursor
     """
-    from django.db.models import Q
-    from .models import Tweet, Follow, Block, Mute
-    
-    # Get users that this user follows
-    following = Follow.objects.filter(follower=user).values_list('following', flat=True)
+    from .likes import with_viewer_liked
+    from .timeline import get_timeline_tweets
     
-    # Get blocked and muted users to exclude
-    blocked_users = Block.objects.filter(blocker=user).values_list('blocked', flat=True)
-    muted_users = Mute.objects.filter(muter=user).values_list('muted', flat=True)
+    # Read the precomputed home timeline instead of scanning every followed account
+    feed_tweets = with_viewer_liked(get_timeline_tweets(user, limit=limit, before=before), user)
     
-    # Get tweets from followed users + user's own tweets
-    feed_tweets = Tweet.objects.filter(
-        Q(user__in=following) | Q(user=user)
-    ).exclude(
-        Q(user__in=blocked_users) | Q(user__in=muted_users)
-    ).filter(
-        Q(privacy='public') | Q(user=user) | Q(user__in=following)
-    ).select_related('user').prefetch_related('likes', 'hashtag_relations__hashtag')
-    
-    return feed_tweets[:limit]
+    return feed_tweets.select_related('user__userprofile').prefetch_related('hashtag_relations__hashtag')
 
 
 def get_unread_notifications_count(user):
     """
     Get count of unread notifications for a user
     """
-    return Notification.objects.filter(recipient=user, is_read=False).count()
+    return get_unread_counts(user)['notifications']
+
+
+async def aget_unread_notifications_count(user):
+    """
+    get_unread_notifications_count() for async views; a cache miss runs only
+    the notification COUNT and leaves filling the badge cache to page renders
+    """
+    from .cache import unread_counts
+    
+    counts = await unread_counts.aget(user.pk)
+    if counts is not None:
+        return counts['notifications']
+    return await Notification.objects.filter(recipient=user, is_read=False).acount()
+
+
+def get_unread_counts(user):
+    """
+    Unread notification, conversation and message counts behind the navbar
+    badges, cached per user until a notification, message or read changes them
+    """
+    from .cache import unread_counts
+    
+    return unread_counts.get_or_compute(
+        lambda: {
+            'notifications': Notification.objects.filter(recipient=user, is_read=False).count(),
+            'conversations': get_unread_conversations_count(user),
+            'messages': get_unread_messages_count(user),
+        },
+        user.pk
+    )
+
+
+def invalidate_unread_counts(*user_ids):
+    """
+    Drop cached badge counts, e.g. after a bulk update that sends no signals,
+    and tell the users' open event streams to refresh them
+    """
+    from . import events
+    from .cache import unread_counts
+    
+    unread_counts.invalidate_many(user_ids)
+    events.publish(user_ids, 'counts')
 
 
 def mark_all_notifications_read(user):
     """
     Mark all notifications as read for a user
     """
-    return Notification.objects.filter(recipient=user, is_read=False).update(is_read=True)
+    updated = Notification.objects.filter(recipient=user, is_read=False).update(is_read=True)
+    invalidate_unread_counts(user.pk)
+    return updated
+
+
+def mark_conversation_read(conversation, user, up_to_message_id=None):
+    """
+    Advance the user's read cursor (by default to the newest message) in one UPDATE
+    """
+    from django.db.models import F, Max, OuterRef, Subquery, Value
+    from django.db.models.functions import Coalesce, Greatest
+    from django.utils import timezone
+    from .models import ConversationReadState, DirectMessage
+    
+    if up_to_message_id is None:
+        newest = DirectMessage.objects.filter(
+            conversation=OuterRef('conversation')
+        ).order_by().values('conversation').annotate(last_id=Max('id')).values('last_id')
+        target = Coalesce(Subquery(newest), Value(0))
+    else:
+        target = Value(up_to_message_id)
+    now = timezone.now()
+    
+    updated = ConversationReadState.objects.filter(
+        conversation=conversation,
+        user=user
+    ).update(
+        last_read_message_id=Greatest(F('last_read_message_id'), target),
+        last_read_at=now
+    )
+    if not updated:
+        if up_to_message_id is None:
+            up_to_message_id = conversation.messages.aggregate(last_id=Max('id'))['last_id'] or 0
+        ConversationReadState.objects.get_or_create(
+            conversation=conversation,
+            user=user,
+            defaults={'last_read_message_id': up_to_message_id, 'last_read_at': now}
+        )
+    invalidate_unread_counts(user.pk)
+
+
+def get_read_cursor(conversation, user):
+    """
+    Id of the newest message the user has read in the conversation (0 if none)
+    """
+    from .models import ConversationReadState
+    
+    return ConversationReadState.objects.filter(
+        conversation=conversation,
+        user=user
+    ).values_list('last_read_message_id', flat=True).first() or 0
+
+
+def unread_messages_for(user):
+    """
+    Messages from others that are past the user's read cursor in their conversation
+    """
+    from django.db.models import OuterRef, Subquery
+    from django.db.models.functions import Coalesce
+    from .models import ConversationReadState, DirectMessage
+    
+    last_read = ConversationReadState.objects.filter(
+        conversation=OuterRef('conversation'),
+        user=user
+    ).values('last_read_message_id')
+    
+    return DirectMessage.objects.filter(
+        id__gt=Coalesce(Subquery(last_read), 0)
+    ).exclude(sender=user)
+
+
+def with_unread_counts(conversations, user):
+    """
+    Annotate a Conversation queryset with unread_count for the given user
+    """
+    from django.db.models import F, Func, IntegerField, OuterRef, Subquery, Value
+    from django.db.models.functions import Coalesce
+    
+    counts = unread_messages_for(user).filter(
+        conversation=OuterRef('pk')
+    ).order_by().annotate(total=Func(F('id'), function='COUNT')).values('total')
+    
+    return conversations.annotate(
+        unread_count=Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+    )
+
+
+def with_last_messages(conversations):
+    """
+    Evaluate a Conversation queryset with each row's latest message (and its
+    sender) set as last_message, using two queries however many rows there are
+    """
+    from django.db.models import OuterRef, Subquery
+    from .models import DirectMessage
+    
+    latest = DirectMessage.objects.filter(
+        conversation=OuterRef('pk')
+    ).order_by('-sent_at', '-id').values('id')[:1]
+    conversations = list(conversations.annotate(last_message_id=Subquery(latest)))
+    
+    messages = DirectMessage.objects.select_related('sender').in_bulk(
+        [conversation.last_message_id for conversation in conversations if conversation.last_message_id]
+    )
+    for conversation in conversations:
+        conversation.last_message = messages.get(conversation.last_message_id)
+    return conversations
+
+
+def get_unread_conversations_count(user):
+    """
+    Count conversations with unread messages for a user in one query
+    """
+    from django.db.models import Exists, OuterRef
+    from .models import Conversation
+    
+    return Conversation.objects.filter(participants=user).filter(
+        Exists(unread_messages_for(user).filter(conversation=OuterRef('pk')))
+    ).count()
+
+
+def get_unread_messages_count(user):
+    """
+    Count messages past the user's read cursor across all conversations
+    """
+    return unread_messages_for(user).filter(conversation__participants=user).count()
 
 
 def get_conversation_for_users(user1, user2):
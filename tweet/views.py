@@ -1,50 +1,91 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login
 from django.contrib import messages
 from django.http import JsonResponse, HttpResponse
 from django.contrib.auth.models import User
-from django.db.models import Q
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.db.models import Prefetch, Q
+from .likes import with_viewer_liked
 from .models import Tweet, UserProfile, Comment
+from .relationships import FollowGraph
 from .forms import TweetForm, CustomUserCreationForm, UserProfileForm, ReplyForm, CommentForm
 
 def home(request):
     """Home page showing recent tweets"""
-    if request.user.is_authenticated:
-        # Show public tweets and user's own tweets
-        tweets = Tweet.objects.filter(
-            Q(privacy='public') | Q(user=request.user)
-        ).filter(parent_tweet__isnull=True)[:10]  # Latest 10 parent tweets
-    else:
-        tweets = Tweet.objects.filter(privacy='public', parent_tweet__isnull=True)[:10]
+    tweets = with_viewer_liked(Tweet.objects.visible_to(request.user).filter(
+        parent_tweet__isnull=True
+    ), request.user).select_related('user__userprofile')[:10]  # Latest 10 parent tweets
     
     return render(request, "home.html", {"tweets": tweets})
 
-def tweet_list(request):
-    """List all tweets with search functionality"""
-    search_query = request.GET.get('search', '')
-    
-    # Base queryset - only show public tweets and user's own tweets
-    if request.user.is_authenticated:
-        tweets = Tweet.objects.filter(
-            Q(privacy='public') | Q(user=request.user)
-        ).filter(parent_tweet__isnull=True)  # Only show parent tweets, not replies
-    else:
-        tweets = Tweet.objects.filter(privacy='public', parent_tweet__isnull=True)
+def _tweet_list_queryset(request, search_query):
+    """Parent tweets visible on the tweet list, optionally narrowed by a search"""
+    # Only show parent tweets, not replies
+    tweets = Tweet.objects.visible_to(request.user).filter(parent_tweet__isnull=True)
     
     if search_query:
+        from .search import get_search_backend
+        backend = get_search_backend()
         tweets = tweets.filter(
-            Q(text__icontains=search_query) |
-            Q(user__username__icontains=search_query)
-        ).order_by("-created_at")
-    else:
-        tweets = tweets.order_by("-created_at")
+            Q(pk__in=backend.filter(Tweet.objects.all(), search_query).values('pk')) |
+            Q(user__in=backend.filter(User.objects.all(), search_query).values('pk'))
+        )
+    
+    return with_viewer_liked(tweets, request.user).select_related('user__userprofile')
+
+
+def _serialize_tweet(tweet):
+    return {
+        'id': tweet.id,
+        'user': tweet.user.username,
+        'text': tweet.text,
+        'image': tweet.image.url if tweet.image else None,
+        'image_srcset': tweet.get_image_attrs()['srcset'] if tweet.image else None,
+        'privacy': tweet.privacy,
+        'created_at': tweet.created_at.isoformat(),
+        'likes_count': tweet.likes_count,
+        'replies_count': tweet.replies_count,
+        'comments_count': tweet.comments_count,
+        'url': reverse('tweet_detail', args=[tweet.id]),
+    }
+
+
+def _page_json(page, serialize):
+    return JsonResponse({
+        'results': [serialize(item) for item in page],
+        'has_next': page.has_next,
+        'next_cursor': page.next_cursor,
+    })
+
+def tweet_list(request):
+    """List all tweets with search functionality"""
+    from .pagination import paginate_keyset
+    
+    search_query = request.GET.get('search', '')
+    page = paginate_keyset(
+        _tweet_list_queryset(request, search_query),
+        before=request.GET.get('before')
+    )
     
     return render(request, "tweet_list.html", {
-        "tweets": tweets, 
+        "tweets": page.items,
+        "page": page,
         "search_query": search_query
     })
 
+def tweet_list_api(request):
+    """Next page of the tweet list for infinite scroll (AJAX)"""
+    from .pagination import paginate_keyset
+    
+    page = paginate_keyset(
+        _tweet_list_queryset(request, request.GET.get('search', '')),
+        before=request.GET.get('before')
+    )
+    return _page_json(page, _serialize_tweet)
+
 @login_required
 def tweet_create(request):
     """Create a new tweet"""
@@ -84,23 +125,25 @@ def tweet_delete(request, tweet_id):
         return redirect("tweet_list")
     return render(request, "tweet_confirm_delete.html", {"tweet": tweet})
 
-@login_required
-def like_tweet(request, tweet_id):
-    """Like/unlike a tweet via AJAX"""
-    tweet = get_object_or_404(Tweet, id=tweet_id)
-    
-    if request.user in tweet.likes.all():
-        tweet.likes.remove(request.user)
-        liked = False
-    else:
-        tweet.likes.add(request.user)
-        liked = True
+async def _toggle_like(request, obj):
+    """Like or unlike obj for the requesting user; returns the JSON both like views send"""
+    from asgiref.sync import sync_to_async
+    from .likes import toggle_like
     
+    # One transaction, which the async ORM can't open itself
+    liked, likes_count = await sync_to_async(toggle_like)(obj, await request.auser())
     return JsonResponse({
         'liked': liked,
-        'likes_count': tweet.get_likes_count()
+        'likes_count': likes_count
     })
 
+
+@login_required
+async def like_tweet(request, tweet_id):
+    """Like/unlike a tweet via AJAX"""
+    tweet = await aget_object_or_404(Tweet, id=tweet_id)
+    return await _toggle_like(request, tweet)
+
 def register(request):
     """User registration"""
     if request.method == 'POST':
@@ -124,32 +167,38 @@ def user_profile(request, username):
     if request.user != profile_user and request.user.is_authenticated:
         profile.increment_profile_views()
     
+    # Check if current user is following this profile (loads their following set once)
+    is_following = False
+    if request.user.is_authenticated and request.user != profile_user:
+        is_following = FollowGraph.is_following(request.user, profile_user)
+    
+    can_view_private_content = (
+        request.user == profile_user or 
+        not profile.is_private or 
+        is_following
+    )
+    
     # Get user's tweets with privacy filtering
-    if request.user.is_authenticated:
-        if request.user == profile_user or not profile.is_private or request.user in profile.followers.all():
-            tweets = Tweet.objects.filter(user=profile_user, parent_tweet__isnull=True).order_by('-created_at')
-        else:
-            tweets = Tweet.objects.filter(user=profile_user, privacy='public', parent_tweet__isnull=True).order_by('-created_at')
+    if request.user.is_authenticated and can_view_private_content:
+        tweets = Tweet.objects.filter(user=profile_user, parent_tweet__isnull=True).order_by('-created_at')
     else:
         tweets = Tweet.objects.filter(user=profile_user, privacy='public', parent_tweet__isnull=True).order_by('-created_at')
+    tweets = with_viewer_liked(tweets, request.user).select_related('user__userprofile')
     
-    # Get stats
-    total_likes = sum(tweet.get_likes_count() for tweet in Tweet.objects.filter(user=profile_user))
-    total_replies = Tweet.objects.filter(user=profile_user, parent_tweet__isnull=False).count()
-    
-    # Check if current user is following this profile
-    is_following = False
-    if request.user.is_authenticated and request.user != profile_user:
-        is_following = request.user in profile.followers.all()
+    # Get stats (single aggregate query, cached until a follow/like/tweet changes them)
+    from .profile_stats import get_cached_profile_stats
+    stats = get_cached_profile_stats(profile_user)
     
     # Get recent followers (for display)
-    recent_followers = profile.followers.all()[:6]
+    recent_followers = FollowGraph.followers_of(profile_user).select_related('userprofile')[:6]
     
     # Get mutual followers (if viewing someone else's profile)
     mutual_followers = []
+    mutual_followers_count = 0
     if request.user.is_authenticated and request.user != profile_user:
-        user_profile, _ = UserProfile.objects.get_or_create(user=request.user)
-        mutual_followers = profile.followers.filter(id__in=user_profile.followers.all())[:3]
+        mutuals = FollowGraph.mutuals(profile_user, request.user)
+        mutual_followers = mutuals[:3]
+        mutual_followers_count = mutuals.count() if mutual_followers else 0
     
     # Profile completion for profile owner
     show_completion = request.user == profile_user
@@ -158,17 +207,15 @@ def user_profile(request, username):
         'profile_user': profile_user,
         'profile': profile,
         'tweets': tweets,
-        'total_likes': total_likes,
-        'total_replies': total_replies,
+        'stats': stats,
+        'total_likes': stats['likes_received'],
+        'total_replies': stats['replies'],
         'is_following': is_following,
         'recent_followers': recent_followers,
         'mutual_followers': mutual_followers,
+        'mutual_followers_count': mutual_followers_count,
         'show_completion': show_completion,
-        'can_view_private_content': (
-            request.user == profile_user or 
-            not profile.is_private or 
-            (request.user.is_authenticated and request.user in profile.followers.all())
-        )
+        'can_view_private_content': can_view_private_content
     }
     
     return render(request, 'user_profile.html', context)
@@ -196,7 +243,6 @@ def follow_user(request, username):
     """Follow/unfollow a user with AJAX support"""
     if request.method == 'POST':
         user_to_follow = get_object_or_404(User, username=username)
-        profile_to_follow, _ = UserProfile.objects.get_or_create(user=user_to_follow)
         
         if request.user == user_to_follow:
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -204,15 +250,12 @@ def follow_user(request, username):
             messages.error(request, 'You cannot follow yourself.')
             return redirect('user_profile', username=username)
         
-        is_following = request.user in profile_to_follow.followers.all()
-        
-        if is_following:
-            profile_to_follow.followers.remove(request.user)
+        if FollowGraph.unfollow(request.user, user_to_follow):
             action = 'unfollowed'
             button_text = 'Follow'
             button_class = 'btn-outline-primary'
         else:
-            profile_to_follow.followers.add(request.user)
+            FollowGraph.follow(request.user, user_to_follow)
             action = 'followed'
             button_text = 'Following'
             button_class = 'btn-primary'
@@ -222,7 +265,7 @@ def follow_user(request, username):
                 'action': action,
                 'button_text': button_text,
                 'button_class': button_class,
-                'followers_count': profile_to_follow.get_followers_count()
+                'followers_count': FollowGraph.followers_of(user_to_follow).count()
             })
         
         messages.success(request, f'You {action} @{username}')
@@ -255,7 +298,9 @@ def tweet_reply(request, tweet_id):
 
 def tweet_detail(request, tweet_id):
     """Show tweet detail with replies and comments"""
-    tweet = get_object_or_404(Tweet, id=tweet_id)
+    tweet = get_object_or_404(
+        with_viewer_liked(Tweet.objects.select_related('user__userprofile'), request.user), id=tweet_id
+    )
     
     # Check if user can view this tweet
     if tweet.privacy == 'private' and not request.user.is_authenticated:
@@ -264,16 +309,18 @@ def tweet_detail(request, tweet_id):
     
     if tweet.privacy == 'private' and request.user != tweet.user:
         # Check if user follows the tweet author
-        profile = getattr(tweet.user, 'userprofile', None)
-        if not profile or request.user not in profile.followers.all():
+        if not FollowGraph.is_following(request.user, tweet.user):
             messages.error(request, 'This tweet is private.')
             return redirect('tweet_list')
     
     # Get all tweets in this thread
-    thread_tweets = tweet.get_thread_tweets()
+    thread_tweets = tweet.get_thread_tweets().select_related('user__userprofile')
     
     # Get comments for this tweet
-    comments = Comment.objects.filter(tweet=tweet, parent_comment__isnull=True)
+    replies = with_viewer_liked(Comment.objects.select_related('user__userprofile'), request.user)
+    comments = with_viewer_liked(
+        Comment.objects.filter(tweet=tweet, parent_comment__isnull=True), request.user
+    ).select_related('user__userprofile').prefetch_related(Prefetch('replies', queryset=replies))
     
     # Forms for replies and comments
     reply_form = ReplyForm() if request.user.is_authenticated else None
@@ -327,21 +374,10 @@ def reply_to_comment(request, comment_id):
     return redirect("tweet_detail", tweet_id=parent_comment.tweet.id)
 
 @login_required
-def like_comment(request, comment_id):
+async def like_comment(request, comment_id):
     """Like/unlike a comment via AJAX"""
-    comment = get_object_or_404(Comment, id=comment_id)
-    
-    if request.user in comment.likes.all():
-        comment.likes.remove(request.user)
-        liked = False
-    else:
-        comment.likes.add(request.user)
-        liked = True
-    
-    return JsonResponse({
-        'liked': liked,
-        'likes_count': comment.get_likes_count()
-    })
+    comment = await aget_object_or_404(Comment, id=comment_id)
+    return await _toggle_like(request, comment)
 
 @login_required
 def delete_comment(request, comment_id):
@@ -361,73 +397,73 @@ def delete_comment(request, comment_id):
 # ====================
 
 @login_required
-def follow_user_new(request, username):
+async def follow_user_new(request, username):
     """Enhanced follow system with follow requests for private accounts"""
     if request.method == 'POST':
-        user_to_follow = get_object_or_404(User, username=username)
+        user = await request.auser()
+        user_to_follow = await aget_object_or_404(User, username=username)
         
-        if request.user == user_to_follow:
+        if user == user_to_follow:
             return JsonResponse({'error': 'You cannot follow yourself'}, status=400)
         
-        from .models import Follow, FollowRequest, Block
+        from asgiref.sync import sync_to_async
+        from .models import FollowRequest, Block
         from .utils import create_notification
         
         # Check if user is blocked
-        if Block.objects.filter(blocker=user_to_follow, blocked=request.user).exists():
+        if await Block.objects.filter(blocker=user_to_follow, blocked=user).aexists():
             return JsonResponse({'error': 'You cannot follow this user'}, status=400)
         
-        profile_to_follow = get_object_or_404(UserProfile, user=user_to_follow)
+        profile_to_follow = await aget_object_or_404(UserProfile, user=user_to_follow)
         
-        # Check if already following
-        existing_follow = Follow.objects.filter(follower=request.user, following=user_to_follow).first()
+        followers = FollowGraph.followers_of(user_to_follow)
         
-        if existing_follow:
-            # Unfollow
-            existing_follow.delete()
+        # Unfollow if already following
+        if await FollowGraph.aunfollow(user, user_to_follow):
             return JsonResponse({
                 'action': 'unfollowed',
                 'button_text': 'Follow',
-                'followers_count': Follow.objects.filter(following=user_to_follow).count()
+                'followers_count': await followers.acount()
             })
         else:
             if profile_to_follow.is_private:
                 # Create follow request
-                follow_request, created = FollowRequest.objects.get_or_create(
-                    from_user=request.user,
+                follow_request, created = await FollowRequest.objects.aget_or_create(
+                    from_user=user,
                     to_user=user_to_follow,
                     defaults={'status': 'pending'}
                 )
                 
                 if created:
                     # Send notification
-                    create_notification(
+                    await sync_to_async(create_notification)(
                         recipient=user_to_follow,
-                        sender=request.user,
+                        sender=user,
                         notification_type='follow_request',
-                        message=f"{request.user.username} requested to follow you"
+                        message=f"{user.username} requested to follow you"
                     )
                 
                 return JsonResponse({
                     'action': 'requested',
                     'button_text': 'Requested',
-                    'followers_count': Follow.objects.filter(following=user_to_follow).count()
+                    'followers_count': await followers.acount()
                 })
             else:
                 # Follow directly
-                Follow.objects.create(follower=request.user, following=user_to_follow)
+                await FollowGraph.afollow(user, user_to_follow)
                 
                 # Send notification
-                create_notification(
+                await sync_to_async(create_notification)(
                     recipient=user_to_follow,
-                    sender=request.user,
+                    sender=user,
                     notification_type='follow',
-                    message=f"{request.user.username} started following you"
+                    message=f"{user.username} started following you"
                 )
                 
                 return JsonResponse({
                     'action': 'followed',
                     'button_text': 'Following',
-                    'followers_count': Follow.objects.filter(following=user_to_follow).count()
+                    'followers_count': await followers.acount()
                 })
     
     return JsonResponse({'error': 'Invalid request'}, status=400)
@@ -470,7 +506,8 @@ def handle_follow_request(request, request_id):
                     recipient=follow_request.from_user,
                     sender=request.user,
                     notification_type='follow',
-                    message=f"{request.user.username} accepted your follow request"
+                    message=f"{request.user.username} accepted your follow request",
+                    aggregate=False
                 )
                 messages.success(request, f'You accepted {follow_request.from_user.username}\'s follow request.')
         elif action == 'reject':
@@ -515,9 +552,11 @@ def following_list(request, username):
 @login_required
 def conversations_list(request):
     """List all conversations for the user"""
-    from .models import Conversation
+    from .utils import with_last_messages
     
-    conversations = request.user.conversations.all().prefetch_related('participants')
+    conversations = with_last_messages(
+        request.user.conversations.all().prefetch_related('participants__userprofile')
+    )
     
     return render(request, 'conversations_list.html', {
         'conversations': conversations
@@ -525,10 +564,23 @@ def conversations_list(request):
 
 
 @login_required
+@csrf_exempt
 def conversation_detail(request, conversation_id):
     """View conversation and send messages"""
+    # Attachments stream to disk instead of memory. The handler has to be in
+    # place before anything reads the body, CSRF checking included, so that
+    # happens in _conversation_detail instead.
+    from .uploads import StreamingUploadHandler
+    upload_handler = StreamingUploadHandler(request)
+    request.upload_handlers = [upload_handler]
+    return _conversation_detail(request, conversation_id, upload_handler.errors)
+
+
+@csrf_protect
+def _conversation_detail(request, conversation_id, upload_errors):
     from .models import Conversation, DirectMessage
     from .forms import DirectMessageForm
+    from .uploads import DIRECT_UPLOAD_MAX, discard_uploads, finished_upload, spooled_file
     
     conversation = get_object_or_404(
         Conversation,
@@ -536,15 +588,32 @@ def conversation_detail(request, conversation_id):
         participants=request.user
     )
     
-    # Mark messages as read
-    unread_messages = conversation.messages.exclude(sender=request.user).exclude(read_by=request.user)
-    for message in unread_messages:
-        message.mark_as_read(request.user)
+    # Mark messages as read (advances the read cursor with a single UPDATE)
+    from .utils import mark_conversation_read, with_unread_counts
+    mark_conversation_read(conversation, request.user)
     
-    messages_list = conversation.messages.all().select_related('sender').prefetch_related('read_by')
+    messages_list = conversation.messages.all().select_related('sender')
+    
+    # Newest message any other participant has read, for "seen" ticks
+    from django.db.models import Max
+    read_by_others_up_to = conversation.read_states.exclude(user=request.user).aggregate(
+        last_id=Max('last_read_message_id')
+    )['last_id'] or 0
     
     if request.method == 'POST':
-        form = DirectMessageForm(request.POST, request.FILES)
+        files = request.FILES
+        upload = None
+        if request.POST.get('upload'):
+            # An attachment sent ahead through the resumable upload endpoints
+            upload = finished_upload(request.user, conversation, request.POST['upload'])
+            if upload is not None:
+                files = files.copy()
+                files[upload.field] = spooled_file(upload)
+        form = DirectMessageForm(request.POST, files)
+        for field, error in upload_errors.items():
+            form.add_error(field, error)
+        if request.POST.get('upload') and upload is None:
+            form.add_error(None, "That upload has expired. Please attach the file again.")
         if form.is_valid():
             message = form.save(commit=False)
             message.conversation = conversation
@@ -563,32 +632,112 @@ def conversation_detail(request, conversation_id):
                 message.message_type = 'text'
             
             message.save()
+            if upload is not None:
+                # Storage moved its part file into place, unless it was a duplicate
+                discard_uploads([upload])
             
             # Update conversation timestamp
             conversation.save()
             
-            # Send notifications to other participants
-            from .utils import create_notification
-            for participant in conversation.participants.exclude(id=request.user.id):
-                create_notification(
-                    recipient=participant,
-                    sender=request.user,
-                    notification_type='direct_message',
-                    message=f"{request.user.username} sent you a message",
-                    direct_message=message
-                )
+            # The sender has seen their own message
+            mark_conversation_read(conversation, request.user)
+            
+            # Queue notifications for the other participants in one INSERT
+            from .utils import create_notifications
+            create_notifications(
+                conversation.participants.exclude(id=request.user.id).values_list('id', flat=True),
+                sender=request.user,
+                notification_type='direct_message',
+                message=f"{request.user.username} sent you a message",
+                direct_message=message
+            )
             
             return redirect('conversation_detail', conversation_id=conversation.id)
     else:
         form = DirectMessageForm()
     
+    conversations = with_unread_counts(
+        request.user.conversations.prefetch_related('participants'),
+        request.user
+    )
+    
     return render(request, 'conversation_detail.html', {
         'conversation': conversation,
+        'conversations': conversations,
         'messages': messages_list,
-        'form': form
+        'read_by_others_up_to': read_by_others_up_to,
+        'form': form,
+        'direct_upload_max': DIRECT_UPLOAD_MAX,
     })
 
 
+@login_required
+def start_upload(request, conversation_id):
+    """Begin a resumable upload of a large DM attachment"""
+    from .models import Conversation
+    from .uploads import RESUMABLE_CHUNK_SIZE, begin_upload
+    
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+    conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user)
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        size = 0
+    if size <= 0:
+        return JsonResponse({'error': 'Invalid file size'}, status=400)
+    
+    try:
+        upload = begin_upload(
+            request.user,
+            conversation,
+            request.POST.get('field', ''),
+            request.POST.get('filename', ''),
+            request.POST.get('content_type', ''),
+            size,
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return JsonResponse({
+        'id': str(upload.id),
+        'url': reverse('upload_chunk', args=[upload.id]),
+        'offset': 0,
+        'chunk_size': RESUMABLE_CHUNK_SIZE,
+    }, status=201)
+
+
+@login_required
+def upload_chunk(request, upload_id):
+    """
+    GET: how many bytes of an upload have arrived, to resume from there.
+    PUT: append the request body at the Upload-Offset header's position.
+    """
+    from .models import ChunkedUpload
+    from .uploads import receive_chunk
+    
+    upload = get_object_or_404(ChunkedUpload, id=upload_id, user=request.user)
+    if request.method == 'GET':
+        return JsonResponse({'offset': upload.offset, 'size': upload.size, 'complete': bool(upload.sha256)})
+    if request.method != 'PUT':
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+    
+    try:
+        offset = int(request.headers['Upload-Offset'])
+        length = int(request.headers['Content-Length'])
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Upload-Offset and Content-Length are required'}, status=400)
+    if offset + length > upload.size:
+        return JsonResponse({'error': 'More data than the file size given'}, status=413)
+    
+    new_offset = receive_chunk(upload, offset, request, length)
+    if new_offset is None:
+        # Resend from the offset the server has
+        upload.refresh_from_db(fields=['offset'])
+        return JsonResponse({'error': 'Offset mismatch', 'offset': upload.offset}, status=409)
+    return JsonResponse({'offset': new_offset, 'complete': new_offset == upload.size})
+
+
 @login_required
 def start_conversation(request):
     """Start a new conversation"""
@@ -638,38 +787,38 @@ def start_conversation(request):
 # HASHTAG AND TRENDING VIEWS
 # ====================
 
+def _hashtag_tweets(request, hashtag):
+    """Tweets carrying a hashtag that the current user may see"""
+    return with_viewer_liked(Tweet.objects.visible_to(request.user).filter(
+        hashtag_relations__hashtag=hashtag
+    ), request.user).select_related('user__userprofile')
+
+
 def hashtag_detail(request, hashtag_name):
     """View tweets with a specific hashtag"""
-    from .models import Hashtag, TweetHashtag
+    from .models import Hashtag
+    from .pagination import paginate_keyset
     
     hashtag = get_object_or_404(Hashtag, name=hashtag_name.lower())
-    
-    # Get tweets with this hashtag
-    tweet_relations = TweetHashtag.objects.filter(hashtag=hashtag).select_related('tweet__user')
-    tweets = [relation.tweet for relation in tweet_relations]
-    
-    # Filter based on privacy and user permissions
-    if request.user.is_authenticated:
-        from .models import Follow, Block
-        following = Follow.objects.filter(follower=request.user).values_list('following', flat=True)
-        blocked_users = Block.objects.filter(blocker=request.user).values_list('blocked', flat=True)
-        
-        filtered_tweets = []
-        for tweet in tweets:
-            if tweet.user in blocked_users:
-                continue
-            if tweet.privacy == 'public' or tweet.user == request.user or tweet.user in following:
-                filtered_tweets.append(tweet)
-        tweets = filtered_tweets
-    else:
-        tweets = [tweet for tweet in tweets if tweet.privacy == 'public']
+    page = paginate_keyset(_hashtag_tweets(request, hashtag), before=request.GET.get('before'))
     
     return render(request, 'hashtag_detail.html', {
         'hashtag': hashtag,
-        'tweets': tweets
+        'tweets': page.items,
+        'page': page
     })
 
 
+def hashtag_tweets_api(request, hashtag_name):
+    """Next page of a hashtag's tweets for infinite scroll (AJAX)"""
+    from .models import Hashtag
+    from .pagination import paginate_keyset
+    
+    hashtag = get_object_or_404(Hashtag, name=hashtag_name.lower())
+    page = paginate_keyset(_hashtag_tweets(request, hashtag), before=request.GET.get('before'))
+    return _page_json(page, _serialize_tweet)
+
+
 def trending_hashtags(request):
     """View trending hashtags"""
     from .utils import get_trending_hashtags
@@ -720,14 +869,22 @@ def search(request):
         if not created:
             popular_search.increment_count()
         
+        # Ranked results, paged with ?page=
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        results['page'] = page
+        viewer = request.user if request.user.is_authenticated else None
+        
         if search_type == 'general' or search_type == 'users':
-            results['users'] = search_users(query, limit=10)
+            results['users'] = search_users(query, limit=10, offset=(page - 1) * 10)
         
         if search_type == 'general' or search_type == 'tweets':
-            results['tweets'] = search_tweets(query, user=request.user, limit=20)
+            results['tweets'] = search_tweets(query, user=viewer, limit=20, offset=(page - 1) * 20)
         
         if search_type == 'general' or search_type == 'hashtags':
-            results['hashtags'] = search_hashtags(query, limit=10)
+            results['hashtags'] = search_hashtags(query, limit=10, offset=(page - 1) * 10)
     
     return render(request, 'search_results.html', {
         'form': form,
@@ -746,13 +903,18 @@ def advanced_search(request):
     if form.is_valid():
         query_filters = Q()
         
+        from .search import get_search_backend
+        backend = get_search_backend()
+        
         # Text search
         if form.cleaned_data.get('query'):
-            query_filters &= Q(text__icontains=form.cleaned_data['query'])
+            matches = backend.filter(Tweet.objects.all(), form.cleaned_data['query'])
+            query_filters &= Q(id__in=matches.values('pk'))
         
         # User search
         if form.cleaned_data.get('from_user'):
-            query_filters &= Q(user__username__icontains=form.cleaned_data['from_user'])
+            authors = backend.filter(User.objects.all(), form.cleaned_data['from_user'])
+            query_filters &= Q(user__in=authors.values('pk'))
         
         # Hashtag search
         if form.cleaned_data.get('hashtag'):
@@ -776,30 +938,12 @@ def advanced_search(request):
         
         # Minimum likes filter
         if form.cleaned_data.get('min_likes'):
-            from django.db.models import Count
-            tweets_with_likes = Tweet.objects.annotate(
-                likes_count=Count('likes')
-            ).filter(likes_count__gte=form.cleaned_data['min_likes']).values_list('id', flat=True)
-            query_filters &= Q(id__in=tweets_with_likes)
+            query_filters &= Q(likes_count__gte=form.cleaned_data['min_likes'])
         
-        # Apply filters
-        tweets = Tweet.objects.filter(query_filters)
+        # Apply filters, restricted to what the viewer may see
+        tweets = Tweet.objects.visible_to(request.user).filter(query_filters)
         
-        # Apply privacy filters
-        if request.user.is_authenticated:
-            from .models import Follow, Block
-            following = Follow.objects.filter(follower=request.user).values_list('following', flat=True)
-            blocked_users = Block.objects.filter(blocker=request.user).values_list('blocked', flat=True)
-            
-            tweets = tweets.filter(
-                Q(privacy='public') |
-                Q(user=request.user) |
-                Q(user__in=following, privacy='private')
-            ).exclude(user__in=blocked_users)
-        else:
-            tweets = tweets.filter(privacy='public')
-        
-        tweets = tweets.select_related('user').prefetch_related('likes')[:50]
+        tweets = with_viewer_liked(tweets, request.user).select_related('user')[:50]
     
     return render(request, 'advanced_search.html', {
         'form': form,
@@ -811,28 +955,62 @@ def advanced_search(request):
 # NOTIFICATION VIEWS
 # ====================
 
+NOTIFICATIONS_PAGE_SIZE = 50
+
+
+def _serialize_notification(notification):
+    return {
+        'id': notification.id,
+        'type': notification.notification_type,
+        'message': notification.message,
+        'sender': notification.sender.username if notification.sender else None,
+        'actor_count': notification.actor_count,
+        'tweet_id': notification.tweet_id,
+        'is_read': notification.is_read,
+        'created_at': notification.created_at.isoformat(),
+    }
+
+
 @login_required
 def notifications_list(request):
-    """List all notifications for the user"""
+    """List notifications for the user, newest first, one page at a time"""
     from .models import Notification
+    from .pagination import paginate_keyset
+    from .utils import mark_all_notifications_read
     
-    # Get all notifications first (without slicing)
     all_notifications = Notification.objects.filter(
         recipient=request.user
-    ).select_related('sender', 'tweet__user', 'comment__user').order_by('-created_at')
+    ).select_related('sender__userprofile', 'tweet__user', 'comment__user', 'comment__tweet')
     
-    # Mark unread notifications as read BEFORE slicing
-    unread_notifications = all_notifications.filter(is_read=False)
-    unread_notifications.update(is_read=True)
+    page = paginate_keyset(
+        all_notifications,
+        before=request.GET.get('before'),
+        per_page=NOTIFICATIONS_PAGE_SIZE
+    )
     
-    # Now slice to get the first 50 notifications
-    notifications = all_notifications[:50]
+    # The page was fetched above, so it still shows what was unread on arrival
+    mark_all_notifications_read(request.user)
     
     return render(request, 'notifications_list.html', {
-        'notifications': notifications
+        'notifications': page.items,
+        'page': page
     })
 
 
+@login_required
+def notifications_api(request):
+    """Next page of notifications for infinite scroll (AJAX)"""
+    from .models import Notification
+    from .pagination import paginate_keyset
+    
+    page = paginate_keyset(
+        Notification.objects.filter(recipient=request.user).select_related('sender'),
+        before=request.GET.get('before'),
+        per_page=NOTIFICATIONS_PAGE_SIZE
+    )
+    return _page_json(page, _serialize_notification)
+
+
 @login_required
 def mark_notification_read(request, notification_id):
     """Mark a specific notification as read"""
@@ -853,38 +1031,86 @@ def mark_notification_read(request, notification_id):
 
 
 @login_required
-def notifications_count(request):
+async def notifications_count(request):
     """Get unread notifications count (AJAX)"""
-    from .utils import get_unread_notifications_count
+    from .utils import aget_unread_notifications_count
     
-    count = get_unread_notifications_count(request.user)
+    count = await aget_unread_notifications_count(await request.auser())
     
     return JsonResponse({'count': count})
 
 
+def _sse(event, data):
+    import json
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _event_stream(user):
+    """Badge counts now and whenever they change, plus new direct messages"""
+    from asgiref.sync import sync_to_async
+    from . import events
+    from .utils import get_unread_counts
+    
+    unread_counts = sync_to_async(get_unread_counts)
+    
+    # Reconnect after 5s if the connection drops
+    yield "retry: 5000\n\n"
+    yield _sse('counts', await unread_counts(user))
+    async for message in events.listen(user.pk):
+        if message is None:
+            yield ": keep-alive\n\n"
+            continue
+        event, data = message
+        if event == 'counts':
+            data = await unread_counts(user)
+        yield _sse(event, data)
+
+
+@login_required
+async def event_stream(request):
+    """
+    Server-sent events for the open tabs of a user. Served by the ASGI app, each
+    idle stream is a parked coroutine rather than a worker thread.
+    """
+    from django.core.handlers.asgi import ASGIRequest
+    from django.http import HttpResponse, StreamingHttpResponse
+    
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI the endless stream would hold a worker thread for as long
+        # as the tab is open. 204 tells EventSource not to reconnect, and the
+        # page falls back to polling.
+        return HttpResponse(status=204)
+    
+    user = await request.auser()
+    response = StreamingHttpResponse(_event_stream(user), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 # ====================
 # BLOCK AND MUTE VIEWS
 # ====================
 
 @login_required
-def block_user(request, username):
+async def block_user(request, username):
     """Block a user"""
     if request.method == 'POST':
-        user_to_block = get_object_or_404(User, username=username)
+        user = await request.auser()
+        user_to_block = await aget_object_or_404(User, username=username)
         
-        if request.user == user_to_block:
+        if user == user_to_block:
             return JsonResponse({'error': 'You cannot block yourself'}, status=400)
         
-        from .models import Block, Follow
+        from .models import Block
         
         # Create block relationship
-        Block.objects.get_or_create(blocker=request.user, blocked=user_to_block)
+        await Block.objects.aget_or_create(blocker=user, blocked=user_to_block)
         
         # Remove any follow relationships
-        Follow.objects.filter(
-            Q(follower=request.user, following=user_to_block) |
-            Q(follower=user_to_block, following=request.user)
-        ).delete()
+        await FollowGraph.aunfollow(user, user_to_block)
+        await FollowGraph.aunfollow(user_to_block, user)
         
         return JsonResponse({'success': True, 'message': f'You blocked {username}'})
     
@@ -907,17 +1133,18 @@ def unblock_user(request, username):
 
 
 @login_required
-def mute_user(request, username):
+async def mute_user(request, username):
     """Mute a user"""
     if request.method == 'POST':
-        user_to_mute = get_object_or_404(User, username=username)
+        user = await request.auser()
+        user_to_mute = await aget_object_or_404(User, username=username)
         
-        if request.user == user_to_mute:
+        if user == user_to_mute:
             return JsonResponse({'error': 'You cannot mute yourself'}, status=400)
         
         from .models import Mute
         
-        Mute.objects.get_or_create(muter=request.user, muted=user_to_mute)
+        await Mute.objects.aget_or_create(muter=user, muted=user_to_mute)
         
         return JsonResponse({'success': True, 'message': f'You muted {username}'})
     
@@ -967,17 +1194,37 @@ def muted_users_list(request):
 # ENHANCED FEED VIEW
 # ====================
 
+FEED_PAGE_SIZE = 50
+
+
+def _feed_page(request):
+    from .pagination import KeysetPage, decode_cursor
+    from .utils import get_user_feed
+    
+    tweets = get_user_feed(
+        request.user,
+        limit=FEED_PAGE_SIZE + 1,
+        before=decode_cursor(request.GET.get('before'))
+    )
+    return KeysetPage.from_rows(tweets, FEED_PAGE_SIZE)
+
+
 @login_required
 def personalized_feed(request):
     """Enhanced personalized feed with better filtering"""
-    from .utils import get_user_feed
-    
-    tweets = get_user_feed(request.user, limit=50)
+    page = _feed_page(request)
     
     return render(request, 'personalized_feed.html', {
-        'tweets': tweets
+        'tweets': page.items,
+        'page': page
     })
 
+
+@login_required
+def personalized_feed_api(request):
+    """Next page of the personalized feed for infinite scroll (AJAX)"""
+    return _page_json(_feed_page(request), _serialize_tweet)
+
 def debug_features(request):
     """Debug view to test notifications and messages"""
     if not request.user.is_authenticated:
@@ -1079,3 +1326,57 @@ def debug_features(request):
     """
     
     return HttpResponse(html)
+
+
+@staff_member_required
+def cache_stats(request):
+    """Cache hit/miss counters for this worker process (staff only)"""
+    from .cache import get_cache_stats
+    
+    return JsonResponse({'namespaces': get_cache_stats()})
+
+
+def image_variant(request, kind, width, name):
+    """
+    Write the missing WebP derivatives of an uploaded image and redirect to
+    the requested width. Pages link here while the worker has yet to write
+    them; when the upload can't be resized, redirect to the original.
+    """
+    from django.core.files.storage import default_storage
+    from django.http import Http404
+    from PIL import Image
+    from .images import VARIANTS, is_variant_source, render_variants, variant_name
+    from .media import MAX_AGE
+    
+    if not is_variant_source(kind, name) or width not in VARIANTS[kind]['widths']:
+        raise Http404("No such image variant")
+    try:
+        # All widths, so the page's next render links to the files directly
+        render_variants(kind, name)
+    except (OSError, Image.DecompressionBombError):
+        if not default_storage.exists(name):
+            raise Http404("Image not found")
+        return redirect(default_storage.url(name))
+    # The target is fixed by the URL, so browsers needn't ask again
+    response = redirect(default_storage.url(variant_name(name, width)), permanent=True)
+    response['Cache-Control'] = f'public, max-age={MAX_AGE}, immutable'
+    return response
+
+
+def serve_media(request, path):
+    """Uploaded files; conversation attachments only for its participants"""
+    from django.http import Http404
+    from .media import media_access, serve_upload
+    
+    access = media_access(request.user, path)
+    if access is None:
+        raise Http404("Media not found")
+    return serve_upload(request, path, access)
+
+
+@staff_member_required
+def perf_stats(request):
+    """Per-view query counts and timings for this worker process (staff only)"""
+    from .perf import get_perf_stats
+    
+    return JsonResponse({'views': get_perf_stats()})
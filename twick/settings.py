@@ -42,11 +42,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "tweet.middleware.PerfMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "tweet.middleware.RelationshipContextMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -73,13 +75,52 @@ WSGI_APPLICATION = "twick.wsgi.application"
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# PostgreSQL when POSTGRES_DB is set, so the web and worker containers share one
+# database (see docker-compose.prod.yml); otherwise a local SQLite file
+
+if os.environ.get("POSTGRES_DB"):
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ["POSTGRES_DB"],
+            "USER": os.environ.get("POSTGRES_USER", ""),
+            "PASSWORD": os.environ.get("POSTGRES_PASSWORD", ""),
+            "HOST": os.environ.get("POSTGRES_HOST", "localhost"),
+            "PORT": os.environ.get("POSTGRES_PORT", "5432"),
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+        }
+    }
+
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# Cache
+# Redis when REDIS_URL is set (see docker-compose.prod.yml), otherwise an
+# in-process cache for development and tests
+
+REDIS_URL = os.environ.get("REDIS_URL")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_PREFIX": "twick",
+        }
     }
-}
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "twick",
+        }
+    }
+
+CACHE_KEY_VERSION = 1  # Bump to ignore everything cached by older code
 
 
 # Password validation
@@ -125,6 +166,18 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Internal nginx location aliasing MEDIA_ROOT (nginx/nginx.conf). When set,
+# media requests that pass their permission check are handed to nginx with
+# X-Accel-Redirect instead of being streamed by Django.
+MEDIA_ACCEL_REDIRECT = os.environ.get("MEDIA_ACCEL_REDIRECT")
+
+# Uploads are stored once per distinct content and hard-linked under their
+# names; see tweet/storage.py and `manage.py dedupe_media`
+STORAGES = {
+    "default": {"BACKEND": "tweet.storage.ContentAddressedStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
@@ -138,3 +191,26 @@ LOGOUT_REDIRECT_URL = '/'
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
 
+# Home timeline fan-out
+TIMELINE_FANOUT_MAX_FOLLOWERS = 10000  # Larger accounts are merged into feeds at read time
+TIMELINE_BACKFILL_SIZE = 50  # Tweets copied into a timeline when following someone
+
+# Trending hashtags (refreshed by `manage.py run_workers`, or by running
+# `manage.py update_trending` from cron where no worker runs)
+TRENDING_HALF_LIFE_HOURS = 12
+TRENDING_TOP_K = 100
+TRENDING_REFRESH_SECONDS = 300
+
+# Full-text search: dotted path to a tweet.search backend, or None to pick
+# from the database (SQLite FTS5 in dev, PostgreSQL tsvector/GIN in prod)
+SEARCH_BACKEND = None
+
+# Notifications are queued and delivered by `manage.py run_workers`, or, when
+# off, as soon as the request's transaction commits. Off by default under
+# DEBUG so a bare runserver needs no worker; the compose files turn it on.
+NOTIFICATIONS_ASYNC = os.environ.get("NOTIFICATIONS_ASYNC", "0" if DEBUG else "1") == "1"
+
+# Per-request query counts and timings (tweet.middleware.PerfMiddleware,
+# /debug/perf/). Adds a Server-Timing header to every response, so leave it
+# off where the site is public.
+PERF_INSTRUMENTATION = DEBUG
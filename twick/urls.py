@@ -17,10 +17,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
+from tweet.views import serve_media
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("", include("tweet.urls")),
     path("accounts/", include("django.contrib.auth.urls")),
-] + static (settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    # Permission-checked, in production too; see MEDIA_ACCEL_REDIRECT
+    path(f"{settings.MEDIA_URL.lstrip('/')}<path:path>", serve_media, name="serve_media"),
+]